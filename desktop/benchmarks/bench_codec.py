@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark da decodificação de mensagens do Firestore
+
+Compara o caminho original (verificação de timestamp com hasattr +
+message_from_dict) com o codec decode_message em documentos sintéticos.
+
+Uso:
+    python benchmarks/bench_codec.py [quantidade]
+"""
+
+import os
+import sys
+import time
+import random
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from src.types import message_from_dict, decode_message
+
+def make_documents(count, seed=42):
+    """Gerar documentos sintéticos com a mesma forma dos gravados pelo app"""
+    rng = random.Random(seed)
+    base_ms = 1_700_000_000_000
+    documents = []
+    for i in range(count):
+        created_ms = base_ms + i * 1000
+        kind = rng.choice(['audio', 'note', 'transcript', 'improvement'])
+        payload = {'audio': None, 'transcript': None, 'improvement': None, 'note': None}
+        if kind == 'audio':
+            payload['audio'] = {'base64': 'UklGRg==', 'contentType': 'audio/wav', 'durationSec': rng.randint(1, 600), 'sizeBytes': rng.randint(1000, 10_000_000)}
+            payload['transcript'] = {
+                'text': 'texto transcrito ' * 8,
+                'words': [{'start': w * 0.5, 'end': w * 0.5 + 0.4, 'word': 'palavra'} for w in range(20)],
+                'languageCode': 'pt',
+                'confidence': 0.9
+            }
+        elif kind == 'transcript':
+            payload['transcript'] = {'text': 'texto transcrito ' * 8, 'words': None, 'languageCode': 'pt', 'confidence': 0.9}
+        elif kind == 'improvement':
+            payload['improvement'] = {'texto_melhorado': 'texto', 'topicos': ['a', 'b'], 'insights': ['c'], 'resumo': 'resumo'}
+        else:
+            payload['note'] = {'text': 'nota ' * 20}
+
+        # Metade dos documentos com createdAt como timestamp do servidor
+        created_at = created_ms if i % 2 else datetime.fromtimestamp(created_ms / 1000, tz=timezone.utc)
+        documents.append(({
+            'threadId': f'thread-{i % 50}',
+            'ownerId': 'device',
+            'kind': kind,
+            'source': rng.choice(['mobile', 'desktop']),
+            'createdAt': created_at,
+            'payload': payload,
+            'status': rng.choice(['transcribed', 'pending', None]),
+            'error': None
+        }, f'msg-{i}'))
+    return documents
+
+def legacy_decode(data, doc_id):
+    """Caminho original de get_messages / subscribe_to_messages"""
+    data = dict(data)
+    data['id'] = doc_id
+    if 'createdAt' in data and hasattr(data['createdAt'], 'timestamp'):
+        data['createdAt'] = int(data['createdAt'].timestamp() * 1000)
+    return message_from_dict(data)
+
+def fast_decode(data, doc_id):
+    # doc.to_dict() já devolve uma cópia; a cópia aqui equipara o custo ao legado
+    return decode_message(dict(data), doc_id)
+
+def measure(decoder, documents, repeat=3):
+    """Melhor tempo entre as repetições"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for data, doc_id in documents:
+            decoder(data, doc_id)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    documents = make_documents(count)
+
+    # Os dois caminhos devem produzir exatamente o mesmo resultado
+    for data, doc_id in documents[:1000]:
+        assert legacy_decode(data, doc_id) == fast_decode(data, doc_id)
+
+    legacy = measure(legacy_decode, documents)
+    fast = measure(fast_decode, documents)
+
+    print(f"Documentos:          {count}")
+    print(f"message_from_dict:   {legacy:.3f}s ({count / legacy:,.0f} docs/s)")
+    print(f"decode_message:      {fast:.3f}s ({count / fast:,.0f} docs/s)")
+    print(f"Ganho:               {legacy / fast:.2f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark do FirestoreManager sobre o backend em memória
+
+Popula o backend com threads e mensagens sintéticas e mede as leituras
+da lista de threads e de mensagens e o pipeline de escrita de uma gravação
+(criação, áudio + status, transcrição + status), com latência simulada.
+
+Uso:
+    python benchmarks/bench_firestore.py [threads] [mensagens por thread] [latência ms] [banda MB/s]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from src.memory_firestore import install_memory_firestore, generate_load
+from src.firestore import FirestoreManager
+from src.types import Message, MessageKind, MessageSource, MessagePayload, MessageStatus
+
+def measure(label, func, repeat=3):
+    """Melhor tempo entre as repetições"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    print(f"{label:<38} {best * 1000:9.1f} ms")
+    return result
+
+def recording_pipeline(firestore_manager, thread_id):
+    """Mesmas escritas do StateManager para uma gravação transcrita"""
+    message = Message(
+        id="",
+        threadId=thread_id,
+        ownerId='bench',
+        kind=MessageKind.AUDIO,
+        source=MessageSource.DESKTOP,
+        createdAt=int(time.time() * 1000),
+        payload=MessagePayload(),
+        status=MessageStatus.RECORDING
+    )
+    message_id = firestore_manager.save_message(message)
+
+    with firestore_manager.batch() as batch:
+        batch.update_status(message_id, MessageStatus.TRANSCRIBING, thread_id=thread_id)
+        batch.update_payload(message_id, {
+            'audio': {'base64': 'UklGRg==', 'contentType': 'audio/wav', 'durationSec': 5, 'sizeBytes': 6}
+        }, thread_id=thread_id)
+
+    with firestore_manager.batch() as batch:
+        batch.update_payload(message_id, {
+            'transcript': {'text': 'texto transcrito', 'words': None, 'languageCode': 'pt', 'confidence': 0.9}
+        }, thread_id=thread_id)
+        batch.update_status(message_id, MessageStatus.TRANSCRIBED, thread_id=thread_id)
+
+def main():
+    thread_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    messages_per_thread = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    latency_ms = float(sys.argv[3]) if len(sys.argv) > 3 else 20.0
+    bandwidth_mb = float(sys.argv[4]) if len(sys.argv) > 4 else 10.0
+
+    client = install_memory_firestore(latency=latency_ms / 1000, bytes_per_second=bandwidth_mb * 1_000_000)
+    thread_ids = generate_load(client, thread_count, messages_per_thread)
+    firestore_manager = FirestoreManager()
+    busiest = thread_ids[0]
+
+    print(f"Threads:             {thread_count}")
+    print(f"Mensagens:           {thread_count * messages_per_thread}")
+    print(f"Latência / banda:    {latency_ms:.0f} ms / {bandwidth_mb:.0f} MB/s")
+    print()
+
+    threads = measure("get_threads (completo)", firestore_manager.get_threads)
+    measure("get_threads (incremental)", lambda: firestore_manager.get_threads(incremental=True))
+    measure("get_threads_counts (force)", lambda: firestore_manager.get_threads_counts(threads, force=True))
+    measure("get_messages (completo)", lambda: firestore_manager.get_messages(busiest))
+    measure("get_messages (resumo)", lambda: firestore_manager.get_messages(busiest, summary=True))
+    measure("get_messages_page (resumo)", lambda: firestore_manager.get_messages_page(busiest, summary=True))
+    measure("pipeline de gravação", lambda: recording_pipeline(firestore_manager, busiest))
+
+if __name__ == '__main__':
+    main()
@@ -7,10 +7,11 @@ Baseada no teste que funcionou
 import sys
 import os
 import logging
+import threading
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QLabel, QVBoxLayout, QWidget, 
                             QListWidget, QListWidgetItem, QHBoxLayout, QPushButton, 
                             QStackedWidget, QTextEdit, QMessageBox, QInputDialog)
-from PyQt6.QtCore import Qt, QTimer
+from PyQt6.QtCore import Qt, QTimer, pyqtSignal
 from PyQt6.QtGui import QIcon, QClipboard
 
 # Configurar variável de ambiente
@@ -20,10 +21,19 @@ os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = '/home/jesus/Progetos/Totari/desk
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-from src.firestore import FirestoreManager
+from src.firestore import FirestoreManager, DEFAULT_PAGE_SIZE
+from src.local_store import LocalStore, LocalStoreSync
+from src.prefetch import MessagePrefetcher
+from src.write_queue import WriteQueue
 from src.tray import TrayIcon
 
 class TotariSimpleApp(QMainWindow):
+    # Sinais emitidos pela sincronização em segundo plano
+    threads_synced = pyqtSignal()
+    threads_changed = pyqtSignal(object)
+    messages_synced = pyqtSignal(str, object)
+    older_messages_loaded = pyqtSignal(str, object, object)
+    
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Totari - Conversas Globais")
@@ -62,6 +72,32 @@ class TotariSimpleApp(QMainWindow):
         # Inicializar manager
         self.firestore_manager = FirestoreManager()
         
+        # Fila de escrita durável: retoma as escritas pendentes de execuções anteriores
+        self.write_queue = WriteQueue(self.firestore_manager)
+        self.write_queue.start()
+        
+        # Espelho local para leituras instantâneas e uso offline
+        self.local_store = LocalStore()
+        self.local_sync = LocalStoreSync(self.local_store, self.firestore_manager)
+        self.threads_synced.connect(self.on_threads_synced)
+        
+        # Lista de threads em tempo real: o listener entrega apenas as threads alteradas
+        self.threads_changed.connect(self.on_threads_changed)
+        self.unsubscribe_threads = None
+        
+        # Pré-carregamento das threads mais recentes
+        self.prefetcher = MessagePrefetcher(self.firestore_manager)
+        self.threads_by_id = {}
+        self.messages_synced.connect(self.on_messages_synced)
+        self.older_messages_loaded.connect(self.on_older_messages_loaded)
+        
+        # Estado de paginação das mensagens da thread atual
+        self.current_thread_id = None
+        self.loaded_messages = []
+        self.older_cursor = None
+        self.has_older_messages = False
+        self.older_request = None
+        
         # Configurar aplicação para não fechar quando fechar janela
         self.app = QApplication.instance()
         self.app.setQuitOnLastWindowClosed(False)
@@ -97,10 +133,6 @@ class TotariSimpleApp(QMainWindow):
         title_label.setStyleSheet("font-size: 18px; font-weight: bold;")
         header_layout.addWidget(title_label)
         
-        refresh_button = QPushButton("Atualizar")
-        refresh_button.clicked.connect(self.load_threads)
-        header_layout.addWidget(refresh_button)
-        
         layout.addLayout(header_layout)
         
         # Lista de threads
@@ -187,6 +219,12 @@ class TotariSimpleApp(QMainWindow):
         
         layout.addLayout(header_layout)
         
+        # Botão para carregar mensagens anteriores (paginação)
+        self.load_older_button = QPushButton("Carregar mensagens anteriores")
+        self.load_older_button.clicked.connect(self.load_older_messages)
+        self.load_older_button.hide()
+        layout.addWidget(self.load_older_button)
+        
         # Lista de mensagens
         self.messages_list = QListWidget()
         self.messages_list.itemClicked.connect(self.on_message_selected)
@@ -247,10 +285,36 @@ class TotariSimpleApp(QMainWindow):
         self.central_widget.addWidget(self.messages_widget)
         
     def load_threads(self):
-        """Carregar threads do Firestore"""
+        """Exibir threads do espelho local e escutar as alterações no Firestore"""
+        logger.info("Carregando threads...")
+        self.render_threads()
+        if self.unsubscribe_threads is None:
+            self.unsubscribe_threads = self.firestore_manager.subscribe_to_threads(
+                lambda changes: self.threads_changed.emit(changes),
+                cache=self.firestore_manager.threads_cache
+            )
+            
+    def on_threads_changed(self, changes):
+        """Aplicar ao espelho as threads alteradas e recontar apenas as que mudaram"""
+        self.local_sync.apply_thread_changes(changes)
+        self.render_threads()
+        # Contagens em cache são reaproveitadas para threads com o mesmo updatedAt
+        self.local_sync.sync_in_background(
+            self.local_sync.sync_counts,
+            on_done=lambda result: self.threads_synced.emit()
+        )
+        
+    def on_threads_synced(self):
+        """Renderizar threads sincronizadas e pré-carregar as mais recentes"""
+        self.render_threads()
+        self.prefetcher.prefetch(list(self.threads_by_id.values()))
+        
+    def render_threads(self):
+        """Renderizar threads do espelho local"""
         try:
-            logger.info("Carregando threads...")
-            threads = self.firestore_manager.get_threads()
+            threads = self.local_store.get_threads()
+            counts = self.local_store.get_thread_counts()
+            self.threads_by_id = {thread.id: thread for thread in threads}
             logger.info(f"Threads encontradas: {len(threads)}")
             
             self.threads_list.clear()
@@ -265,8 +329,27 @@ class TotariSimpleApp(QMainWindow):
                     timestamp = thread.updatedAt / 1000  # Converter de ms para s
                     date_str = datetime.fromtimestamp(timestamp).strftime("%d/%m/%Y %H:%M")
                     
+                    # Badges com contagem de mensagens e transcrições pendentes
+                    badge = ""
+                    thread_counts = counts.get(thread.id)
+                    if thread_counts:
+                        badge = f" · {thread_counts.total} mensagens"
+                        if thread_counts.pending:
+                            badge += f" · ⏳ {thread_counts.pending} pendentes"
+                    elif thread.summary:
+                        badge = f" · {thread.summary.messageCount} mensagens"
+                    
+                    # Prévia da última mensagem e duração total de áudio (resumo da thread)
+                    preview = ""
+                    if thread.summary:
+                        if thread.summary.audioSeconds:
+                            minutes, seconds = divmod(int(thread.summary.audioSeconds), 60)
+                            badge += f" · 🎙 {minutes}:{seconds:02d}"
+                        if thread.summary.lastPreview:
+                            preview = f"\n{thread.summary.lastPreview[:80]}"
+                    
                     # Usar texto simples com formatação visual
-                    item.setText(f"📝 {thread.title}\n{date_str}")
+                    item.setText(f"📝 {thread.title}\n{date_str}{badge}{preview}")
                     item.setData(Qt.ItemDataRole.UserRole, thread.id)
                     self.threads_list.addItem(item)
                     
@@ -295,79 +378,169 @@ class TotariSimpleApp(QMainWindow):
         self.central_widget.setCurrentWidget(self.threads_widget)
         
     def load_messages(self):
-        """Carregar mensagens da thread atual"""
+        """Exibir mensagens do espelho local e sincronizar a página mais recente"""
         if not hasattr(self, 'current_thread_id') or not self.current_thread_id:
             return
             
         try:
             logger.info(f"Carregando mensagens da thread {self.current_thread_id}...")
-            messages = self.firestore_manager.get_messages(self.current_thread_id)
-            logger.info(f"Mensagens encontradas: {len(messages)}")
+            messages = self.local_store.get_messages(self.current_thread_id, limit=DEFAULT_PAGE_SIZE)
+            logger.info(f"Mensagens em cache: {len(messages)}")
+            
+            self.loaded_messages = messages
+            # O espelho local não guarda o tipo original de createdAt; o cursor vem da página sincronizada
+            self.older_cursor = None
+            self.older_request = None
+            self.has_older_messages = len(messages) >= DEFAULT_PAGE_SIZE
+            self.render_messages()
             
-            self.messages_list.clear()
+            thread_id = self.current_thread_id
             
-            if messages and len(messages) > 0:
-                self.no_messages_label.hide()
+            # Usar a página pré-carregada, se ainda estiver atualizada
+            thread = self.threads_by_id.get(thread_id)
+            prefetched = self.prefetcher.take(thread_id, thread.updatedAt if thread else None)
+            if prefetched is not None:
+                self.on_messages_synced(thread_id, prefetched)
+                return
                 
-                # Ordenar mensagens por data de criação
-                sorted_messages = sorted(messages, key=lambda x: x.createdAt)
-                
-                for message in sorted_messages:
-                    item = QListWidgetItem()
-                    
-                    # Debug: mostrar informações da mensagem
-                    logger.info(f"Processando mensagem: kind={message.kind.value}, payload={message.payload}")
-                    
-                    # Formatar data
-                    from datetime import datetime
-                    timestamp = message.createdAt / 1000
-                    date_str = datetime.fromtimestamp(timestamp).strftime("%H:%M")
-                    
-                    # Formatar conteúdo da mensagem como chat
-                    if message.kind.value == 'transcript':
-                        text = getattr(message.payload.transcript, 'text', '') if message.payload.transcript else ''
-                        content = f"💬 Transcrição\n{text}\n\n{date_str}"
-                        logger.info(f"Transcrição: {text}")
-                    elif message.kind.value == 'improvement':
-                        text = getattr(message.payload.improvement, 'texto_melhorado', '') if message.payload.improvement else ''
-                        content = f"✨ Melhoria\n{text}\n\n{date_str}"
-                        logger.info(f"Melhoria: {text}")
-                    elif message.kind.value == 'audio':
-                        # Para áudios, tentar mostrar a transcrição se existir
-                        transcript_text = getattr(message.payload.transcript, 'text', '') if message.payload.transcript else ''
-                        duration = getattr(message.payload.audio, 'durationSec', 0) if message.payload.audio else 0
-                        logger.info(f"Áudio - transcrição: {transcript_text}, duração: {duration}")
-                        if transcript_text:
-                            content = f"🎵 Áudio\n{transcript_text}\n\n{date_str}"
-                        else:
-                            content = f"🎵 Áudio ({duration:.1f}s)\n\n{date_str}"
-                    elif message.kind.value == 'note':
-                        # Para notas, mostrar o texto da nota
-                        note_text = getattr(message.payload.note, 'text', '') if message.payload.note else ''
-                        logger.info(f"Nota: {note_text[:100]}...")
-                        if note_text:
-                            # Limitar o texto para não ficar muito longo na lista
-                            preview = note_text[:200] + "..." if len(note_text) > 200 else note_text
-                            content = f"📝 Nota\n{preview}\n\n{date_str}"
-                        else:
-                            content = f"📝 Nota vazia\n\n{date_str}"
-                    else:
-                        content = f"📄 {message.kind.value.title()}\n\n{date_str}"
-                        logger.info(f"Tipo desconhecido: {message.kind.value}")
-                    
-                    logger.info(f"Conteúdo final: {content}")
-                    item.setText(content)
-                    self.messages_list.addItem(item)
-                    
-                logger.info(f"Exibindo {len(messages)} mensagens na interface")
-            else:
-                self.no_messages_label.show()
-                logger.info("Nenhuma mensagem encontrada")
+            self.local_sync.sync_in_background(
+                self.load_messages_summary_page, thread_id,
+                on_done=lambda page: self.messages_synced.emit(thread_id, page)
+            )
                 
         except Exception as e:
             logger.error(f"Erro ao carregar mensagens: {e}")
             self.no_messages_label.show()
             
+    def load_messages_summary_page(self, thread_id):
+        """Buscar a página mais recente sem os bytes de áudio (a lista só exibe prévias)"""
+        return self.firestore_manager.get_messages_page(thread_id, summary=True)
+        
+    def on_messages_synced(self, thread_id, page):
+        """Mesclar a página sincronizada do Firestore com as mensagens exibidas"""
+        if page.messages:
+            self.local_store.upsert_messages(page.messages, summary=True)
+            
+        if thread_id != self.current_thread_id:
+            return
+            
+        merged = {message.id: message for message in self.loaded_messages}
+        merged.update((message.id, message) for message in page.messages)
+        self.loaded_messages = sorted(merged.values(), key=lambda x: x.createdAt)
+        
+        if self.older_cursor is None or (page.older_cursor and page.older_cursor.createdAt < self.older_cursor.createdAt):
+            self.older_cursor = page.older_cursor
+            self.has_older_messages = page.has_more
+        logger.info(f"Mensagens sincronizadas: {len(page.messages)}")
+        self.render_messages(keep_scroll_from_bottom=True)
+            
+    def load_older_messages(self):
+        """Carregar a página anterior de mensagens da thread atual"""
+        if not getattr(self, 'current_thread_id', None) or not getattr(self, 'older_cursor', None):
+            return
+        # Ignorar cliques enquanto a mesma página ainda está sendo buscada
+        if self.older_request is self.older_cursor:
+            return
+            
+        thread_id, cursor = self.current_thread_id, self.older_cursor
+        self.older_request = cursor
+        self.load_older_button.setEnabled(False)
+        self.local_sync.sync_in_background(
+            self.fetch_older_page, thread_id, cursor,
+            on_done=lambda page: self.older_messages_loaded.emit(thread_id, cursor, page)
+        )
+        
+    def fetch_older_page(self, thread_id, cursor):
+        """Buscar a página anterior fora da thread da interface (None em caso de erro)"""
+        try:
+            return self.firestore_manager.get_messages_page(
+                thread_id,
+                cursor=cursor,
+                direction='older',
+                summary=True
+            )
+        except Exception as e:
+            logger.error(f"Erro ao carregar mensagens anteriores: {e}")
+            return None
+            
+    def on_older_messages_loaded(self, thread_id, cursor, page):
+        """Inserir no topo a página anterior buscada em segundo plano"""
+        if cursor is self.older_request:
+            self.older_request = None
+            self.load_older_button.setEnabled(True)
+        # Descartar respostas de outra thread ou de um cursor já substituído
+        if page is None or thread_id != self.current_thread_id or cursor is not self.older_cursor:
+            return
+            
+        logger.info(f"Mensagens anteriores encontradas: {len(page.messages)}")
+        if page.messages:
+            self.local_store.upsert_messages(page.messages, summary=True)
+            self.loaded_messages = page.messages + self.loaded_messages
+            self.older_cursor = page.older_cursor
+        self.has_older_messages = page.has_more
+        
+        # Preservar posição de leitura ao inserir itens no topo
+        self.render_messages(keep_scroll_from_bottom=True)
+        
+    def render_messages(self, keep_scroll_from_bottom=False):
+        """Renderizar as mensagens já carregadas na lista"""
+        scrollbar = self.messages_list.verticalScrollBar()
+        distance_from_bottom = scrollbar.maximum() - scrollbar.value()
+        
+        self.messages_list.clear()
+        # Sem cursor (antes da primeira sincronização) o botão não teria o que buscar
+        self.load_older_button.setVisible(self.has_older_messages and self.older_cursor is not None)
+        self.load_older_button.setEnabled(self.older_request is None)
+        
+        if self.loaded_messages:
+            self.no_messages_label.hide()
+            
+            for message in self.loaded_messages:
+                item = QListWidgetItem()
+                item.setText(self.format_message_content(message))
+                self.messages_list.addItem(item)
+                
+            logger.info(f"Exibindo {len(self.loaded_messages)} mensagens na interface")
+        else:
+            self.no_messages_label.show()
+            logger.info("Nenhuma mensagem encontrada")
+            
+        if keep_scroll_from_bottom:
+            scrollbar.setValue(scrollbar.maximum() - distance_from_bottom)
+        else:
+            self.messages_list.scrollToBottom()
+            
+    def format_message_content(self, message):
+        """Formatar conteúdo da mensagem como chat"""
+        from datetime import datetime
+        timestamp = message.createdAt / 1000
+        date_str = datetime.fromtimestamp(timestamp).strftime("%H:%M")
+        
+        if message.kind.value == 'transcript':
+            text = getattr(message.payload.transcript, 'text', '') if message.payload.transcript else ''
+            return f"💬 Transcrição\n{text}\n\n{date_str}"
+        elif message.kind.value == 'improvement':
+            text = getattr(message.payload.improvement, 'texto_melhorado', '') if message.payload.improvement else ''
+            return f"✨ Melhoria\n{text}\n\n{date_str}"
+        elif message.kind.value == 'audio':
+            # Para áudios, tentar mostrar a transcrição se existir
+            transcript_text = getattr(message.payload.transcript, 'text', '') if message.payload.transcript else ''
+            duration = getattr(message.payload.audio, 'durationSec', 0) if message.payload.audio else 0
+            if transcript_text:
+                return f"🎵 Áudio\n{transcript_text}\n\n{date_str}"
+            return f"🎵 Áudio ({duration:.1f}s)\n\n{date_str}"
+        elif message.kind.value == 'note':
+            # Para notas, mostrar o texto da nota
+            note_text = getattr(message.payload.note, 'text', '') if message.payload.note else ''
+            if note_text:
+                # Limitar o texto para não ficar muito longo na lista
+                preview = note_text[:200] + "..." if len(note_text) > 200 else note_text
+                return f"📝 Nota\n{preview}\n\n{date_str}"
+            return f"📝 Nota vazia\n\n{date_str}"
+        
+        logger.info(f"Tipo desconhecido: {message.kind.value}")
+        return f"📄 {message.kind.value.title()}\n\n{date_str}"
+            
     def on_message_selected(self, item):
         """Handler para seleção de mensagem"""
         text = item.text()
@@ -445,6 +618,11 @@ class TotariSimpleApp(QMainWindow):
     def quit_app(self):
         """Sair da aplicação"""
         logger.info("Saindo do Totari Desktop")
+        if self.unsubscribe_threads:
+            self.unsubscribe_threads()
+        self.prefetcher.shutdown()
+        # Operações não enviadas continuam no journal para a próxima execução
+        self.write_queue.stop()
         self.app.quit()
 
 def main():
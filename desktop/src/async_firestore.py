@@ -0,0 +1,566 @@
+"""
+Módulo para integração assíncrona com Firestore
+Mesma interface do FirestoreManager, construída sobre firestore.AsyncClient
+"""
+
+import asyncio
+import random
+import logging
+from typing import List, Dict, Any, Optional, Callable
+
+from google.cloud import firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+from .types import Message, Thread, MessageStatus, MessageCursor, MessagePage, ThreadCounts, message_to_dict, thread_to_dict
+from .firestore import (DEFAULT_PAGE_SIZE, MAX_BATCH_WRITES, DELETE_WORKERS, COUNT_WORKERS, PENDING_STATUSES, ThreadCountsCache, thread_message_refs_query, MESSAGE_SUMMARY_FIELDS, ThreadListCache,
+                        message_from_snapshot, messages_page_queries, merge_page_results,
+                        messages_page_from_docs, threads_changed_since_queries, payload_field_paths, _deep_merge,
+                        new_document_id, MessageWriteBuffer, ThreadSummaryDelta, stage_message_writes,
+                        message_write_reads, MESSAGE_WRITE_READ_FIELDS, existing_documents, ACTIVITY_SHARDS, activity_shard, activity_shard_ref,
+                        thread_activity_refs, threads_from_snapshots, activity_changed_since_query, ThreadTouchLimiter)
+from .clients import get_async_firestore_client
+
+logger = logging.getLogger(__name__)
+
+class AsyncMessageWriteBatch(MessageWriteBuffer):
+    """Versão assíncrona do MessageWriteBatch"""
+    
+    async def commit(self) -> None:
+        """Enviar as operações pendentes, propagando as exceções do Firestore; os commits seguem a ordem do lote"""
+        # Em ordem, como no MessageWriteBatch: uma falha não deixa aplicados só os commits seguintes
+        for chunk in self._take_chunks():
+            await self._commit_chunk(*chunk)
+    
+    async def _commit_chunk(self, message_ids: List[str], creates: Dict[str, Any], updates: Dict[str, Any],
+                            summary: Dict[str, Any]) -> None:
+        read_refs = message_write_reads(self.db, message_ids, creates, summary)
+        if not read_refs:
+            batch = self.db.batch()
+            stage_message_writes(self.db, batch, message_ids, creates, updates, summary, {})
+            await batch.commit()
+            self._committed(message_ids, creates, summary)
+            return
+        
+        touch = self._take_touches(message_ids, creates, summary)
+        
+        @firestore.async_transactional
+        async def write(transaction):
+            snapshots = [snapshot async for snapshot in self.db.get_all(
+                read_refs, field_paths=MESSAGE_WRITE_READ_FIELDS, transaction=transaction)]
+            stage_message_writes(self.db, transaction, message_ids, creates, updates, summary,
+                                 existing_documents(snapshots), touch)
+        
+        try:
+            await write(self.db.transaction())
+        except Exception:
+            self._release_touches(touch)
+            raise
+        self._committed(message_ids, creates, summary)
+    
+    async def flush(self) -> None:
+        """Enviar as operações pendentes em commits de até MAX_BATCH_MESSAGES mensagens"""
+        count = len(self)
+        if not count:
+            return
+        
+        try:
+            await self.commit()
+            logger.info(f"Lote de escrita enviado: {count} mensagens")
+        
+        except Exception as e:
+            logger.error(f"Erro ao enviar lote de escrita: {e}")
+            raise Exception("Falha ao enviar lote de atualizações de mensagens")
+    
+    async def __aenter__(self) -> 'AsyncMessageWriteBatch':
+        return self
+    
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        # Só enviar se o bloco terminou sem erro
+        if exc_type is None:
+            await self.flush()
+
+class AsyncFirestoreManager:
+    """
+    Gerenciador assíncrono de integração com Firestore
+    
+    Os métodos têm os mesmos parâmetros e resultados do FirestoreManager,
+    mas são corrotinas, permitindo disparar várias leituras e escritas ao
+    mesmo tempo. Listeners em tempo real continuam no FirestoreManager, pois
+    o AsyncClient não oferece on_snapshot.
+    """
+    
+    def __init__(self, auth_manager=None):
+        # Cliente compartilhado, criado no primeiro uso
+        self.db = get_async_firestore_client()
+        
+        # Cache da lista de threads para sincronização incremental
+        self.threads_cache = ThreadListCache()
+        
+        # Contagens por thread, invalidadas pelas escritas de mensagens
+        self._counts = ThreadCountsCache()
+        
+        # Atualizações de updatedAt no documento das threads (o mobile ordena por ele)
+        self._thread_touches = ThreadTouchLimiter()
+    
+    def batch(self) -> AsyncMessageWriteBatch:
+        """
+        Criar lote de atualizações de mensagens
+        
+        Uso:
+            async with firestore_manager.batch() as batch:
+                batch.update_status(message_id, MessageStatus.TRANSCRIBING)
+        """
+        if not self.db:
+            raise Exception("Firebase não inicializado")
+        return AsyncMessageWriteBatch(self.db, self._thread_touches, self._messages_written)
+    
+    def _messages_written(self, message_ids: List[str], thread_ids: Optional[List[str]]) -> None:
+        """Após um commit de mensagens: descartar as contagens das threads afetadas"""
+        self._counts.invalidate(thread_ids)
+    
+    async def save_message(self, message: Message) -> str:
+        """
+        Salvar mensagem no Firestore junto com o resumo da thread
+        """
+        if not self.db:
+            raise Exception("Firebase não inicializado")
+        
+        try:
+            message_dict = message_to_dict(message)
+            # ID gerado no cliente quando a mensagem ainda não possui um
+            message_id = message_dict.pop('id') or new_document_id()
+            
+            await self.batch().create(message_id, message_dict).commit()
+            return message_id
+        
+        except Exception as e:
+            logger.error(f"Erro ao salvar mensagem: {e}")
+            raise Exception("Falha ao salvar mensagem")
+    
+    async def get_messages(self, thread_id: str, owner_id: str = None, summary: bool = False) -> List[Message]:
+        """
+        Obter mensagens de uma thread (conversas globais)
+        """
+        if not self.db:
+            return []
+        
+        try:
+            query = self.db.collection('messages').where('threadId', '==', thread_id)
+            if summary:
+                query = query.select(MESSAGE_SUMMARY_FIELDS)
+            
+            messages = [message_from_snapshot(doc) async for doc in query.stream()]
+            
+            # Ordenar por data de criação
+            messages.sort(key=lambda x: x.createdAt)
+            
+            logger.info(f"Encontradas {len(messages)} mensagens na thread {thread_id}")
+            return messages
+        
+        except Exception as e:
+            logger.error(f"Erro ao obter mensagens da thread {thread_id}: {e}")
+            return []
+    
+    async def get_messages_page(self, thread_id: str, page_size: int = DEFAULT_PAGE_SIZE,
+                                cursor: Optional[MessageCursor] = None, direction: str = 'older',
+                                summary: bool = False) -> MessagePage:
+        """
+        Obter uma página de mensagens de uma thread ordenada por createdAt
+        """
+        if not self.db:
+            return MessagePage(messages=[])
+        
+        queries = messages_page_queries(self.db.collection('messages'), thread_id, page_size, cursor, direction, summary)
+        
+        try:
+            results = await asyncio.gather(*(query.get() for query in queries))
+            docs = merge_page_results(list(results), direction)
+            page = messages_page_from_docs(docs, page_size, direction)
+            logger.info(f"Página com {len(page.messages)} mensagens da thread {thread_id} ({direction})")
+            return page
+        
+        except Exception as e:
+            logger.error(f"Erro ao obter página de mensagens da thread {thread_id}: {e}")
+            return MessagePage(messages=[])
+    
+    async def get_first_pages(self, thread_ids: List[str], page_size: int = DEFAULT_PAGE_SIZE,
+                              summary: bool = True) -> Dict[str, MessagePage]:
+        """
+        Obter em paralelo a página mais recente de várias threads
+        
+        Returns:
+            Dict[str, MessagePage]: Página de cada thread, por ID
+        """
+        pages = await asyncio.gather(*(
+            self.get_messages_page(thread_id, page_size=page_size, summary=summary)
+            for thread_id in thread_ids
+        ))
+        return dict(zip(thread_ids, pages))
+    
+    async def get_threads_with_first_pages(self, thread_count: int, page_size: int = DEFAULT_PAGE_SIZE,
+                                           incremental: bool = False):
+        """
+        Obter threads e, em seguida, as primeiras páginas das thread_count mais recentes
+        
+        Returns:
+            Tuple[List[Thread], Dict[str, MessagePage]]
+        """
+        threads = await self.get_threads(incremental=incremental)
+        pages = await self.get_first_pages([t.id for t in threads[:thread_count]], page_size=page_size)
+        return threads, pages
+    
+    async def get_message(self, message_id: str) -> Optional[Message]:
+        """
+        Obter uma mensagem completa (incluindo áudio e timings) por ID
+        """
+        if not self.db:
+            return None
+        
+        try:
+            message_doc = await self.db.collection('messages').document(message_id).get()
+            if message_doc.exists:
+                return message_from_snapshot(message_doc)
+            return None
+        
+        except Exception as e:
+            logger.error(f"Erro ao obter mensagem {message_id}: {e}")
+            return None
+    
+    async def update_message_status(self, message_id: str, status: MessageStatus, error: Optional[str] = None,
+                                    thread_id: Optional[str] = None) -> None:
+        """
+        Atualizar status da mensagem (com thread_id, também o resumo da thread)
+        """
+        if not self.db:
+            raise Exception("Firebase não inicializado")
+        
+        try:
+            await self.batch().update_status(message_id, status, error, thread_id=thread_id).commit()
+        
+        except Exception as e:
+            logger.error(f"Erro ao atualizar status da mensagem {message_id}: {e}")
+            raise Exception("Falha ao atualizar status da mensagem")
+    
+    async def update_message_payload(self, message_id: str, payload_updates: Dict[str, Any], transactional: bool = False,
+                                     thread_id: Optional[str] = None) -> None:
+        """
+        Atualizar payload da mensagem por caminho de campo (ver FirestoreManager)
+        """
+        if not self.db:
+            raise Exception("Firebase não inicializado")
+        
+        try:
+            if transactional:
+                await self._merge_message_payload(message_id, payload_updates, thread_id)
+                return
+            
+            await self.batch().update_payload(message_id, payload_updates, thread_id=thread_id).commit()
+        
+        except Exception as e:
+            logger.error(f"Erro ao atualizar payload da mensagem {message_id}: {e}")
+            raise Exception("Falha ao atualizar payload da mensagem")
+    
+    async def _merge_message_payload(self, message_id: str, payload_updates: Dict[str, Any], thread_id: Optional[str]) -> None:
+        """Mesclar payload em transação, lendo apenas os campos que serão alterados"""
+        message_ref = self.db.collection('messages').document(message_id)
+        field_paths = list(payload_field_paths(payload_updates).keys())
+        summary = {message_id: {'threadId': thread_id, 'status': None, 'payload': payload_updates}} if thread_id else {}
+        read_refs = [ref for ref in message_write_reads(self.db, [message_id], {}, summary) if ref.path != message_ref.path]
+        touch = self._thread_touches.take([thread_id]) if thread_id else []
+        
+        @firestore.async_transactional
+        async def merge(transaction):
+            snapshot = await message_ref.get(field_paths=field_paths, transaction=transaction)
+            current_payload = (snapshot.to_dict() or {}).get('payload') or {} if snapshot.exists else {}
+            
+            existing = {}
+            if read_refs:
+                existing = existing_documents([doc async for doc in self.db.get_all(
+                    read_refs, field_paths=MESSAGE_WRITE_READ_FIELDS, transaction=transaction)])
+            existing.update(existing_documents([snapshot]))
+            
+            merged = {
+                key: _deep_merge(current_payload.get(key), value)
+                for key, value in payload_updates.items()
+            }
+            stage_message_writes(self.db, transaction, [message_id], {}, {message_id: payload_field_paths(merged)},
+                                 summary, existing, touch)
+        
+        try:
+            await merge(self.db.transaction())
+        except Exception:
+            self._thread_touches.release(touch)
+            raise
+    
+    async def delete_message(self, message_id: str) -> None:
+        """
+        Deletar mensagem ajustando o resumo da thread (ver FirestoreManager)
+        """
+        if not self.db:
+            raise Exception("Firebase não inicializado")
+        
+        try:
+            messages_ref = self.db.collection('messages')
+            message_ref = messages_ref.document(message_id)
+            
+            @firestore.async_transactional
+            async def delete(transaction):
+                snapshot = await message_ref.get(field_paths=MESSAGE_SUMMARY_FIELDS, transaction=transaction)
+                if not snapshot.exists:
+                    return None
+                data = snapshot.to_dict()
+                thread_id = data['threadId']
+                thread_ref = self.db.collection('threads').document(thread_id)
+                shard_ref = activity_shard_ref(self.db, thread_id, activity_shard(message_id))
+                existing = existing_documents([doc async for doc in self.db.get_all(
+                    [thread_ref, shard_ref], field_paths=MESSAGE_WRITE_READ_FIELDS, transaction=transaction)])
+                if thread_ref.path not in existing:
+                    # Thread deletada: não recriar shards órfãos
+                    transaction.delete(message_ref)
+                    return thread_id
+                
+                delta = ThreadSummaryDelta(existing.get(shard_ref.path))
+                delta.remove_message(data)
+                previous_ref, previous_delta = None, None
+                if delta.last_message_id == message_id:
+                    delta.clear_last()
+                    
+                    queries = messages_page_queries(messages_ref, thread_id, 1, None, 'older', summary=True)
+                    docs = merge_page_results([[doc async for doc in await transaction.get(query)] for query in queries], 'older')
+                    previous = next((doc for doc in docs if doc.id != message_id), None)
+                    if previous is not None:
+                        previous_ref = activity_shard_ref(self.db, thread_id, activity_shard(previous.id))
+                        if previous_ref.path == shard_ref.path:
+                            previous_delta, previous_ref = delta, None
+                        else:
+                            stored = await previous_ref.get(field_paths=MESSAGE_WRITE_READ_FIELDS, transaction=transaction)
+                            previous_delta = ThreadSummaryDelta(stored.to_dict())
+                        previous_delta.offer_last(previous.id, previous.to_dict())
+                
+                transaction.delete(message_ref)
+                transaction.set(shard_ref, delta.to_shard_data(), merge=True)
+                if previous_ref is not None and previous_delta.last:
+                    transaction.set(previous_ref, previous_delta.to_shard_data(), merge=True)
+                return thread_id
+            
+            thread_id = await delete(self.db.transaction())
+            self._messages_written([message_id], [thread_id] if thread_id else [])
+        
+        except Exception as e:
+            logger.error(f"Erro ao deletar mensagem {message_id}: {e}")
+            raise Exception("Falha ao deletar mensagem")
+    
+    async def save_thread(self, thread: Thread) -> str:
+        """
+        Salvar thread
+        """
+        if not self.db:
+            raise Exception("Firebase não inicializado")
+        
+        try:
+            thread_dict = thread_to_dict(thread)
+            # ID gerado no cliente: a thread pode ser exibida antes da gravação
+            thread_id = thread_dict.pop('id') or new_document_id()
+            
+            await self.db.collection('threads').document(thread_id).create(thread_dict)
+            return thread_id
+        
+        except Exception as e:
+            logger.error(f"Erro ao salvar thread: {e}")
+            raise Exception("Falha ao salvar thread")
+    
+    async def get_thread(self, thread_id: str) -> Optional[Thread]:
+        """
+        Obter thread por ID
+        """
+        if not self.db:
+            return None
+        
+        try:
+            # Documento da thread e shards de atividade em uma única leitura
+            docs = [doc async for doc in self.db.get_all(thread_activity_refs(self.db, thread_id))]
+            threads = threads_from_snapshots(docs)
+            return threads[0] if threads else None
+        
+        except Exception as e:
+            logger.error(f"Erro ao obter thread {thread_id}: {e}")
+            return None
+    
+    async def get_threads(self, owner_id: str = None, incremental: bool = False) -> List[Thread]:
+        """
+        Obter todas as threads (conversas globais)
+        
+        Em caso de erro, retorna as threads já em cache.
+        """
+        if not self.db:
+            return []
+        
+        if incremental and self.threads_cache.watermark is not None:
+            return await self._sync_threads_since(self.threads_cache.watermark)
+        
+        try:
+            thread_docs, activity_docs = await asyncio.gather(
+                self.db.collection('threads').get(),
+                self.db.collection_group('activity').get()
+            )
+            threads = threads_from_snapshots(list(thread_docs) + list(activity_docs))
+            self.threads_cache.replace(threads)
+            
+            logger.info(f"Encontradas {len(threads)} threads globais")
+            return self.threads_cache.sorted()
+        
+        except Exception as e:
+            logger.error(f"Erro ao obter threads: {e}")
+            return self.threads_cache.sorted()
+    
+    async def _sync_threads_since(self, watermark: int) -> List[Thread]:
+        """Buscar apenas threads com documento ou atividade alterados desde watermark e mesclar no cache"""
+        try:
+            queries = threads_changed_since_queries(self.db.collection('threads'), watermark)
+            queries.append(activity_changed_since_query(self.db, watermark))
+            results = await asyncio.gather(*(query.get() for query in queries))
+            
+            changed_ids = set()
+            for docs in results[:-1]:
+                changed_ids.update(doc.id for doc in docs)
+            changed_ids.update(doc.reference.parent.parent.id for doc in results[-1])
+            
+            if changed_ids:
+                refs = [ref for thread_id in sorted(changed_ids) for ref in thread_activity_refs(self.db, thread_id)]
+                docs = [doc async for doc in self.db.get_all(refs)]
+                for thread in threads_from_snapshots(docs):
+                    self.threads_cache.merge(thread)
+            
+            logger.info(f"Sincronização incremental: {len(changed_ids)} threads alteradas")
+        
+        except Exception as e:
+            logger.error(f"Erro na sincronização incremental de threads: {e}")
+        
+        return self.threads_cache.sorted()
+    
+    async def get_message_counts(self, thread_id: str) -> Optional[ThreadCounts]:
+        """
+        Contar mensagens de uma thread com consultas de agregação count() (ver FirestoreManager)
+        """
+        if not self.db:
+            return None
+        
+        try:
+            query = self.db.collection('messages').where(filter=FieldFilter('threadId', '==', thread_id))
+            pending_query = query.where(filter=FieldFilter('status', 'in', PENDING_STATUSES))
+            
+            total, pending = await asyncio.gather(query.count(alias='total').get(),
+                                                  pending_query.count(alias='pending').get())
+            return ThreadCounts(total=int(total[0][0].value), pending=int(pending[0][0].value))
+        
+        except Exception as e:
+            logger.error(f"Erro ao contar mensagens da thread {thread_id}: {e}")
+            return None
+    
+    async def get_threads_counts(self, threads: List[Thread], force: bool = False,
+                                 workers: int = COUNT_WORKERS) -> Dict[str, ThreadCounts]:
+        """
+        Obter contagens de várias threads, reaproveitando o cache (ver FirestoreManager)
+        
+        Até workers threads são contadas ao mesmo tempo.
+        """
+        stale, versions = self._counts.stale(threads, force)
+        
+        fresh = {}
+        if stale:
+            semaphore = asyncio.Semaphore(workers)
+            
+            async def count(thread):
+                async with semaphore:
+                    return await self.get_message_counts(thread.id)
+            
+            results = await asyncio.gather(*(count(thread) for thread in stale))
+            fresh = self._counts.store(stale, results, versions)
+            logger.info(f"Contagens atualizadas para {len(stale)} threads")
+        
+        return {**self._counts.get(threads), **fresh}
+    
+    async def update_thread(self, thread_id: str, updates: Dict[str, Any]) -> None:
+        """
+        Atualizar thread; sem campos alterados, a data de atualização vai para
+        um shard de atividade, salvo a cada THREAD_TOUCH_INTERVAL segundos (ver FirestoreManager)
+        """
+        if not self.db:
+            raise Exception("Firebase não inicializado")
+        
+        touch = []
+        try:
+            batch = self.db.batch()
+            touch = self._thread_touches.take([thread_id])
+            if updates or touch:
+                batch.update(self.db.collection('threads').document(thread_id),
+                             {**updates, 'updatedAt': firestore.SERVER_TIMESTAMP})
+            else:
+                shard_ref = activity_shard_ref(self.db, thread_id, random.randrange(ACTIVITY_SHARDS))
+                batch.set(shard_ref, {'updatedAt': firestore.SERVER_TIMESTAMP}, merge=True)
+            await batch.commit()
+        
+        except Exception as e:
+            self._thread_touches.release(touch)
+            logger.error(f"Erro ao atualizar thread {thread_id}: {e}")
+            raise Exception("Falha ao atualizar thread")
+    
+    async def delete_thread(self, thread_id: str, cascade: bool = False,
+                            on_progress: Optional[Callable[[int], None]] = None,
+                            workers: int = DELETE_WORKERS) -> int:
+        """
+        Deletar thread, com exclusão opcional em cascata das mensagens (ver FirestoreManager)
+        """
+        if not self.db:
+            raise Exception("Firebase não inicializado")
+        
+        try:
+            deleted = 0
+            
+            if cascade:
+                deleted = await self._delete_thread_messages(thread_id, on_progress, workers)
+            
+            batch = self.db.batch()
+            for ref in thread_activity_refs(self.db, thread_id):
+                batch.delete(ref)
+            await batch.commit()
+            self.threads_cache.discard(thread_id)
+            
+            logger.info(f"Thread {thread_id} deletada com {deleted} mensagens")
+            return deleted
+        
+        except Exception as e:
+            logger.error(f"Erro ao deletar thread {thread_id}: {e}")
+            raise Exception("Falha ao deletar thread")
+    
+    async def _delete_thread_messages(self, thread_id: str, on_progress: Optional[Callable[[int], None]], workers: int) -> int:
+        """Deletar mensagens da thread em lotes, com até workers commits simultâneos"""
+        query = thread_message_refs_query(self.db.collection('messages'), thread_id)
+        semaphore = asyncio.Semaphore(workers)
+        deleted = 0
+        
+        async def delete_chunk(doc_refs):
+            nonlocal deleted
+            async with semaphore:
+                batch = self.db.batch()
+                for doc_ref in doc_refs:
+                    batch.delete(doc_ref)
+                await batch.commit()
+            deleted += len(doc_refs)
+            if on_progress:
+                on_progress(deleted)
+        
+        tasks = []
+        last_doc = None
+        while True:
+            page_query = query.start_after(last_doc) if last_doc is not None else query
+            docs = await page_query.get()
+            if not docs:
+                break
+            tasks.append(asyncio.create_task(delete_chunk([doc.reference for doc in docs])))
+            if len(docs) < MAX_BATCH_WRITES:
+                break
+            last_doc = docs[-1]
+        
+        await asyncio.gather(*tasks)
+        return deleted
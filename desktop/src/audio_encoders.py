@@ -0,0 +1,132 @@
+"""
+Codificadores de áudio para Totari Desktop
+Compressão das gravações (WAV PCM) antes do upload: FLAC sem perdas ou Opus para voz
+"""
+
+import io
+import logging
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+try:
+    import soundfile
+    SOUNDFILE_AVAILABLE = True
+except (ImportError, OSError):
+    SOUNDFILE_AVAILABLE = False
+    logging.warning("soundfile não disponível - gravações serão enviadas em WAV")
+
+from .firebase_config import DESKTOP_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Frames lidos por vez ao recodificar (memória constante)
+ENCODE_BLOCK_FRAMES = 64 * 1024
+
+# Taxas de amostragem aceitas pelo Opus
+OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+
+# Extensão de arquivo por tipo de conteúdo (upload para transcrição)
+AUDIO_EXTENSIONS = {
+    'audio/wav': 'wav',
+    'audio/flac': 'flac',
+    'audio/ogg': 'ogg'
+}
+
+@dataclass
+class EncodedAudio:
+    """Áudio codificado pronto para o payload"""
+    data: bytes
+    contentType: str
+
+class AudioEncoder:
+    """Codificador padrão: mantém o WAV PCM"""
+    
+    name = 'wav'
+    content_type = 'audio/wav'
+    
+    def encode(self, wav_data: bytes) -> EncodedAudio:
+        """Codificar uma gravação WAV"""
+        return EncodedAudio(data=wav_data, contentType=self.content_type)
+
+class SoundFileEncoder(AudioEncoder):
+    """Recodificação via libsndfile, bloco a bloco"""
+    
+    format: Optional[str] = None
+    subtype: Optional[str] = None
+    # 0.0 (maior qualidade) a 1.0 (maior compressão)
+    compression_level: Optional[float] = None
+    
+    def encode(self, wav_data: bytes) -> EncodedAudio:
+        if not SOUNDFILE_AVAILABLE:
+            raise Exception(f"soundfile não disponível para codificar {self.name}")
+            
+        output = io.BytesIO()
+        with soundfile.SoundFile(io.BytesIO(wav_data)) as source:
+            self._check_source(source)
+            options = {}
+            if self.compression_level is not None:
+                options['compression_level'] = self.compression_level
+            with soundfile.SoundFile(output, 'w', samplerate=source.samplerate, channels=source.channels,
+                                     format=self.format, subtype=self.subtype, **options) as target:
+                for block in source.blocks(blocksize=ENCODE_BLOCK_FRAMES, dtype='int16'):
+                    target.write(block)
+                    
+        return EncodedAudio(data=output.getvalue(), contentType=self.content_type)
+        
+    def _check_source(self, source) -> None:
+        """Validar a gravação de entrada para o formato"""
+
+class FlacEncoder(SoundFileEncoder):
+    """FLAC: sem perdas, tipicamente metade do WAV ou menos"""
+    
+    name = 'flac'
+    content_type = 'audio/flac'
+    format = 'FLAC'
+    subtype = 'PCM_16'
+
+class OpusEncoder(SoundFileEncoder):
+    """Opus em Ogg: com perdas, ajustado para voz (fala mono, bitrate baixo)"""
+    
+    name = 'opus'
+    content_type = 'audio/ogg'
+    format = 'OGG'
+    subtype = 'OPUS'
+    # libsndfile mapeia o nível para o bitrate (0.0 ≈ 256 kbps, 1.0 ≈ 6 kbps): 0.9 ≈ 32 kbps, suficiente para voz
+    compression_level = 0.9
+    
+    def _check_source(self, source) -> None:
+        if source.samplerate not in OPUS_SAMPLE_RATES:
+            raise Exception(f"Opus não suporta {source.samplerate} Hz (use {', '.join(map(str, OPUS_SAMPLE_RATES))})")
+
+ENCODERS: Dict[str, AudioEncoder] = {
+    encoder.name: encoder for encoder in (AudioEncoder(), FlacEncoder(), OpusEncoder())
+}
+
+def get_encoder(name: Optional[str] = None) -> AudioEncoder:
+    """
+    Obter codificador pelo nome ('wav', 'flac', 'opus')
+    
+    Sem nome, usa DESKTOP_CONFIG['audio_format']; nomes desconhecidos caem no WAV.
+    """
+    name = name or DESKTOP_CONFIG['audio_format']
+    encoder = ENCODERS.get(name)
+    if encoder is None:
+        logger.warning(f"Formato de áudio desconhecido: {name} - usando WAV")
+        return ENCODERS['wav']
+    return encoder
+
+def encode_audio(encoder: AudioEncoder, wav_data: bytes) -> EncodedAudio:
+    """Codificar uma gravação, mantendo o WAV se o codificador falhar"""
+    try:
+        encoded = encoder.encode(wav_data)
+        if encoder.name != 'wav':
+            logger.info(f"Áudio codificado em {encoder.name}: {len(wav_data)} -> {len(encoded.data)} bytes")
+        return encoded
+        
+    except Exception as e:
+        logger.warning(f"Falha ao codificar áudio em {encoder.name}: {e} - enviando WAV")
+        return ENCODERS['wav'].encode(wav_data)
+
+def audio_extension(content_type: str) -> str:
+    """Extensão de arquivo para um tipo de conteúdo de áudio"""
+    return AUDIO_EXTENSIONS.get(content_type, 'wav')
@@ -0,0 +1,301 @@
+"""
+Processamento de áudio em streaming para Totari Desktop
+Estágios aplicados aos chunks int16 da captura antes de irem para o disco
+"""
+
+import logging
+from collections import deque
+from math import gcd
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+    logging.warning("NumPy não disponível - gravações mantidas na taxa de captura")
+
+logger = logging.getLogger(__name__)
+
+# Cruzamentos por zero do sinc de cada lado: mais = corte mais abrupto, mais custo
+RESAMPLER_ZERO_CROSSINGS = 16
+
+# Beta da janela de Kaiser (~90 dB de atenuação na banda de rejeição)
+RESAMPLER_KAISER_BETA = 9.0
+
+class StreamingResampler:
+    """
+    Conversor de taxa de amostragem polifásico (sinc janelado), mono int16
+    
+    A razão target/source é reduzida a L/M; cada amostra de saída usa uma
+    fase do filtro protótipo e as últimas amostras de entrada. Só o
+    histórico necessário ao filtro é mantido entre chunks, então a memória
+    não cresce com a duração. Cada chunk é processado de forma vetorizada.
+    """
+    
+    def __init__(self, source_rate: int, target_rate: int, zero_crossings: int = RESAMPLER_ZERO_CROSSINGS):
+        if not NUMPY_AVAILABLE:
+            raise Exception("NumPy não disponível para reamostragem")
+            
+        divisor = gcd(source_rate, target_rate)
+        self.source_rate = source_rate
+        self.target_rate = target_rate
+        self.up = target_rate // divisor
+        self.down = source_rate // divisor
+        
+        # Protótipo passa-baixa na taxa intermediária (source * up), corte na menor Nyquist
+        factor = max(self.up, self.down)
+        self.taps = -(-2 * zero_crossings * factor // self.up)
+        length = self.taps * self.up
+        # Centro do filtro na taxa intermediária: cada saída é avaliada nesse atraso (sem deslocamento)
+        self._center = (length - 1) // 2
+        t = np.arange(length) - self._center
+        prototype = np.sinc(t / factor) * np.kaiser(length, RESAMPLER_KAISER_BETA)
+        prototype *= self.up / prototype.sum()
+        
+        # phases[p, k] = h[p + k * up]: coeficientes da fase p, na ordem do histórico
+        self.phases = prototype.reshape(self.taps, self.up).T.astype(np.float32)
+        self._history = np.zeros(self.taps - 1, dtype=np.float32)
+        self._consumed = 0  # Índice absoluto da primeira amostra nova (após o histórico)
+        self._produced = 0  # Próximo índice de saída
+        self._offsets = np.arange(self.taps)
+        
+    @property
+    def delay(self) -> int:
+        """Atraso do filtro, em amostras de entrada"""
+        return self._center // self.up + 1
+        
+    def process(self, frames: bytes) -> bytes:
+        """Converter um chunk de frames int16"""
+        samples = np.frombuffer(frames, dtype='<i2').astype(np.float32)
+        return self._process(samples)
+        
+    def flush(self) -> bytes:
+        """Emitir as amostras retidas pelo atraso do filtro (fim da gravação)"""
+        # Total de saídas correspondente à entrada recebida
+        limit = -(-self._consumed * self.up // self.down)
+        return self._process(np.zeros(self.delay, dtype=np.float32), limit)
+        
+    def _process(self, samples, limit: int = None) -> bytes:
+        buffer = np.concatenate((self._history, samples))
+        # Índice absoluto (entrada) logo após a última amostra disponível
+        end = self._consumed + len(buffer) - (self.taps - 1)
+        last = (end * self.up - 1 - self._center) // self.down
+        if limit is not None:
+            last = min(last, limit - 1)
+        if last < self._produced:
+            self._keep_history(buffer)
+            return b''
+            
+        outputs = np.arange(self._produced, last + 1)
+        position = outputs * self.down + self._center
+        # Linha do buffer da amostra mais recente usada por cada saída
+        rows = position // self.up - self._consumed + self.taps - 1
+        windows = buffer[rows[:, None] - self._offsets[None, :]]
+        result = np.einsum('ij,ij->i', windows, self.phases[position % self.up])
+        
+        self._produced = last + 1
+        self._keep_history(buffer)
+        return np.clip(np.rint(result), -32768, 32767).astype('<i2').tobytes()
+        
+    def _keep_history(self, buffer) -> None:
+        """Guardar só as amostras que o filtro ainda vai usar"""
+        consumed = len(buffer) - (self.taps - 1)
+        self._history = buffer[consumed:].copy()
+        self._consumed += consumed
+
+# Janela de análise do VAD (segundos)
+VAD_FRAME_SECONDS = 0.02
+
+# Energia mínima para fala (dBFS) e margem acima do ruído de fundo estimado
+VAD_MIN_ENERGY_DB = -50.0
+VAD_NOISE_MARGIN_DB = 12.0
+
+# Subida máxima da estimativa de ruído por janela (dB), para acompanhar ruído crescente
+VAD_NOISE_RISE_DB = 0.05
+
+# Fricativas (s, f, x) têm pouca energia e muitos cruzamentos por zero
+VAD_FRICATIVE_ZCR = 0.3
+VAD_FRICATIVE_MARGIN_DB = 6.0
+
+# Janelas mantidas como fala após a última janela com voz (segundos)
+VAD_HANGOVER_SECONDS = 0.3
+
+# Silêncio mantido antes do início e após o fim da fala (segundos)
+VAD_PADDING_SECONDS = 0.3
+
+# Pausa máxima retida à espera de saber se é final (sem compressão de pausas nem silence_timeout)
+VAD_MAX_PENDING_SECONDS = 30.0
+
+class VoiceActivityDetector:
+    """
+    Detector de atividade de voz (energia + cruzamentos por zero), mono int16
+    
+    Estágio de streaming: recebe chunks e devolve só o áudio a manter.
+    Remove o silêncio inicial e final (preservando VAD_PADDING_SECONDS),
+    opcionalmente encurta pausas internas para max_pause segundos e sinaliza
+    should_stop após silence_timeout segundos seguidos de silêncio.
+    
+    Args:
+        rate (int): Taxa de amostragem dos chunks
+        silence_timeout (float): Silêncio contínuo que encerra a gravação (0 = nunca)
+        max_pause (float): Duração máxima das pausas internas (0 = mantê-las)
+    """
+    
+    def __init__(self, rate: int, silence_timeout: float = 0, max_pause: float = 0):
+        if not NUMPY_AVAILABLE:
+            raise Exception("NumPy não disponível para detecção de voz")
+            
+        self.rate = rate
+        self.frame_size = int(rate * VAD_FRAME_SECONDS)
+        self.silence_timeout = silence_timeout
+        self._timeout_frames = self._frames(silence_timeout)
+        self._max_pause_frames = self._frames(max_pause)
+        self._hangover_frames = self._frames(VAD_HANGOVER_SECONDS)
+        self._padding_frames = self._frames(VAD_PADDING_SECONDS)
+        self._max_pending_frames = self._frames(VAD_MAX_PENDING_SECONDS)
+        
+        self._remainder = b''
+        self._noise_db = None
+        self._hangover = 0
+        self._speech_started = False
+        self._preroll = deque()
+        self._pause = []
+        self._silent_frames = 0
+        self._removed_samples = 0
+        
+    def _frames(self, seconds: float) -> int:
+        """Quantidade de janelas em seconds"""
+        return int(round(seconds / VAD_FRAME_SECONDS)) if seconds else 0
+        
+    @property
+    def removed_seconds(self) -> float:
+        """Segundos de silêncio removidos até agora"""
+        return self._removed_samples / self.rate
+        
+    @property
+    def should_stop(self) -> bool:
+        """Silêncio contínuo atingiu silence_timeout"""
+        return bool(self._timeout_frames) and self._silent_frames >= self._timeout_frames
+        
+    @property
+    def speech_detected(self) -> bool:
+        """Alguma fala já foi detectada"""
+        return self._speech_started
+        
+    def process(self, frames: bytes) -> bytes:
+        """Classificar as janelas completas de um chunk e devolver o áudio mantido"""
+        data = self._remainder + frames
+        count = len(data) // (2 * self.frame_size)
+        self._remainder = data[count * 2 * self.frame_size:]
+        if not count:
+            return b''
+            
+        samples = np.frombuffer(data, dtype='<i2', count=count * self.frame_size).reshape(count, self.frame_size)
+        voiced = self._classify(samples.astype(np.float32))
+        
+        output = []
+        step = 2 * self.frame_size
+        for index, is_voiced in enumerate(voiced):
+            frame = data[index * step:(index + 1) * step]
+            if is_voiced:
+                self._on_voice(frame, output)
+            else:
+                self._on_silence(frame, output)
+        return b''.join(output)
+        
+    def flush(self) -> bytes:
+        """Fim da gravação: manter VAD_PADDING_SECONDS do silêncio final e descartar o resto"""
+        output = []
+        if self._speech_started:
+            kept = self._pause[:self._padding_frames]
+            output.extend(kept)
+            self._removed_samples += (len(self._pause) - len(kept)) * self.frame_size
+        else:
+            self._removed_samples += len(self._preroll) * self.frame_size
+        self._removed_samples += len(self._remainder) // 2
+        
+        self._pause = []
+        self._preroll.clear()
+        self._remainder = b''
+        return b''.join(output)
+        
+    def _classify(self, frames) -> list:
+        """Janelas com voz: energia acima do ruído ou fricativa (energia menor, ZCR alto)"""
+        energy_db = 10 * np.log10(np.mean(frames * frames, axis=1) / (32768.0 * 32768.0) + 1e-10)
+        zcr = np.count_nonzero(np.diff(np.signbit(frames), axis=1), axis=1) / frames.shape[1]
+        
+        voiced = []
+        for energy, crossings in zip(energy_db.tolist(), zcr.tolist()):
+            # Ruído de fundo: acompanha quedas na hora e subidas devagar
+            if self._noise_db is None or energy < self._noise_db:
+                self._noise_db = energy
+            else:
+                self._noise_db += VAD_NOISE_RISE_DB
+                
+            threshold = max(VAD_MIN_ENERGY_DB, self._noise_db + VAD_NOISE_MARGIN_DB)
+            speech = energy > threshold or (crossings > VAD_FRICATIVE_ZCR and energy > threshold - VAD_FRICATIVE_MARGIN_DB)
+            
+            if speech:
+                self._hangover = self._hangover_frames
+            elif self._hangover:
+                self._hangover -= 1
+                speech = True
+            voiced.append(speech)
+        return voiced
+        
+    def _on_voice(self, frame: bytes, output: list) -> None:
+        if not self._speech_started:
+            # Início da fala: manter só o silêncio imediatamente anterior
+            self._speech_started = True
+            output.extend(self._preroll)
+            self._preroll.clear()
+        elif self._pause:
+            output.extend(self._pause)
+            self._pause = []
+        output.append(frame)
+        self._silent_frames = 0
+        
+    def _on_silence(self, frame: bytes, output: list) -> None:
+        self._silent_frames += 1
+        if not self._speech_started:
+            self._preroll.append(frame)
+            if len(self._preroll) > self._padding_frames:
+                self._preroll.popleft()
+                self._removed_samples += self.frame_size
+            return
+            
+        self._pause.append(frame)
+        if self._max_pause_frames and len(self._pause) > self._max_pause_frames:
+            # Encurtar a pausa pelo meio, preservando as bordas
+            del self._pause[len(self._pause) // 2]
+            self._removed_samples += self.frame_size
+        elif not self._max_pause_frames and not self._timeout_frames and len(self._pause) >= self._max_pending_frames:
+            # Pausa longa demais para reter: gravá-la (deixa de ser removível como silêncio final).
+            # Com silence_timeout a pausa já é limitada por ele e precisa continuar removível
+            # quando encerra a gravação
+            output.extend(self._pause)
+            self._pause = []
+
+def create_voice_detector(rate: int, enabled: bool = True, silence_timeout: float = 0, max_pause: float = 0):
+    """
+    Detector de voz para chunks em rate, ou None quando desabilitado ou
+    NumPy não está disponível
+    """
+    if not enabled:
+        return None
+    if not NUMPY_AVAILABLE:
+        logger.warning("NumPy não disponível - silêncio não será removido das gravações")
+        return None
+    return VoiceActivityDetector(rate, silence_timeout=silence_timeout, max_pause=max_pause)
+
+def create_resampler(source_rate: int, target_rate: int):
+    """
+    Resampler de source_rate para target_rate, ou None quando não há
+    conversão a fazer ou NumPy não está disponível
+    """
+    if source_rate == target_rate:
+        return None
+    if not NUMPY_AVAILABLE:
+        logger.warning(f"NumPy não disponível - gravando em {source_rate} Hz em vez de {target_rate} Hz")
+        return None
+    return StreamingResampler(source_rate, target_rate)
@@ -4,12 +4,13 @@ Implementação idêntica ao mobile usando PyAudio
 """
 
 import os
-import wave
 import base64
+import dataclasses
 import threading
 import time
 import logging
-from typing import Optional, Callable, Dict, Any
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional, Callable, Dict, Any, List
 from datetime import datetime
 
 try:
@@ -21,6 +22,11 @@ except ImportError:
 
 from .types import Message, MessageKind, MessageStatus, MessageSource, MessagePayload, AudioPayload
 from .device_id import get_or_create_device_id
+from .firestore import new_document_id
+from .audio_encoders import AudioEncoder, get_encoder, encode_audio
+from .audio_processing import create_resampler, create_voice_detector
+from .firebase_config import DESKTOP_CONFIG
+from .recordings import WavFileWriter, new_recording_path, recover_recordings, recording_duration, remove_recording
 
 logger = logging.getLogger(__name__)
 
@@ -30,7 +36,16 @@ class AudioRecorder:
     def __init__(self):
         self.is_recording = False
         self.recording_thread = None
-        self.audio_data = []
+        # Frames vão para um WAV em disco durante a captura (memória constante)
+        self.wav_writer: Optional[WavFileWriter] = None
+        self.file_path: Optional[str] = None
+        # Conversão da taxa de captura para a taxa gravada, chunk a chunk
+        self.resampler = None
+        # Detecção de voz: remove silêncio e encerra a gravação após silêncio longo
+        self.vad = None
+        self.auto_stopped = False
+        self.trimmed_seconds = 0.0
+        self.on_auto_stop: Optional[Callable[[], None]] = None
         self.duration = 0
         self.start_time = None
         
@@ -38,7 +53,9 @@ class AudioRecorder:
         self.CHUNK = 1024
         self.FORMAT = pyaudio.paInt16 if PYAUDIO_AVAILABLE else None
         self.CHANNELS = 1  # Mono
-        self.RATE = 44100  # 44.1 kHz
+        self.SAMPLE_WIDTH = 2  # 16-bit
+        self.RATE = 44100  # 44.1 kHz (captura)
+        self.OUTPUT_RATE = DESKTOP_CONFIG['audio_sample_rate']  # Taxa do arquivo gravado (16 kHz basta para voz)
         self.MAX_DURATION = 20 * 60  # 20 minutos máximo
         self.MIN_DURATION = 1  # 1 segundo mínimo
         self.MAX_FILE_SIZE = 25 * 1024 * 1024  # 25MB máximo
@@ -56,7 +73,18 @@ class AudioRecorder:
             return False
             
         try:
-            self.audio_data = []
+            self.resampler = create_resampler(self.RATE, self.OUTPUT_RATE)
+            output_rate = self.OUTPUT_RATE if self.resampler else self.RATE
+            self.vad = create_voice_detector(
+                output_rate,
+                enabled=DESKTOP_CONFIG['vad_enabled'],
+                silence_timeout=DESKTOP_CONFIG['vad_silence_timeout'],
+                max_pause=DESKTOP_CONFIG['vad_max_pause']
+            )
+            self.auto_stopped = False
+            self.trimmed_seconds = 0.0
+            self.file_path = new_recording_path()
+            self.wav_writer = WavFileWriter(self.file_path, self.CHANNELS, self.SAMPLE_WIDTH, output_rate)
             self.duration = 0
             self.is_recording = True
             self.start_time = time.time()
@@ -73,40 +101,46 @@ class AudioRecorder:
             self.is_recording = False
             return False
             
-    def stop_recording(self) -> Optional[bytes]:
+    def stop_recording(self) -> Optional[bytearray]:
         """
-        Parar gravação e retornar dados - igual ao mobile
+        Parar gravação e retornar o WAV completo - igual ao mobile
         """
-        if not self.is_recording:
+        if not self.is_recording and not self.auto_stopped:
             logger.warning("Nenhuma gravação em andamento")
             return None
             
         try:
             self.is_recording = False
+            self.auto_stopped = False
             
-            # Aguardar thread de gravação terminar
+            # Aguardar thread de gravação terminar (ela fecha o arquivo ao sair)
             if self.recording_thread:
                 self.recording_thread.join(timeout=2.0)
+                if self.recording_thread.is_alive():
+                    logger.error(f"Thread de gravação não terminou (gravação mantida em {self.file_path})")
+                    return None
+            
+            # Verificar se sobrou áudio após a remoção de silêncio
+            if self.wav_writer.data_size == 0:
+                logger.warning("Nenhuma fala detectada na gravação")
+                self.discard_recording()
+                return None
                 
-            # Verificar duração mínima
-            if self.duration < self.MIN_DURATION:
-                logger.warning(f"Gravação muito curta: {self.duration}s")
+            # Verificar duração mínima (do áudio mantido, sem o silêncio removido)
+            if self.get_recorded_duration() < self.MIN_DURATION:
+                logger.warning(f"Gravação muito curta: {self.get_recorded_duration()}s")
+                self.discard_recording()
                 return None
                 
             # Verificar duração máxima
             if self.duration > self.MAX_DURATION:
-                logger.warning(f"Gravação muito longa: {self.duration}s")
+                logger.warning(f"Gravação muito longa: {self.duration}s (mantida em {self.file_path})")
                 return None
                 
-            # Converter dados para WAV
-            wav_data = self._convert_to_wav()
+            # Montar o WAV final em um único buffer (o limite de tamanho vale para o áudio codificado)
+            wav_data = self._finalize_wav()
             
-            # Verificar tamanho do arquivo
-            if len(wav_data) > self.MAX_FILE_SIZE:
-                logger.warning(f"Arquivo muito grande: {len(wav_data)} bytes")
-                return None
-                
-            logger.info(f"Gravação finalizada: {self.duration}s, {len(wav_data)} bytes")
+            logger.info(f"Gravação finalizada: {self.duration}s, {len(wav_data)} bytes, {self.trimmed_seconds:.1f}s de silêncio removidos")
             return wav_data
             
         except Exception as e:
@@ -115,6 +149,7 @@ class AudioRecorder:
             
     def _record_audio(self):
         """Thread de gravação de áudio"""
+        writer = self.wav_writer
         try:
             audio = pyaudio.PyAudio()
             stream = audio.open(
@@ -129,9 +164,25 @@ class AudioRecorder:
             
             while self.is_recording:
                 data = stream.read(self.CHUNK)
-                self.audio_data.append(data)
+                if self.resampler:
+                    data = self.resampler.process(data)
+                if self.vad:
+                    data = self.vad.process(data)
+                writer.write(data)
                 self.duration = time.time() - self.start_time
                 
+                if self.vad and self.vad.should_stop:
+                    logger.info(f"Gravação encerrada após {self.vad.silence_timeout}s de silêncio")
+                    self.auto_stopped = True
+                    self.is_recording = False
+                    
+            # Esvaziar os estágios (amostras retidas pelo filtro e silêncio final)
+            data = self.resampler.flush() if self.resampler else b''
+            if self.vad:
+                data = self.vad.process(data) + self.vad.flush()
+                self.trimmed_seconds = self.vad.removed_seconds
+            writer.write(data)
+            
             # Fechar stream
             stream.stop_stream()
             stream.close()
@@ -143,34 +194,34 @@ class AudioRecorder:
             logger.error(f"Erro na thread de gravação: {e}")
             self.is_recording = False
             
-    def _convert_to_wav(self) -> bytes:
-        """Converter dados de áudio para formato WAV"""
-        try:
-            # Criar arquivo WAV em memória
-            wav_buffer = wave.open('temp.wav', 'wb')
-            wav_buffer.setnchannels(self.CHANNELS)
-            wav_buffer.setsampwidth(2)  # 16-bit
-            wav_buffer.setframerate(self.RATE)
-            
-            # Escrever dados
-            for chunk in self.audio_data:
-                wav_buffer.writeframes(chunk)
-                
-            wav_buffer.close()
+        finally:
+            # Só a thread de captura escreve no arquivo: fechá-lo aqui, após a última escrita
+            writer.close()
             
-            # Ler dados do arquivo
-            with open('temp.wav', 'rb') as f:
-                wav_data = f.read()
-                
-            # Remover arquivo temporário
-            os.remove('temp.wav')
+        # Fora da thread de captura: o callback pode chamar stop_recording, que aguarda esta thread
+        if self.auto_stopped and self.on_auto_stop:
+            threading.Thread(target=self.on_auto_stop, name='recording-auto-stop', daemon=True).start()
             
-            return wav_data
+    def _finalize_wav(self) -> bytearray:
+        """Cabeçalho e frames da gravação atual em um buffer pré-alocado"""
+        try:
+            return self.wav_writer.read_wav()
             
         except Exception as e:
-            logger.error(f"Erro ao converter para WAV: {e}")
-            return b''
+            logger.error(f"Erro ao ler gravação {self.file_path}: {e}")
+            return bytearray()
             
+    def discard_recording(self) -> None:
+        """Remover o arquivo da gravação atual (após o áudio ser salvo)"""
+        remove_recording(self.file_path)
+        self.file_path = None
+        
+    def get_recorded_duration(self) -> int:
+        """Duração do áudio gravado em segundos (sem o silêncio removido)"""
+        if self.wav_writer is None:
+            return 0
+        return int(round(self.wav_writer.duration))
+        
     def get_duration(self) -> int:
         """Obter duração atual da gravação em segundos"""
         if self.is_recording and self.start_time:
@@ -184,23 +235,47 @@ class AudioRecorder:
 class AudioRecorderManager:
     """Gerenciador de gravação de áudio - igual ao mobile"""
     
-    def __init__(self, firestore_manager, storage_manager):
+    def __init__(self, firestore_manager, storage_manager, write_queue=None, encoder: Optional[AudioEncoder] = None):
         self.firestore_manager = firestore_manager
         self.storage_manager = storage_manager
+        # Escritas passam pela fila durável, quando configurada, para não bloquear na rede
+        self.writer = write_queue or firestore_manager
         self.recorder = AudioRecorder()
+        # Codificação entre a gravação (WAV) e o payload: DESKTOP_CONFIG['audio_format'] por padrão
+        self.encoder = encoder or get_encoder()
+        
+        # Gravações interrompidas por uma falha continuam em disco, com cabeçalho corrigido,
+        # até serem enviadas ou descartadas (ou expirarem após recordings_retention_days)
+        self.recovered_recordings = recover_recordings(DESKTOP_CONFIG['recordings_retention_days'])
+        
+        # Criação da mensagem em segundo plano; stop_recording aguarda antes de atualizá-la
+        self._write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='recorder-writes')
+        self._pending_writes: Dict[str, Future] = {}
+        self._pending_lock = threading.Lock()
         
-    def start_recording(self, thread_id: str, on_complete: Callable[[Message], None], on_update: Optional[Callable[[str, Message], None]] = None) -> bool:
+    def start_recording(self, thread_id: str, on_complete: Callable[[Message], None], on_update: Optional[Callable[[str, Message], None]] = None,
+                        on_auto_stop: Optional[Callable[[], None]] = None) -> bool:
         """
         Iniciar gravação de áudio - igual ao mobile
+        
+        on_auto_stop é chamado (em uma thread própria, após o fim da captura)
+        quando o detector de voz encerra a gravação por silêncio;
+        stop_recording continua necessário para processar o áudio e pode ser
+        chamado de dentro do callback.
+        
+        A mensagem recebe um ID gerado localmente e on_complete é chamado na
+        hora; a gravação no Firestore acontece em segundo plano e, se falhar,
+        on_update recebe a mensagem com status de erro.
         """
         try:
+            self.recorder.on_auto_stop = on_auto_stop
             if not self.recorder.start_recording():
                 return False
                 
-            # Criar mensagem inicial
+            # Criar mensagem inicial com ID gerado localmente
             device_id = get_or_create_device_id()
             message = Message(
-                id="",  # Será definido pelo Firestore
+                id=new_document_id(),
                 threadId=thread_id,
                 ownerId=device_id,
                 kind=MessageKind.AUDIO,
@@ -210,9 +285,8 @@ class AudioRecorderManager:
                 status=MessageStatus.RECORDING
             )
             
-            # Salvar mensagem no Firestore
-            message_id = self.firestore_manager.save_message(message)
-            message.id = message_id
+            # Salvar mensagem no Firestore sem esperar a rede
+            self._save_in_background(message, on_update)
             
             # Notificar callback
             on_complete(message)
@@ -223,6 +297,32 @@ class AudioRecorderManager:
             logger.error(f"Erro ao iniciar gravação: {e}")
             return False
             
+    def _save_in_background(self, message: Message, on_update: Optional[Callable[[str, Message], None]]) -> None:
+        """Gravar a mensagem inicial em segundo plano, notificando on_update em caso de falha"""
+        future = self._write_executor.submit(self.writer.save_message, message)
+        with self._pending_lock:
+            self._pending_writes[message.id] = future
+            
+        def done(completed: Future):
+            with self._pending_lock:
+                self._pending_writes.pop(message.id, None)
+            error = completed.exception()
+            if error is None:
+                return
+            logger.error(f"Erro ao salvar mensagem {message.id} em segundo plano: {error}")
+            if on_update:
+                on_update(message.id, dataclasses.replace(message, status=MessageStatus.ERROR,
+                                                          error=f"Falha ao salvar mensagem: {error}"))
+                
+        future.add_done_callback(done)
+        
+    def _wait_for_save(self, message_id: str) -> None:
+        """Aguardar a gravação pendente da mensagem inicial (propaga a falha)"""
+        with self._pending_lock:
+            future = self._pending_writes.get(message_id)
+        if future is not None:
+            future.result()
+            
     def stop_recording(self, message: Message, on_update: Optional[Callable[[str, Message], None]] = None) -> bool:
         """
         Parar gravação e processar áudio - igual ao mobile
@@ -234,29 +334,36 @@ class AudioRecorderManager:
                 logger.error("Falha ao obter dados de áudio")
                 return False
                 
-            # Converter para base64
-            audio_base64 = base64.b64encode(audio_data).decode('utf-8')
+            # Comprimir (FLAC/Opus) e converter para base64
+            encoded = encode_audio(self.encoder, audio_data)
+            if len(encoded.data) > self.recorder.MAX_FILE_SIZE:
+                logger.warning(f"Arquivo muito grande: {len(encoded.data)} bytes (mantido em {self.recorder.file_path})")
+                return False
+            audio_base64 = base64.b64encode(encoded.data).decode('utf-8')
             
             # Atualizar mensagem com payload de áudio
             audio_payload = AudioPayload(
                 base64=audio_base64,
-                contentType='audio/wav',
-                durationSec=self.recorder.get_duration(),
-                sizeBytes=len(audio_data)
+                contentType=encoded.contentType,
+                durationSec=self.recorder.get_recorded_duration(),
+                sizeBytes=len(encoded.data)
             )
             
-            # Atualizar status para transcribing
-            self.firestore_manager.update_message_status(message.id, MessageStatus.TRANSCRIBING)
-            
-            # Atualizar payload
-            self.firestore_manager.update_message_payload(message.id, {
-                'audio': {
-                    'base64': audio_payload.base64,
-                    'contentType': audio_payload.contentType,
-                    'durationSec': audio_payload.durationSec,
-                    'sizeBytes': audio_payload.sizeBytes
-                }
-            })
+            # A mensagem precisa existir no Firestore antes das atualizações
+            self._wait_for_save(message.id)
+            
+            # Atualizar status para transcribing e payload em um único commit
+            with self.writer.batch() as batch:
+                batch.update_status(message.id, MessageStatus.TRANSCRIBING, thread_id=message.threadId)
+                batch.update_payload(message.id, {
+                    'audio': {
+                        'base64': audio_payload.base64,
+                        'contentType': audio_payload.contentType,
+                        'durationSec': audio_payload.durationSec,
+                        'sizeBytes': audio_payload.sizeBytes
+                    }
+                }, thread_id=message.threadId)
+            self.recorder.discard_recording()
             
             # Notificar callback se fornecido
             if on_update:
@@ -279,9 +386,66 @@ class AudioRecorderManager:
             logger.error(f"Erro ao processar gravação: {e}")
             return False
             
+    def get_recovered_recordings(self) -> List[str]:
+        """Gravações recuperadas de uma falha, ainda não enviadas nem descartadas"""
+        return list(self.recovered_recordings)
+        
+    def upload_recovered_recording(self, path: str, thread_id: str,
+                                   on_complete: Optional[Callable[[Message], None]] = None) -> bool:
+        """
+        Enviar uma gravação recuperada como nova mensagem de áudio da thread
+        
+        A mensagem é criada já com o áudio e status pending (data de criação =
+        última escrita no arquivo), aguardando que a transcrição seja pedida;
+        o arquivo é removido após o envio.
+        """
+        try:
+            with open(path, 'rb') as f:
+                wav_data = f.read()
+                
+            encoded = encode_audio(self.encoder, wav_data)
+            if len(encoded.data) > self.recorder.MAX_FILE_SIZE:
+                logger.warning(f"Gravação recuperada muito grande: {len(encoded.data)} bytes (mantida em {path})")
+                return False
+                
+            message = Message(
+                id=new_document_id(),
+                threadId=thread_id,
+                ownerId=get_or_create_device_id(),
+                kind=MessageKind.AUDIO,
+                source=MessageSource.DESKTOP,
+                createdAt=int(os.path.getmtime(path) * 1000),
+                payload=MessagePayload(audio=AudioPayload(
+                    base64=base64.b64encode(encoded.data).decode('utf-8'),
+                    contentType=encoded.contentType,
+                    durationSec=int(round(recording_duration(path))),
+                    sizeBytes=len(encoded.data)
+                )),
+                status=MessageStatus.PENDING
+            )
+            self.writer.save_message(message)
+            self.discard_recovered_recording(path)
+            
+            if on_complete:
+                on_complete(message)
+                
+            logger.info(f"Gravação recuperada enviada: {path} -> {message.id}")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Erro ao enviar gravação recuperada {path}: {e}")
+            return False
+            
+    def discard_recovered_recording(self, path: str) -> None:
+        """Remover uma gravação recuperada"""
+        remove_recording(path)
+        if path in self.recovered_recordings:
+            self.recovered_recordings.remove(path)
+            
     def get_recording_status(self) -> Dict[str, Any]:
         """Obter status da gravação"""
         return {
             'isRecording': self.recorder.is_recording_active(),
-            'duration': self.recorder.get_duration()
+            'duration': self.recorder.get_duration(),
+            'trimmedSeconds': self.recorder.trimmed_seconds
         }
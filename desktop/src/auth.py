@@ -26,11 +26,9 @@ class AuthManager:
         self._initialize_firebase()
         
     def _initialize_firebase(self):
-        """Inicializar Firebase Client SDK"""
+        """Inicializar acesso ao Firestore usando o cliente compartilhado"""
         try:
-            # Importar Firebase Client SDK
-            import firebase_admin
-            from firebase_admin import credentials, firestore
+            from .clients import client_registry, get_firestore_client
             
             # Obter caminho da chave de serviço
             service_account_path = os.getenv('FIREBASE_SERVICE_ACCOUNT_KEY_PATH')
@@ -40,19 +38,18 @@ class AuthManager:
                 service_account_path = '/home/jesus/Progetos/Totari/desktop/totari-real-firebase-adminsdk-fbsvc-9dab005a86.json'
             
             if service_account_path and os.path.exists(service_account_path):
-                # Usar chave de serviço
-                cred = credentials.Certificate(service_account_path)
-                firebase_admin.initialize_app(cred)
-                self.db = firestore.client()
+                # Usar chave de serviço no cliente compartilhado
+                client_registry.set_service_account_path(service_account_path)
+                self.db = get_firestore_client()
                 self.firebase_initialized = True
-                logger.info("Firebase Admin SDK inicializado com chave de serviço")
+                logger.info("Firestore inicializado com chave de serviço")
             else:
                 logger.warning(f"Chave de serviço não encontrada em: {service_account_path}")
                 self.firebase_initialized = False
                 self.db = None
                     
         except ImportError:
-            logger.warning("Firebase Admin SDK não disponível")
+            logger.warning("Google Cloud Firestore não disponível")
             self.firebase_initialized = False
             self.db = None
         except Exception as e:
@@ -0,0 +1,148 @@
+"""
+Registro compartilhado de clientes do Google Cloud para Totari Desktop
+Cada cliente (Firestore, Firestore assíncrono, Storage) é criado uma única
+vez, no primeiro uso, e reutilizado por todos os gerenciadores
+"""
+
+import os
+import asyncio
+import inspect
+import threading
+import logging
+from typing import Any, Callable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+class ClientRegistry:
+    """Registro de clientes por processo, com inicialização preguiçosa"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients: Dict[Any, Any] = {}
+        self._credentials = None
+        self._credentials_loaded = False
+        # Chave de serviço informada pelo app (sem ela, variáveis de ambiente)
+        self._service_account_path: Optional[str] = None
+        # Fechamentos assíncronos em andamento (referências até terminarem)
+        self._closing: Set[asyncio.Future] = set()
+        
+    def set_service_account_path(self, path: Optional[str]) -> None:
+        """Usar a chave de serviço em path nos clientes criados a partir de agora"""
+        with self._lock:
+            self._service_account_path = path
+            self._credentials = None
+            self._credentials_loaded = False
+            
+    def _get(self, key: Any, factory: Callable[[], Any]) -> Any:
+        """Obter cliente existente ou criá-lo sob lock"""
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+            
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = factory()
+                self._clients[key] = client
+                logger.info(f"Cliente criado: {key}")
+            return client
+            
+    def _load_credentials(self):
+        """Carregar a chave de serviço uma única vez (None = credenciais padrão do ambiente)"""
+        if not self._credentials_loaded:
+            service_account_path = (self._service_account_path or os.getenv('FIREBASE_SERVICE_ACCOUNT_KEY_PATH')
+                                    or os.getenv('GOOGLE_APPLICATION_CREDENTIALS'))
+            if service_account_path and os.path.exists(service_account_path):
+                from google.oauth2 import service_account
+                self._credentials = service_account.Credentials.from_service_account_file(service_account_path)
+            self._credentials_loaded = True
+        return self._credentials
+        
+    def _client_kwargs(self, project_id: Optional[str] = None) -> Dict[str, Any]:
+        credentials = self._load_credentials()
+        kwargs: Dict[str, Any] = {}
+        if credentials is not None:
+            kwargs['credentials'] = credentials
+            kwargs['project'] = project_id or credentials.project_id
+        elif project_id:
+            kwargs['project'] = project_id
+        return kwargs
+        
+    def firestore(self):
+        """Cliente síncrono do Firestore"""
+        def create():
+            from google.cloud import firestore
+            return firestore.Client(**self._client_kwargs())
+        return self._get('firestore', create)
+        
+    def async_firestore(self):
+        """Cliente assíncrono do Firestore (vinculado ao event loop em que for usado)"""
+        def create():
+            from google.cloud import firestore
+            return firestore.AsyncClient(**self._client_kwargs())
+        return self._get('async_firestore', create)
+        
+    def storage(self, project_id: Optional[str] = None):
+        """Cliente do Cloud Storage por projeto"""
+        def create():
+            from google.cloud import storage
+            return storage.Client(**self._client_kwargs(project_id))
+        return self._get(('storage', project_id), create)
+        
+    def install(self, key: Any, client: Any) -> None:
+        """Registrar um cliente já criado (ex.: backend em memória para benchmarks)"""
+        with self._lock:
+            self._clients[key] = client
+        logger.info(f"Cliente registrado: {key}")
+        
+    def reset(self) -> None:
+        """Descartar clientes criados (os próximos usos criam novos)"""
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            self._close(client)
+            
+    def _close(self, client: Any) -> None:
+        """Fechar um cliente, aguardando o fechamento dos clientes assíncronos"""
+        close = getattr(client, 'close', None)
+        if close is None:
+            return
+        try:
+            result = close()
+            if not inspect.isawaitable(result):
+                return
+                
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = None
+                
+            if loop is None:
+                asyncio.run(_await(result))
+            else:
+                # Dentro de um event loop não dá para bloquear: concluir em segundo plano
+                task = loop.create_task(_await(result))
+                self._closing.add(task)
+                task.add_done_callback(self._closing.discard)
+                
+        except Exception as e:
+            logger.error(f"Erro ao fechar cliente: {e}")
+
+async def _await(awaitable) -> Any:
+    return await awaitable
+
+# Instância global
+client_registry = ClientRegistry()
+
+def get_firestore_client():
+    """Função de conveniência"""
+    return client_registry.firestore()
+
+def get_async_firestore_client():
+    """Função de conveniência"""
+    return client_registry.async_firestore()
+
+def get_storage_client(project_id: Optional[str] = None):
+    """Função de conveniência"""
+    return client_registry.storage(project_id)
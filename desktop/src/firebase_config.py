@@ -24,7 +24,13 @@ DESKTOP_CONFIG = {
     'max_audio_duration': int(os.getenv('MAX_AUDIO_DURATION', '1200')),  # 20 minutos
     'min_audio_duration': int(os.getenv('MIN_AUDIO_DURATION', '1')),  # 1 segundo
     'max_file_size': int(os.getenv('MAX_FILE_SIZE', '26214400')),  # 25MB
-    'audio_format': os.getenv('AUDIO_FORMAT', 'wav'),
-    'audio_sample_rate': int(os.getenv('AUDIO_SAMPLE_RATE', '44100')),
-    'audio_channels': int(os.getenv('AUDIO_CHANNELS', '1'))
+    'audio_format': os.getenv('AUDIO_FORMAT', 'flac'),  # wav, flac ou opus
+    'audio_sample_rate': int(os.getenv('AUDIO_SAMPLE_RATE', '16000')),  # taxa das gravações enviadas
+    'audio_channels': int(os.getenv('AUDIO_CHANNELS', '1')),
+    'vad_enabled': os.getenv('VAD_ENABLED', 'true').lower() == 'true',  # remover silêncio inicial/final
+    'vad_silence_timeout': float(os.getenv('VAD_SILENCE_TIMEOUT', '60')),  # segundos de silêncio até parar (0 = nunca)
+    'vad_max_pause': float(os.getenv('VAD_MAX_PAUSE', '0')),  # encurtar pausas internas para N segundos (0 = manter)
+    'recordings_retention_days': float(os.getenv('RECORDINGS_RETENTION_DAYS', '7')),  # gravações recuperadas não enviadas (0 = manter)
+    'local_store_max_bytes': int(os.getenv('LOCAL_STORE_MAX_BYTES', '209715200')),  # 200MB
+    'prefetch_threads': int(os.getenv('PREFETCH_THREADS', '5'))
 }
@@ -3,66 +3,943 @@ Módulo para integração com Firestore
 Implementação idêntica ao mobile
 """
 
+import bisect
+import dataclasses
+import random
 import logging
-from typing import List, Dict, Any, Optional, Callable
-from datetime import datetime
+import secrets
+import string
+import threading
+import time
+import zlib
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Callable, Tuple
+from datetime import datetime, timedelta, timezone
 from google.cloud.firestore_v1.base_query import FieldFilter
 from google.cloud import firestore
 
-from .types import Message, Thread, MessageKind, MessageStatus, MessageSource, message_to_dict, message_from_dict, thread_to_dict, thread_from_dict
+from .types import Message, Thread, ThreadSummary, MessageKind, MessageStatus, MessageSource, MessageCursor, MessagePage, MessageChanges, ThreadChanges, ThreadCounts, message_to_dict, message_from_dict, thread_to_dict, thread_from_dict, decode_message, decode_thread, decode_thread_summary, timestamp_to_ms
 from .device_id import get_or_create_device_id
+from .clients import get_firestore_client
 
 logger = logging.getLogger(__name__)
 
+# Tamanho padrão de página ao carregar mensagens
+DEFAULT_PAGE_SIZE = 50
+
+# Limite de operações por WriteBatch imposto pelo Firestore
+MAX_BATCH_WRITES = 500
+
+# Mensagens por commit: cada uma gera até quatro escritas (criação, atualização, shard de
+# atividade e updatedAt da thread)
+MAX_BATCH_MESSAGES = MAX_BATCH_WRITES // 4
+
+# Tamanho máximo da prévia da última mensagem guardada no resumo da thread
+PREVIEW_LENGTH = 140
+
+# Documentos de atividade por thread (threads/{id}/activity/{n}); escritas
+# concorrentes na mesma thread se distribuem entre eles
+ACTIVITY_SHARDS = 8
+
+# Intervalo mínimo entre atualizações de threads/{id}.updatedAt feitas por este cliente (segundos)
+THREAD_TOUCH_INTERVAL = 30.0
+
+# Paralelismo da exclusão em cascata de threads
+DELETE_WORKERS = 8
+
+# Consultas count() simultâneas em get_threads_counts
+COUNT_WORKERS = 8
+
+# Status contados como transcrição pendente
+PENDING_STATUSES = [MessageStatus.PENDING.value, MessageStatus.RECORDING.value, MessageStatus.TRANSCRIBING.value]
+
+# Campos lidos no modo resumo: omite payload.audio.base64 e payload.transcript.words
+MESSAGE_SUMMARY_FIELDS = [
+    'threadId', 'ownerId', 'kind', 'source', 'createdAt', 'status', 'error',
+    'payload.audio.contentType', 'payload.audio.durationSec', 'payload.audio.sizeBytes',
+    'payload.transcript.text', 'payload.transcript.languageCode', 'payload.transcript.confidence',
+    'payload.improvement', 'payload.note',
+]
+
+# Alfabeto dos IDs automáticos do Firestore
+_AUTO_ID_ALPHABET = string.ascii_letters + string.digits
+
+def new_document_id() -> str:
+    """Gerar no cliente um ID de documento no mesmo formato dos IDs automáticos do Firestore"""
+    return ''.join(secrets.choice(_AUTO_ID_ALPHABET) for _ in range(20))
+
+def payload_field_paths(payload_updates: Dict[str, Any]) -> Dict[str, Any]:
+    """Converter atualizações de payload em caminhos de campo (payload.audio, payload.transcript...)"""
+    return {f'payload.{key}': value for key, value in payload_updates.items()}
+
+def _deep_merge(current: Any, updates: Any) -> Any:
+    """Mesclar recursivamente dicionários; outros valores são substituídos"""
+    if not isinstance(current, dict) or not isinstance(updates, dict):
+        return updates
+    merged = dict(current)
+    for key, value in updates.items():
+        merged[key] = _deep_merge(current.get(key), value)
+    return merged
+
+def message_from_snapshot(doc) -> Message:
+    """Converter documento do Firestore para Message"""
+    return decode_message(doc.to_dict(), doc.id)
+
+def thread_from_snapshot(doc) -> Thread:
+    """Converter documento do Firestore para Thread"""
+    return decode_thread(doc.to_dict(), doc.id)
+
+# Início do intervalo de createdAt gravados como timestamp (o de números começa em 0)
+_EPOCH = datetime.fromtimestamp(0, tz=timezone.utc)
+
+def created_at_order_key(value: Any) -> int:
+    """Posição cronológica (ns) de um createdAt gravado em ms (desktop) ou como timestamp (mobile)"""
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        # DatetimeWithNanoseconds guarda os nanossegundos além dos microssegundos
+        return (value - _EPOCH) // timedelta(microseconds=1) * 1000 + getattr(value, 'nanosecond', 0) % 1000
+    return int(value * 1_000_000)
+
+def _cursor_value(cursor: MessageCursor, timestamp: bool) -> Any:
+    """Posição do cursor no tipo de createdAt de uma das consultas"""
+    value = cursor.createdAt if cursor.value is None else cursor.value
+    if isinstance(value, datetime) == timestamp:
+        return value
+    if timestamp:
+        return _EPOCH + timedelta(milliseconds=value)
+    return created_at_order_key(value) / 1_000_000
+
+def messages_page_queries(messages_ref, thread_id: str, page_size: int, cursor: Optional[MessageCursor],
+                          direction: str, summary: bool) -> List[Any]:
+    """
+    Consultas de uma página de mensagens (síncronas ou assíncronas), uma por tipo de createdAt
+    
+    O desktop grava createdAt em ms e o mobile como timestamp do servidor;
+    o Firestore ordena todos os números antes de todos os timestamps, então
+    cada tipo é consultado separadamente (filtro de intervalo no próprio
+    tipo) e os resultados são intercalados por merge_page_results.
+    """
+    if direction not in ('older', 'newer'):
+        raise ValueError(f"Direção de paginação inválida: {direction}")
+        
+    # Ordenar por createdAt e pelo ID do documento para desempate estável
+    order = firestore.Query.DESCENDING if direction == 'older' else firestore.Query.ASCENDING
+    queries = []
+    for lower in (0, _EPOCH):
+        query = (messages_ref
+                 .where(filter=FieldFilter('threadId', '==', thread_id))
+                 .where(filter=FieldFilter('createdAt', '>=', lower))
+                 .order_by('createdAt', direction=order)
+                 .order_by('__name__', direction=order))
+        
+        if summary:
+            query = query.select(MESSAGE_SUMMARY_FIELDS)
+        if cursor is not None:
+            query = query.start_after([_cursor_value(cursor, lower is _EPOCH), cursor.id])
+            
+        # Buscar um documento extra para saber se existem mais páginas
+        queries.append(query.limit(page_size + 1))
+    return queries
+
+def merge_page_results(results: List[List[Any]], direction: str) -> List[Any]:
+    """Intercalar os documentos das consultas de messages_page_queries na ordem da página"""
+    docs = [doc for docs in results for doc in docs]
+    docs.sort(key=lambda doc: (created_at_order_key(doc.get('createdAt')), doc.id), reverse=direction == 'older')
+    return docs
+
+def message_cursor(doc) -> MessageCursor:
+    """Cursor na posição de um documento de mensagem, com o createdAt como gravado"""
+    value = doc.get('createdAt')
+    return MessageCursor(createdAt=timestamp_to_ms(value), id=doc.id, value=value)
+
+def messages_page_from_docs(docs: List[Any], page_size: int, direction: str) -> MessagePage:
+    """Montar MessagePage em ordem cronológica a partir dos documentos da consulta"""
+    has_more = len(docs) > page_size
+    docs = docs[:page_size]
+    
+    if direction == 'older':
+        docs = docs[::-1]
+        
+    page = MessagePage(messages=[message_from_snapshot(doc) for doc in docs], has_more=has_more)
+    if docs:
+        page.older_cursor = message_cursor(docs[0])
+        page.newer_cursor = message_cursor(docs[-1])
+    return page
+
+def status_update_data(status: MessageStatus, error: Optional[str] = None) -> Dict[str, Any]:
+    """Campos gravados ao atualizar o status de uma mensagem"""
+    update_data = {
+        'status': status.value,
+        'updatedAt': firestore.SERVER_TIMESTAMP
+    }
+    if error is not None:
+        update_data['error'] = error
+    return update_data
+
+def threads_changed_since_queries(threads_ref, watermark: int) -> List[Any]:
+    """
+    Consultas de threads com updatedAt >= watermark
+    
+    O campo updatedAt pode estar gravado como número (ms) ou como timestamp
+    do servidor; o Firestore só compara valores do mesmo tipo, então é
+    feita uma consulta para cada representação.
+    """
+    watermark_dt = datetime.fromtimestamp(watermark / 1000, tz=timezone.utc)
+    return [threads_ref.where(filter=FieldFilter('updatedAt', '>=', value)) for value in (watermark, watermark_dt)]
+
+def thread_message_refs_query(messages_ref, thread_id: str):
+    """Consulta paginável (apenas IDs) das mensagens de uma thread, um lote de escrita por página"""
+    return (messages_ref
+            .where(filter=FieldFilter('threadId', '==', thread_id))
+            .order_by('__name__')
+            .select(['__name__'])
+            .limit(MAX_BATCH_WRITES))
+
+class ThreadListCache:
+    """Lista de threads em cache com a marca d'água (maior updatedAt visto)"""
+    
+    def __init__(self):
+        self._threads: Dict[str, Thread] = {}
+        self.watermark: Optional[int] = None
+        # True após a primeira sincronização completa (lista vazia passa a ser confiável)
+        self.loaded = False
+        
+    def replace(self, threads: List[Thread]) -> None:
+        """Substituir todo o conteúdo (sincronização completa)"""
+        self._threads = {thread.id: thread for thread in threads}
+        self.watermark = max((t.updatedAt for t in threads), default=None)
+        self.loaded = True
+        
+    def merge(self, thread: Thread) -> None:
+        """Mesclar uma thread alterada"""
+        self._threads[thread.id] = thread
+        if self.watermark is None or thread.updatedAt > self.watermark:
+            self.watermark = thread.updatedAt
+            
+    def discard(self, thread_id: str) -> None:
+        """Remover thread do cache"""
+        self._threads.pop(thread_id, None)
+        
+    def apply(self, changes: ThreadChanges) -> None:
+        """Aplicar as alterações recebidas de um listener"""
+        if changes.initial:
+            self.replace(changes.added)
+        else:
+            for thread in changes.added:
+                self.merge(thread)
+        for thread in changes.modified:
+            self.merge(thread)
+        for thread_id in changes.removed:
+            self.discard(thread_id)
+            
+    def sorted(self) -> List[Thread]:
+        """Threads ordenadas por data de atualização (mais recente primeiro)"""
+        return sorted(self._threads.values(), key=lambda x: x.updatedAt, reverse=True)
+
+class ThreadActivityState:
+    """
+    Documentos de threads e shards de atividade vistos por um listener
+    
+    Os listeners da coleção threads e do grupo activity entregam alterações
+    separadas; a thread é remontada (documento + shards) só quando uma das
+    suas partes muda, e só é emitida depois que o documento chegou.
+    """
+    
+    def __init__(self):
+        self._docs: Dict[str, Thread] = {}
+        self._shards: Dict[str, Dict[str, Dict[str, Any]]] = defaultdict(dict)
+        self._emitted = set()
+        self.initialized = False
+        
+    def apply(self, changes: List[Any], initial: bool = False) -> ThreadChanges:
+        """Aplicar as alterações de um snapshot e retornar as threads afetadas"""
+        diff = ThreadChanges(initial=initial)
+        touched = set()
+        for change in changes:
+            doc = change.document
+            removed = change.type.name == 'REMOVED'
+            if doc.reference.parent.id == 'activity':
+                thread_id = doc.reference.parent.parent.id
+                if removed:
+                    self._shards[thread_id].pop(doc.id, None)
+                else:
+                    self._shards[thread_id][doc.id] = doc.to_dict()
+                touched.add(thread_id)
+            elif removed:
+                self._docs.pop(doc.id, None)
+                self._shards.pop(doc.id, None)
+                if doc.id in self._emitted:
+                    self._emitted.discard(doc.id)
+                    diff.removed.append(doc.id)
+            else:
+                self._docs[doc.id] = thread_from_snapshot(doc)
+                touched.add(doc.id)
+                
+        for thread_id in touched:
+            base = self._docs.get(thread_id)
+            if base is None:
+                continue
+            # thread_with_activity altera a thread: mesclar sobre uma cópia do documento
+            thread = thread_with_activity(dataclasses.replace(base), list(self._shards[thread_id].values()))
+            if thread_id in self._emitted:
+                diff.modified.append(thread)
+            else:
+                self._emitted.add(thread_id)
+                diff.added.append(thread)
+                
+        return diff
+
+class SingleFlight:
+    """
+    Coalescência de leituras idênticas em andamento
+    
+    A primeira chamada com uma chave executa a leitura; chamadas
+    concorrentes com a mesma chave aguardam e recebem o mesmo resultado.
+    Nada é guardado após a conclusão (não é um cache). Após uma escrita,
+    forget desassocia as leituras afetadas, que podem ter começado antes dela.
+    """
+    
+    def __init__(self):
+        self._in_flight: Dict[Any, Future] = {}
+        self._lock = threading.Lock()
+        
+    def do(self, key: Any, fetch: Callable[[], Any]) -> Any:
+        """Executar fetch, ou aguardar a execução em andamento com a mesma chave"""
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._in_flight[key] = future
+                
+        if not leader:
+            return future.result()
+            
+        try:
+            result = fetch()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                # A chave pode já apontar para uma leitura mais nova (forget)
+                if self._in_flight.get(key) is future:
+                    del self._in_flight[key]
+                    
+    def forget(self, match: Callable[[Any], bool]) -> None:
+        """Novas chamadas com chaves que satisfazem match fazem outra leitura (quem já aguarda não é afetado)"""
+        with self._lock:
+            for key in [key for key in self._in_flight if match(key)]:
+                del self._in_flight[key]
+                
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._in_flight)
+
+class ThreadTouchLimiter:
+    """
+    Coalescência das atualizações de updatedAt no documento da thread
+    
+    O mobile ordena as threads pelo updatedAt do documento e não lê os
+    shards de atividade. Cada thread tem o documento atualizado no máximo
+    uma vez a cada interval segundos; no resto do tempo a atividade vai só
+    para os shards, sem disputar o documento.
+    """
+    
+    def __init__(self, interval: float = THREAD_TOUCH_INTERVAL):
+        self.interval = interval
+        self._touched: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        
+    def take(self, thread_ids: List[str]) -> List[str]:
+        """Threads cujo documento deve ser atualizado agora (marcadas como atualizadas)"""
+        now = time.monotonic()
+        with self._lock:
+            due = [t for t in thread_ids if now - self._touched.get(t, float('-inf')) >= self.interval]
+            for thread_id in due:
+                self._touched[thread_id] = now
+        return due
+        
+    def release(self, thread_ids: List[str]) -> None:
+        """Desfazer take após uma falha no commit"""
+        with self._lock:
+            for thread_id in thread_ids:
+                self._touched.pop(thread_id, None)
+
+class ThreadCountsCache:
+    """
+    Contagens de mensagens por thread (badges), comuns aos gerenciadores síncrono e assíncrono
+    
+    Uma contagem vale enquanto o updatedAt da thread não muda e nenhuma
+    escrita de mensagem a invalida: uma mudança de status só grava o shard
+    quando a mensagem é a última dele, então o updatedAt não basta.
+    """
+    
+    def __init__(self):
+        # thread_id -> (updatedAt da thread, contagens)
+        self._counts: Dict[str, Tuple[int, ThreadCounts]] = {}
+        self._versions: Dict[str, int] = {}
+        self._resets = 0
+        self._lock = threading.Lock()
+        
+    def stale(self, threads: List[Thread], force: bool = False) -> Tuple[List[Thread], Dict[str, Tuple[int, int]]]:
+        """Threads a recontar e a versão de cada uma no início da contagem"""
+        with self._lock:
+            stale = [t for t in threads if force or self._counts.get(t.id, (None,))[0] != t.updatedAt]
+            return stale, {t.id: (self._resets, self._versions.get(t.id, 0)) for t in stale}
+            
+    def store(self, threads: List[Thread], results: List[Optional[ThreadCounts]],
+              versions: Dict[str, Tuple[int, int]]) -> Dict[str, ThreadCounts]:
+        """Guardar as contagens obtidas e retorná-las por ID"""
+        fresh = {}
+        with self._lock:
+            for thread, counts in zip(threads, results):
+                if counts is None:
+                    continue
+                fresh[thread.id] = counts
+                # Uma escrita durante a contagem: o resultado não vale para as próximas chamadas
+                if (self._resets, self._versions.get(thread.id, 0)) == versions[thread.id]:
+                    self._counts[thread.id] = (thread.updatedAt, counts)
+        return fresh
+        
+    def get(self, threads: List[Thread]) -> Dict[str, ThreadCounts]:
+        """Contagens em cache das threads informadas"""
+        with self._lock:
+            return {t.id: self._counts[t.id][1] for t in threads if t.id in self._counts}
+            
+    def invalidate(self, thread_ids: Optional[List[str]]) -> None:
+        """Descartar contagens (thread_ids None = de todas as threads)"""
+        with self._lock:
+            if thread_ids is None:
+                self._counts.clear()
+                self._resets += 1
+                return
+            for thread_id in thread_ids:
+                self._counts.pop(thread_id, None)
+                self._versions[thread_id] = self._versions.get(thread_id, 0) + 1
+
+def cursor_key(cursor: Optional[MessageCursor]) -> Optional[Tuple[int, str, Any]]:
+    """Chave hashable de um cursor de paginação"""
+    return (cursor.createdAt, cursor.id, cursor.value) if cursor else None
+
+def message_preview(payload: Dict[str, Any]) -> Optional[str]:
+    """Texto de prévia de um payload (ou de uma atualização parcial de payload)"""
+    for key, text_field in (('improvement', 'texto_melhorado'), ('transcript', 'text'), ('note', 'text')):
+        section = payload.get(key)
+        if section and section.get(text_field):
+            return section[text_field][:PREVIEW_LENGTH]
+    return None
+
+def last_message_fields(message_id: Optional[str], data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Campos summary.last* para a mensagem informada (None limpa os campos)"""
+    if data is None:
+        return {'lastMessageId': None, 'lastKind': None, 'lastStatus': None, 'lastPreview': '', 'lastMessageAt': None}
+    return {
+        'lastMessageId': message_id,
+        'lastKind': data['kind'],
+        'lastStatus': data.get('status'),
+        'lastPreview': message_preview(data.get('payload') or {}) or '',
+        'lastMessageAt': data['createdAt'],
+    }
+
+def activity_shard(message_id: str) -> int:
+    """Shard de atividade de uma mensagem (fixo: todas as escritas da mensagem vão para o mesmo shard)"""
+    return zlib.crc32(message_id.encode('utf-8')) % ACTIVITY_SHARDS
+
+def activity_shard_ref(db, thread_id: str, shard: int):
+    """Referência do documento threads/{thread_id}/activity/{shard}"""
+    return db.collection('threads').document(thread_id).collection('activity').document(str(shard))
+
+def thread_activity_refs(db, thread_id: str) -> List[Any]:
+    """Documento da thread seguido de todos os seus shards de atividade"""
+    return [db.collection('threads').document(thread_id)] + [
+        activity_shard_ref(db, thread_id, shard) for shard in range(ACTIVITY_SHARDS)
+    ]
+
+def existing_documents(snapshots: List[Any]) -> Dict[str, Dict[str, Any]]:
+    """Dados dos documentos lidos que existem, por caminho"""
+    return {snapshot.reference.path: snapshot.to_dict() or {} for snapshot in snapshots if snapshot.exists}
+
+def thread_with_activity(thread: Thread, shards: List[Dict[str, Any]]) -> Thread:
+    """
+    Mesclar os shards de atividade na thread
+    
+    Contagens são somadas, a última mensagem é a de maior lastMessageAt e
+    updatedAt é o maior entre o documento da thread e os shards. Um resumo
+    gravado no próprio documento da thread entra como mais um shard.
+    """
+    if not shards:
+        return thread
+        
+    summaries = [thread.summary] if thread.summary else []
+    for data in shards:
+        summaries.append(decode_thread_summary(data))
+        if data.get('updatedAt') is not None:
+            thread.updatedAt = max(thread.updatedAt, timestamp_to_ms(data['updatedAt']))
+            
+    merged = ThreadSummary(
+        messageCount=sum(summary.messageCount for summary in summaries),
+        audioSeconds=sum(summary.audioSeconds for summary in summaries)
+    )
+    latest = max((s for s in summaries if s.lastMessageAt is not None), key=lambda s: s.lastMessageAt, default=None)
+    if latest is not None:
+        merged.lastMessageId = latest.lastMessageId
+        merged.lastKind = latest.lastKind
+        merged.lastStatus = latest.lastStatus
+        merged.lastPreview = latest.lastPreview
+        merged.lastMessageAt = latest.lastMessageAt
+        
+    thread.summary = merged
+    return thread
+
+def threads_from_snapshots(snapshots: List[Any]) -> List[Thread]:
+    """Montar threads, com a atividade mesclada, a partir de documentos de threads e de shards"""
+    threads: Dict[str, Thread] = {}
+    activity: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    
+    for snapshot in snapshots:
+        if not snapshot.exists:
+            continue
+        if snapshot.reference.parent.id == 'activity':
+            activity[snapshot.reference.parent.parent.id].append(snapshot.to_dict())
+        else:
+            threads[snapshot.id] = thread_from_snapshot(snapshot)
+            
+    return [thread_with_activity(thread, activity.get(thread.id, [])) for thread in threads.values()]
+
+def activity_changed_since_query(db, watermark: int):
+    """Shards de atividade (de todas as threads) alterados desde watermark"""
+    watermark_dt = datetime.fromtimestamp(watermark / 1000, tz=timezone.utc)
+    return db.collection_group('activity').where(filter=FieldFilter('updatedAt', '>=', watermark_dt))
+
+def _audio_seconds(payload: Optional[Dict[str, Any]]) -> float:
+    return ((payload or {}).get('audio') or {}).get('durationSec') or 0
+
+# Campos lidos antes de um commit de mensagens: áudio já gravado na mensagem e última mensagem do shard
+MESSAGE_WRITE_READ_FIELDS = ['payload.audio.durationSec', 'lastMessageId', 'lastMessageAt']
+
+class ThreadSummaryDelta:
+    """
+    Alterações acumuladas em um shard de atividade de uma thread
+    
+    Contagem de mensagens e segundos de áudio viram firestore.Increment;
+    quem registra as alterações garante que cada mensagem e cada áudio são
+    contados uma única vez. Os campos da última mensagem só mudam quando a
+    mensagem escrita é mais recente que a última gravada no shard.
+    
+    Args:
+        stored (Dict): lastMessageId e lastMessageAt lidos do shard
+    """
+    
+    def __init__(self, stored: Optional[Dict[str, Any]] = None):
+        self.message_count = 0
+        self.audio_seconds = 0
+        self.last: Dict[str, Any] = {}
+        self._last_key: Optional[tuple] = None
+        
+        stored = stored or {}
+        if stored.get('lastMessageAt') is not None:
+            self._last_key = (timestamp_to_ms(stored['lastMessageAt']), stored.get('lastMessageId'))
+            
+    @property
+    def last_message_id(self) -> Optional[str]:
+        """ID da última mensagem do shard, considerando as escritas registradas"""
+        return self._last_key[1] if self._last_key else None
+        
+    def offer_last(self, message_id: str, data: Dict[str, Any]) -> None:
+        """Tornar a mensagem a última do shard se for mais recente que a atual"""
+        key = (timestamp_to_ms(data['createdAt']), message_id)
+        if self._last_key is None or key > self._last_key:
+            self._last_key = key
+            self.last = last_message_fields(message_id, data)
+            
+    def clear_last(self) -> None:
+        """Limpar a última mensagem do shard"""
+        self._last_key = None
+        self.last = last_message_fields(None, None)
+        
+    def add_message(self, message_id: str, data: Dict[str, Any]) -> None:
+        """Registrar criação de mensagem"""
+        self.message_count += 1
+        self.audio_seconds += _audio_seconds(data.get('payload'))
+        self.offer_last(message_id, data)
+        
+    def update_message(self, message_id: str, status: Optional[str] = None,
+                       payload_updates: Optional[Dict[str, Any]] = None, count_audio: bool = False) -> None:
+        """
+        Registrar atualização de status ou payload de uma mensagem
+        
+        Args:
+            count_audio (bool): Somar o áudio do payload (primeiro áudio da mensagem)
+        """
+        if count_audio:
+            self.audio_seconds += _audio_seconds(payload_updates)
+        if message_id != self.last_message_id:
+            return
+            
+        if status is not None:
+            self.last['lastStatus'] = status
+        preview = message_preview(payload_updates or {})
+        if preview:
+            self.last['lastPreview'] = preview
+            
+    def remove_message(self, data: Dict[str, Any]) -> None:
+        """Registrar exclusão de mensagem"""
+        self.message_count -= 1
+        self.audio_seconds -= _audio_seconds(data.get('payload'))
+        
+    def to_shard_data(self) -> Dict[str, Any]:
+        """Campos a gravar (set com merge) no shard de atividade"""
+        data = dict(self.last)
+        if self.message_count:
+            data['messageCount'] = firestore.Increment(self.message_count)
+        if self.audio_seconds:
+            data['audioSeconds'] = firestore.Increment(self.audio_seconds)
+        if data:
+            data['updatedAt'] = firestore.SERVER_TIMESTAMP
+        return data
+
+def message_write_reads(db, message_ids: List[str], creates: Dict[str, Dict[str, Any]],
+                        summary_updates: Dict[str, Dict[str, Any]]) -> List[Any]:
+    """
+    Documentos a ler (com MESSAGE_WRITE_READ_FIELDS) antes de um commit que
+    altera a atividade das threads
+    
+    Mensagens criadas ou que recebem áudio (para não contá-las de novo num
+    reenvio), as threads afetadas (para não recriar shards de uma thread
+    deletada) e os shards afetados (para comparar com a última mensagem).
+    Lista vazia quando o commit não mexe na atividade.
+    """
+    messages_ref = db.collection('messages')
+    message_refs, shard_keys = [], set()
+    for message_id in message_ids:
+        data = creates.get(message_id)
+        entry = summary_updates.get(message_id)
+        if data is not None:
+            shard_keys.add((data['threadId'], activity_shard(message_id)))
+        if entry is not None:
+            shard_keys.add((entry['threadId'], activity_shard(message_id)))
+        if data is not None or (entry is not None and _audio_seconds(entry['payload'])):
+            message_refs.append(messages_ref.document(message_id))
+            
+    threads_ref = db.collection('threads')
+    thread_ids = sorted({thread_id for thread_id, _ in shard_keys})
+    return message_refs + [threads_ref.document(thread_id) for thread_id in thread_ids] + [
+        activity_shard_ref(db, thread_id, shard) for thread_id, shard in sorted(shard_keys)
+    ]
+
+def message_write_threads(message_ids: List[str], creates: Dict[str, Dict[str, Any]],
+                          summary_updates: Dict[str, Dict[str, Any]]) -> List[str]:
+    """Threads cuja atividade é alterada pelas mensagens informadas"""
+    thread_ids = {creates[m]['threadId'] for m in message_ids if m in creates}
+    thread_ids.update(summary_updates[m]['threadId'] for m in message_ids if m in summary_updates)
+    return sorted(thread_ids)
+
+def stage_message_writes(db, writer, message_ids: List[str], creates: Dict[str, Dict[str, Any]],
+                         updates: Dict[str, Dict[str, Any]], summary_updates: Dict[str, Dict[str, Any]],
+                         existing: Dict[str, Dict[str, Any]], touch: List[str] = ()) -> None:
+    """
+    Registrar escritas de mensagens e a atividade das threads afetadas
+    
+    writer pode ser um WriteBatch ou uma Transaction (síncronos ou
+    assíncronos); nenhuma leitura é feita aqui. A atividade de cada mensagem
+    vai para o seu shard (activity_shard); o documento da thread só recebe
+    updatedAt para as threads em touch (ver ThreadTouchLimiter). Threads que
+    não existem mais não recebem atividade.
+    
+    As escritas são idempotentes, já que a fila de escrita pode reenviá-las:
+    uma criação cuja mensagem já existe é ignorada, e o áudio só é somado na
+    primeira vez que a mensagem recebe um.
+    
+    Args:
+        existing: Documentos de message_write_reads que existem, por caminho
+        touch: Threads cujo documento deve ter updatedAt atualizado
+    """
+    messages_ref = db.collection('messages')
+    deltas: Dict[Tuple[str, int], ThreadSummaryDelta] = {}
+    # Mensagens cujo áudio já está contado na atividade
+    audio_counted = set()
+    
+    def delta_for(thread_id: str, message_id: str) -> ThreadSummaryDelta:
+        key = (thread_id, activity_shard(message_id))
+        if key not in deltas:
+            deltas[key] = ThreadSummaryDelta(existing.get(activity_shard_ref(db, *key).path))
+        return deltas[key]
+        
+    for message_id in message_ids:
+        message_ref = messages_ref.document(message_id)
+        stored = existing.get(message_ref.path)
+        if stored is not None and _audio_seconds(stored.get('payload')):
+            audio_counted.add(message_id)
+            
+        data = creates.get(message_id)
+        if data is not None and stored is None:
+            writer.create(message_ref, data)
+            delta_for(data['threadId'], message_id).add_message(message_id, data)
+            if _audio_seconds(data.get('payload')):
+                audio_counted.add(message_id)
+        if message_id in updates:
+            writer.update(message_ref, {**updates[message_id], 'updatedAt': firestore.SERVER_TIMESTAMP})
+            
+    for message_id in message_ids:
+        entry = summary_updates.get(message_id)
+        if entry is None:
+            continue
+        count_audio = message_id not in audio_counted and bool(_audio_seconds(entry['payload']))
+        delta_for(entry['threadId'], message_id).update_message(message_id, entry['status'], entry['payload'], count_audio)
+        
+    threads_ref = db.collection('threads')
+    for (thread_id, shard), delta in deltas.items():
+        shard_data = delta.to_shard_data()
+        if shard_data and threads_ref.document(thread_id).path in existing:
+            writer.set(activity_shard_ref(db, thread_id, shard), shard_data, merge=True)
+            
+    for thread_id in touch:
+        thread_ref = threads_ref.document(thread_id)
+        if thread_ref.path in existing:
+            writer.update(thread_ref, {'updatedAt': firestore.SERVER_TIMESTAMP})
+
+class MessageWriteBuffer:
+    """Criações e atualizações de mensagens pendentes, comuns aos lotes síncrono e assíncrono"""
+    
+    def __init__(self, db, touches: Optional[ThreadTouchLimiter] = None,
+                 on_commit: Optional[Callable[[List[str], Optional[List[str]]], None]] = None):
+        self.db = db
+        self.touches = touches
+        # Recebe as mensagens e threads de cada commit (None = threads desconhecidas)
+        self.on_commit = on_commit
+        self._creates: Dict[str, Dict[str, Any]] = {}
+        self._updates: Dict[str, Dict[str, Any]] = {}
+        # Alterações que afetam o resumo da thread: message_id -> threadId, status, payload
+        self._summary: Dict[str, Dict[str, Any]] = {}
+        
+    def create(self, message_id: str, message_data: Dict[str, Any]):
+        """Agendar criação de mensagem (message_data sem o campo id)"""
+        self._creates[message_id] = message_data
+        return self
+        
+    def update_status(self, message_id: str, status: MessageStatus, error: Optional[str] = None,
+                      thread_id: Optional[str] = None):
+        """Agendar atualização de status (com thread_id, também do resumo da thread)"""
+        self._updates.setdefault(message_id, {}).update(status_update_data(status, error))
+        if thread_id:
+            self._summary_entry(message_id, thread_id)['status'] = status.value
+        return self
+        
+    def update_payload(self, message_id: str, payload_updates: Dict[str, Any], thread_id: Optional[str] = None):
+        """Agendar atualização de campos do payload (com thread_id, também do resumo da thread)"""
+        self._updates.setdefault(message_id, {}).update(payload_field_paths(payload_updates))
+        if thread_id:
+            self._summary_entry(message_id, thread_id)['payload'].update(payload_updates)
+        return self
+        
+    def _summary_entry(self, message_id: str, thread_id: str) -> Dict[str, Any]:
+        return self._summary.setdefault(message_id, {'threadId': thread_id, 'status': None, 'payload': {}})
+        
+    def _pending_ids(self) -> List[str]:
+        return list(dict.fromkeys([*self._creates, *self._updates]))
+        
+    def __len__(self) -> int:
+        return len(self._pending_ids())
+        
+    def _take_chunks(self) -> List[Tuple[List[str], Dict[str, Any], Dict[str, Any], Dict[str, Any]]]:
+        """Esvaziar o lote, dividindo-o em commits de até MAX_BATCH_MESSAGES mensagens"""
+        message_ids = self._pending_ids()
+        creates, updates, summary = self._creates, self._updates, self._summary
+        self._creates, self._updates, self._summary = {}, {}, {}
+        return [
+            (message_ids[start:start + MAX_BATCH_MESSAGES], creates, updates, summary)
+            for start in range(0, len(message_ids), MAX_BATCH_MESSAGES)
+        ]
+        
+    def _take_touches(self, message_ids: List[str], creates: Dict[str, Any], summary: Dict[str, Any]) -> List[str]:
+        """Threads do commit cujo documento deve ter updatedAt atualizado"""
+        if self.touches is None:
+            return []
+        return self.touches.take(message_write_threads(message_ids, creates, summary))
+        
+    def _release_touches(self, touch: List[str]) -> None:
+        """Devolver as threads reservadas por _take_touches quando o commit falha"""
+        if self.touches is not None:
+            self.touches.release(touch)
+            
+    def _committed(self, message_ids: List[str], creates: Dict[str, Any], summary: Dict[str, Any]) -> None:
+        """Avisar on_commit das mensagens e threads escritas"""
+        if self.on_commit is None:
+            return
+        # Atualizações sem thread_id: não se sabe a thread da mensagem
+        known = all(message_id in creates or message_id in summary for message_id in message_ids)
+        self.on_commit(message_ids, message_write_threads(message_ids, creates, summary) if known else None)
+
+class MessageWriteBatch(MessageWriteBuffer):
+    """
+    Agrupa criações e atualizações de mensagens em um único commit
+    
+    Atualizações para a mesma mensagem são mescladas em um único update;
+    o payload é atualizado por caminho de campo (payload.audio, payload.transcript),
+    sem leitura prévia do documento. A atividade das threads afetadas é
+    gravada no mesmo commit, nos shards das mensagens; nesse caso o commit
+    vira uma transação que lê antes só os campos de message_write_reads, para
+    que um reenvio não conte a mesma mensagem duas vezes.
+    """
+    
+    def commit(self) -> None:
+        """Enviar as operações pendentes, propagando as exceções do Firestore"""
+        for message_ids, creates, updates, summary in self._take_chunks():
+            read_refs = message_write_reads(self.db, message_ids, creates, summary)
+            if not read_refs:
+                batch = self.db.batch()
+                stage_message_writes(self.db, batch, message_ids, creates, updates, summary, {})
+                batch.commit()
+                self._committed(message_ids, creates, summary)
+                continue
+                
+            touch = self._take_touches(message_ids, creates, summary)
+            
+            @firestore.transactional
+            def write(transaction):
+                snapshots = self.db.get_all(read_refs, field_paths=MESSAGE_WRITE_READ_FIELDS, transaction=transaction)
+                stage_message_writes(self.db, transaction, message_ids, creates, updates, summary,
+                                     existing_documents(snapshots), touch)
+                
+            try:
+                write(self.db.transaction())
+            except Exception:
+                self._release_touches(touch)
+                raise
+            self._committed(message_ids, creates, summary)
+            
+    def flush(self) -> None:
+        """Enviar as operações pendentes em commits de até MAX_BATCH_MESSAGES mensagens"""
+        count = len(self)
+        if not count:
+            return
+            
+        try:
+            self.commit()
+            logger.info(f"Lote de escrita enviado: {count} mensagens")
+            
+        except Exception as e:
+            logger.error(f"Erro ao enviar lote de escrita: {e}")
+            raise Exception("Falha ao enviar lote de atualizações de mensagens")
+            
+    def __enter__(self) -> 'MessageWriteBatch':
+        return self
+        
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        # Só enviar se o bloco terminou sem erro
+        if exc_type is None:
+            self.flush()
+
 class FirestoreManager:
     """Gerenciador de integração com Firestore - igual ao mobile"""
     
     def __init__(self, auth_manager=None):
-        # Inicializar Firebase diretamente
-        from google.cloud import firestore
-        self.db = firestore.Client()
+        # Cliente compartilhado, criado no primeiro uso
+        self.db = get_firestore_client()
+        
+        # Cache da lista de threads para sincronização incremental
+        self.threads_cache = ThreadListCache()
+        
+        # Contagens por thread, invalidadas pelas escritas de mensagens
+        self._counts = ThreadCountsCache()
+        
+        # Leituras idênticas concorrentes (UI, StateManager, prefetch) compartilham uma chamada
+        self._reads = SingleFlight()
+        
+        # Atualizações de updatedAt no documento das threads (o mobile ordena por ele)
+        self._thread_touches = ThreadTouchLimiter()
+        
+    def batch(self) -> MessageWriteBatch:
+        """
+        Criar lote de atualizações de mensagens
+        
+        Uso:
+            with firestore_manager.batch() as batch:
+                batch.update_status(message_id, MessageStatus.TRANSCRIBING, thread_id=thread_id)
+                batch.update_payload(message_id, {'audio': {...}}, thread_id=thread_id)
+        """
+        if not self.db:
+            raise Exception("Firebase não inicializado")
+        return MessageWriteBatch(self.db, self._thread_touches, self._messages_written)
+        
+    def _messages_written(self, message_ids: List[str], thread_ids: Optional[List[str]]) -> None:
+        """Após um commit de mensagens: leituras em andamento e contagens das threads afetadas"""
+        self._forget_reads(message_ids, thread_ids)
+        self._counts.invalidate(thread_ids)
+        
+    def _forget_reads(self, message_ids: List[str], thread_ids: Optional[List[str]]) -> None:
+        """
+        Desassociar as leituras em andamento afetadas por uma escrita
+        
+        Uma leitura iniciada antes da escrita pode não refleti-la; quem lê
+        logo depois de escrever faz uma nova leitura em vez de aguardá-la.
+        Com thread_ids None, as leituras de todas as threads são afetadas.
+        """
+        message_ids = set(message_ids)
+        thread_ids = set(thread_ids) if thread_ids is not None else None
+        
+        def affected(key) -> bool:
+            if key[0] == 'message':
+                return key[1] in message_ids
+            return thread_ids is None or key[1] in thread_ids
+            
+        self._reads.forget(affected)
         
     def save_message(self, message: Message) -> str:
         """
         Salvar mensagem no Firestore - igual ao mobile
+        
+        A mensagem e o resumo da thread (contagem, última mensagem) são
+        gravados no mesmo commit.
         """
         if not self.db:
             raise Exception("Firebase não inicializado")
             
         try:
             message_dict = message_to_dict(message)
-            # Remover id do dict para criar novo documento
-            message_id = message_dict.pop('id')
+            # ID gerado no cliente quando a mensagem ainda não possui um
+            message_id = message_dict.pop('id') or new_document_id()
             
-            doc_ref = self.db.collection('messages').add(message_dict)
-            return doc_ref[1].id  # ID do documento criado
+            self.batch().create(message_id, message_dict).commit()
+            return message_id
             
         except Exception as e:
             logger.error(f"Erro ao salvar mensagem: {e}")
             raise Exception("Falha ao salvar mensagem")
             
-    def get_messages(self, thread_id: str, owner_id: str = None) -> List[Message]:
+    def get_messages(self, thread_id: str, owner_id: str = None, summary: bool = False) -> List[Message]:
         """
         Obter mensagens de uma thread (conversas globais)
+        
+        Args:
+            thread_id (str): ID da thread
+            owner_id (str): Mantido por compatibilidade (conversas são globais)
+            summary (bool): Omitir bytes de áudio e timings de palavras (ver get_message)
         """
         if not self.db:
             return []
             
+        messages = self._reads.do(('messages', thread_id, summary), lambda: self._fetch_messages(thread_id, summary))
+        # Cada chamador recebe sua própria lista (as mensagens decodificadas são compartilhadas)
+        return list(messages)
+        
+    def _fetch_messages(self, thread_id: str, summary: bool) -> List[Message]:
+        """Consultar todas as mensagens de uma thread"""
         try:
             messages_ref = self.db.collection('messages')
             # Buscar mensagens apenas por threadId (sem filtro de ownerId)
             query = messages_ref.where('threadId', '==', thread_id)
+            if summary:
+                query = query.select(MESSAGE_SUMMARY_FIELDS)
             docs = query.stream()
             
-            messages = []
-            for doc in docs:
-                data = doc.to_dict()
-                data['id'] = doc.id
-                # Converter timestamp do Firestore para timestamp Unix
-                if 'createdAt' in data and hasattr(data['createdAt'], 'timestamp'):
-                    data['createdAt'] = int(data['createdAt'].timestamp() * 1000)
-                messages.append(message_from_dict(data))
-                
+            messages = [message_from_snapshot(doc) for doc in docs]
+            
             # Ordenar por data de criação
             messages.sort(key=lambda x: x.createdAt)
             
@@ -73,69 +950,205 @@ class FirestoreManager:
             logger.error(f"Erro ao obter mensagens da thread {thread_id}: {e}")
             return []
             
-    def update_message_status(self, message_id: str, status: MessageStatus, error: Optional[str] = None) -> None:
+    def get_messages_page(self, thread_id: str, page_size: int = DEFAULT_PAGE_SIZE,
+                          cursor: Optional[MessageCursor] = None, direction: str = 'older',
+                          summary: bool = False) -> MessagePage:
+        """
+        Obter uma página de mensagens de uma thread ordenada por createdAt
+        
+        Args:
+            thread_id (str): ID da thread
+            page_size (int): Quantidade máxima de mensagens na página
+            cursor (MessageCursor): Posição a partir da qual buscar (None = mais recentes)
+            direction (str): 'older' para mensagens anteriores ao cursor,
+                'newer' para mensagens posteriores ao cursor
+            summary (bool): Omitir bytes de áudio e timings de palavras (ver get_message)
+            
+        Returns:
+            MessagePage: Mensagens em ordem cronológica e cursores para as páginas vizinhas
+        """
+        if not self.db:
+            return MessagePage(messages=[])
+            
+        key = ('messages_page', thread_id, page_size, cursor_key(cursor), direction, summary)
+        page = self._reads.do(key, lambda: self._fetch_messages_page(thread_id, page_size, cursor, direction, summary))
+        return dataclasses.replace(page, messages=list(page.messages))
+        
+    def _fetch_messages_page(self, thread_id: str, page_size: int, cursor: Optional[MessageCursor],
+                             direction: str, summary: bool) -> MessagePage:
+        """Consultar uma página de mensagens"""
+        queries = messages_page_queries(self.db.collection('messages'), thread_id, page_size, cursor, direction, summary)
+        
+        try:
+            docs = merge_page_results([list(query.stream()) for query in queries], direction)
+            page = messages_page_from_docs(docs, page_size, direction)
+            logger.info(f"Página com {len(page.messages)} mensagens da thread {thread_id} ({direction})")
+            return page
+            
+        except Exception as e:
+            logger.error(f"Erro ao obter página de mensagens da thread {thread_id}: {e}")
+            return MessagePage(messages=[])
+            
+    def get_message(self, message_id: str) -> Optional[Message]:
+        """
+        Obter uma mensagem completa (incluindo áudio e timings) por ID
+        """
+        if not self.db:
+            return None
+            
+        return self._reads.do(('message', message_id), lambda: self._fetch_message(message_id))
+        
+    def _fetch_message(self, message_id: str) -> Optional[Message]:
+        """Ler um documento de mensagem"""
+        try:
+            message_doc = self.db.collection('messages').document(message_id).get()
+            if message_doc.exists:
+                return message_from_snapshot(message_doc)
+            return None
+            
+        except Exception as e:
+            logger.error(f"Erro ao obter mensagem {message_id}: {e}")
+            return None
+            
+    def update_message_status(self, message_id: str, status: MessageStatus, error: Optional[str] = None,
+                              thread_id: Optional[str] = None) -> None:
         """
         Atualizar status da mensagem - igual ao mobile
+        
+        Com thread_id, o status da última mensagem no resumo da thread é
+        atualizado na mesma transação.
         """
         if not self.db:
             raise Exception("Firebase não inicializado")
             
         try:
-            message_ref = self.db.collection('messages').document(message_id)
-            update_data = {
-                'status': status.value,
-                'updatedAt': firestore.SERVER_TIMESTAMP
-            }
-            
-            if error is not None:
-                update_data['error'] = error
-                
-            message_ref.update(update_data)
+            self.batch().update_status(message_id, status, error, thread_id=thread_id).commit()
             
         except Exception as e:
             logger.error(f"Erro ao atualizar status da mensagem {message_id}: {e}")
             raise Exception("Falha ao atualizar status da mensagem")
             
-    def update_message_payload(self, message_id: str, payload_updates: Dict[str, Any]) -> None:
+    def update_message_payload(self, message_id: str, payload_updates: Dict[str, Any], transactional: bool = False,
+                               thread_id: Optional[str] = None) -> None:
         """
         Atualizar payload da mensagem - igual ao mobile
+        
+        Cada chave de payload_updates substitui o campo correspondente
+        (payload.audio, payload.transcript...) sem ler o documento.
+        
+        Args:
+            message_id (str): ID da mensagem
+            payload_updates (Dict): Campos do payload a atualizar
+            transactional (bool): Mesclar recursivamente com os valores atuais
+                dentro de uma transação, lendo apenas os campos alterados
+            thread_id (str): Atualizar também o resumo da thread
+                (segundos de áudio e prévia da última mensagem)
         """
         if not self.db:
             raise Exception("Firebase não inicializado")
             
         try:
-            message_ref = self.db.collection('messages').document(message_id)
-            
-            # Obter mensagem atual para merge com payload existente
-            current_doc = message_ref.get()
-            current_payload = {}
-            
-            if current_doc.exists:
-                current_data = current_doc.to_dict()
-                current_payload = current_data.get('payload', {})
-            
-            # Merge com atualizações
-            merged_payload = {**current_payload, **payload_updates}
-            
-            message_ref.update({
-                'payload': merged_payload,
-                'updatedAt': firestore.SERVER_TIMESTAMP
-            })
+            if transactional:
+                self._merge_message_payload(message_id, payload_updates, thread_id)
+                return
+                
+            self.batch().update_payload(message_id, payload_updates, thread_id=thread_id).commit()
             
         except Exception as e:
             logger.error(f"Erro ao atualizar payload da mensagem {message_id}: {e}")
             raise Exception("Falha ao atualizar payload da mensagem")
             
+    def _merge_message_payload(self, message_id: str, payload_updates: Dict[str, Any], thread_id: Optional[str]) -> None:
+        """Mesclar payload em transação, lendo apenas os campos que serão alterados"""
+        message_ref = self.db.collection('messages').document(message_id)
+        field_paths = list(payload_field_paths(payload_updates).keys())
+        summary = {message_id: {'threadId': thread_id, 'status': None, 'payload': payload_updates}} if thread_id else {}
+        # A própria mensagem já é lida com os campos alterados (inclui payload.audio quando há áudio)
+        read_refs = [ref for ref in message_write_reads(self.db, [message_id], {}, summary) if ref.path != message_ref.path]
+        touch = self._thread_touches.take([thread_id]) if thread_id else []
+        
+        @firestore.transactional
+        def merge(transaction):
+            snapshot = message_ref.get(field_paths=field_paths, transaction=transaction)
+            current_payload = (snapshot.to_dict() or {}).get('payload') or {} if snapshot.exists else {}
+            
+            existing = {}
+            if read_refs:
+                existing = existing_documents(self.db.get_all(read_refs, field_paths=MESSAGE_WRITE_READ_FIELDS,
+                                                              transaction=transaction))
+            existing.update(existing_documents([snapshot]))
+            
+            merged = {
+                key: _deep_merge(current_payload.get(key), value)
+                for key, value in payload_updates.items()
+            }
+            stage_message_writes(self.db, transaction, [message_id], {}, {message_id: payload_field_paths(merged)},
+                                 summary, existing, touch)
+            
+        try:
+            merge(self.db.transaction())
+        except Exception:
+            self._thread_touches.release(touch)
+            raise
+        self._forget_reads([message_id], [thread_id] if thread_id else None)
+        
     def delete_message(self, message_id: str) -> None:
         """
         Deletar mensagem - igual ao mobile
+        
+        A atividade da thread é ajustada na mesma transação; se a mensagem
+        era a última, a anterior passa a ser a última no shard dela.
         """
         if not self.db:
             raise Exception("Firebase não inicializado")
             
         try:
-            message_ref = self.db.collection('messages').document(message_id)
-            message_ref.delete()
+            messages_ref = self.db.collection('messages')
+            message_ref = messages_ref.document(message_id)
+            
+            @firestore.transactional
+            def delete(transaction):
+                snapshot = message_ref.get(field_paths=MESSAGE_SUMMARY_FIELDS, transaction=transaction)
+                if not snapshot.exists:
+                    return None
+                data = snapshot.to_dict()
+                thread_id = data['threadId']
+                thread_ref = self.db.collection('threads').document(thread_id)
+                shard_ref = activity_shard_ref(self.db, thread_id, activity_shard(message_id))
+                existing = existing_documents(self.db.get_all([thread_ref, shard_ref], field_paths=MESSAGE_WRITE_READ_FIELDS,
+                                                              transaction=transaction))
+                if thread_ref.path not in existing:
+                    # Thread deletada: não recriar shards órfãos
+                    transaction.delete(message_ref)
+                    return thread_id
+                    
+                delta = ThreadSummaryDelta(existing.get(shard_ref.path))
+                delta.remove_message(data)
+                previous_ref, previous_delta = None, None
+                if delta.last_message_id == message_id:
+                    delta.clear_last()
+                    
+                    # Página com as duas mais recentes: a que sai e a que passa a ser a última
+                    queries = messages_page_queries(messages_ref, thread_id, 1, None, 'older', summary=True)
+                    docs = merge_page_results([list(transaction.get(query)) for query in queries], 'older')
+                    previous = next((doc for doc in docs if doc.id != message_id), None)
+                    if previous is not None:
+                        previous_ref = activity_shard_ref(self.db, thread_id, activity_shard(previous.id))
+                        if previous_ref.path == shard_ref.path:
+                            previous_delta, previous_ref = delta, None
+                        else:
+                            stored = previous_ref.get(field_paths=MESSAGE_WRITE_READ_FIELDS, transaction=transaction)
+                            previous_delta = ThreadSummaryDelta(stored.to_dict())
+                        previous_delta.offer_last(previous.id, previous.to_dict())
+                        
+                transaction.delete(message_ref)
+                transaction.set(shard_ref, delta.to_shard_data(), merge=True)
+                if previous_ref is not None and previous_delta.last:
+                    transaction.set(previous_ref, previous_delta.to_shard_data(), merge=True)
+                return thread_id
+                
+            thread_id = delete(self.db.transaction())
+            self._messages_written([message_id], [thread_id] if thread_id else [])
             
         except Exception as e:
             logger.error(f"Erro ao deletar mensagem {message_id}: {e}")
@@ -150,11 +1163,12 @@ class FirestoreManager:
             
         try:
             thread_dict = thread_to_dict(thread)
-            # Remover id do dict para criar novo documento
-            thread_id = thread_dict.pop('id')
+            # ID gerado no cliente: a thread pode ser exibida antes da gravação
+            thread_id = thread_dict.pop('id') or new_document_id()
             
-            doc_ref = self.db.collection('threads').add(thread_dict)
-            return doc_ref[1].id  # ID do documento criado
+            self.db.collection('threads').document(thread_id).create(thread_dict)
+            self._forget_reads([], [thread_id])
+            return thread_id
             
         except Exception as e:
             logger.error(f"Erro ao salvar thread: {e}")
@@ -167,120 +1181,399 @@ class FirestoreManager:
         if not self.db:
             return None
             
+        return self._reads.do(('thread', thread_id), lambda: self._fetch_thread(thread_id))
+        
+    def _fetch_thread(self, thread_id: str) -> Optional[Thread]:
+        """Ler o documento da thread e seus shards de atividade"""
         try:
-            thread_ref = self.db.collection('threads').document(thread_id)
-            thread_doc = thread_ref.get()
-            
-            if thread_doc.exists:
-                data = thread_doc.to_dict()
-                data['id'] = thread_doc.id
-                # Converter timestamp do Firestore para timestamp Unix
-                if 'createdAt' in data and hasattr(data['createdAt'], 'timestamp'):
-                    data['createdAt'] = int(data['createdAt'].timestamp() * 1000)
-                if 'updatedAt' in data and hasattr(data['updatedAt'], 'timestamp'):
-                    data['updatedAt'] = int(data['updatedAt'].timestamp() * 1000)
-                return thread_from_dict(data)
-            
-            return None
+            # Documento da thread e shards de atividade em uma única leitura
+            threads = threads_from_snapshots(list(self.db.get_all(thread_activity_refs(self.db, thread_id))))
+            return threads[0] if threads else None
             
         except Exception as e:
             logger.error(f"Erro ao obter thread {thread_id}: {e}")
             return None
             
-    def get_threads(self, owner_id: str = None) -> List[Thread]:
+    def get_threads(self, owner_id: str = None, incremental: bool = False) -> List[Thread]:
         """
         Obter todas as threads (conversas globais)
+        
+        Args:
+            owner_id (str): Mantido por compatibilidade (conversas são globais)
+            incremental (bool): Buscar apenas threads alteradas desde a última
+                sincronização e mesclá-las no cache local
+                
+        Em caso de erro, retorna as threads já em cache.
         """
         if not self.db:
             return []
             
+        if incremental and self.threads_cache.watermark is not None:
+            return self._sync_threads_since(self.threads_cache.watermark)
+            
         try:
             threads_ref = self.db.collection('threads')
-            # Buscar todas as threads sem filtro de ownerId
-            docs = threads_ref.stream()
-            threads = []
-            for doc in docs:
-                data = doc.to_dict()
-                data['id'] = doc.id
-                # Converter timestamp do Firestore para timestamp Unix
-                if 'createdAt' in data and hasattr(data['createdAt'], 'timestamp'):
-                    data['createdAt'] = int(data['createdAt'].timestamp() * 1000)
-                if 'updatedAt' in data and hasattr(data['updatedAt'], 'timestamp'):
-                    data['updatedAt'] = int(data['updatedAt'].timestamp() * 1000)
-                threads.append(thread_from_dict(data))
-                
-            # Ordenar por data de atualização (mais recente primeiro)
-            threads.sort(key=lambda x: x.updatedAt, reverse=True)
+            # Buscar todas as threads sem filtro de ownerId, com os shards de atividade
+            docs = list(threads_ref.stream()) + list(self.db.collection_group('activity').stream())
+            threads = threads_from_snapshots(docs)
+            
+            self.threads_cache.replace(threads)
             
             logger.info(f"Encontradas {len(threads)} threads globais")
-            return threads
+            return self.threads_cache.sorted()
             
         except Exception as e:
             logger.error(f"Erro ao obter threads: {e}")
-            return []
+            return self.threads_cache.sorted()
+            
+    def _sync_threads_since(self, watermark: int) -> List[Thread]:
+        """Buscar apenas threads com documento ou atividade alterados desde watermark e mesclar no cache"""
+        try:
+            changed_ids = set()
+            for query in threads_changed_since_queries(self.db.collection('threads'), watermark):
+                changed_ids.update(doc.id for doc in query.stream())
+            changed_ids.update(doc.reference.parent.parent.id for doc in activity_changed_since_query(self.db, watermark).stream())
+            
+            if changed_ids:
+                refs = [ref for thread_id in sorted(changed_ids) for ref in thread_activity_refs(self.db, thread_id)]
+                for thread in threads_from_snapshots(list(self.db.get_all(refs))):
+                    self.threads_cache.merge(thread)
+                    
+            logger.info(f"Sincronização incremental: {len(changed_ids)} threads alteradas")
+            
+        except Exception as e:
+            logger.error(f"Erro na sincronização incremental de threads: {e}")
+            
+        return self.threads_cache.sorted()
+        
+    def get_message_counts(self, thread_id: str) -> Optional[ThreadCounts]:
+        """
+        Contar mensagens de uma thread com consultas de agregação count()
+        
+        Nenhum documento de mensagem é baixado; cada contagem custa uma
+        agregação.
+        """
+        if not self.db:
+            return None
+            
+        try:
+            query = self.db.collection('messages').where(filter=FieldFilter('threadId', '==', thread_id))
+            pending_query = query.where(filter=FieldFilter('status', 'in', PENDING_STATUSES))
+            
+            total = query.count(alias='total').get()[0][0].value
+            pending = pending_query.count(alias='pending').get()[0][0].value
+            return ThreadCounts(total=int(total), pending=int(pending))
+            
+        except Exception as e:
+            logger.error(f"Erro ao contar mensagens da thread {thread_id}: {e}")
+            return None
+            
+    def get_threads_counts(self, threads: List[Thread], force: bool = False,
+                           workers: int = COUNT_WORKERS) -> Dict[str, ThreadCounts]:
+        """
+        Obter contagens de várias threads, reaproveitando o cache
+        
+        Só threads cujo updatedAt mudou ou que receberam escritas de
+        mensagens desde a última contagem são consultadas novamente (todas,
+        com force); as consultas rodam em paralelo.
+        """
+        stale, versions = self._counts.stale(threads, force)
+        
+        fresh = {}
+        if stale:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(lambda t: self.get_message_counts(t.id), stale))
+            fresh = self._counts.store(stale, results, versions)
+            logger.info(f"Contagens atualizadas para {len(stale)} threads")
+            
+        return {**self._counts.get(threads), **fresh}
             
     def update_thread(self, thread_id: str, updates: Dict[str, Any]) -> None:
         """
         Atualizar thread - igual ao mobile
+        
+        updatedAt vai para o documento da thread junto com os campos
+        alterados. Sem campos, o documento só é tocado se não foi atualizado
+        nos últimos THREAD_TOUCH_INTERVAL segundos (o mobile ordena por ele);
+        caso contrário a data vai para um shard de atividade sorteado, para
+        que escritores concorrentes não disputem o mesmo documento.
         """
         if not self.db:
             raise Exception("Firebase não inicializado")
             
+        touch = []
         try:
-            thread_ref = self.db.collection('threads').document(thread_id)
-            update_data = {
-                **updates,
-                'updatedAt': firestore.SERVER_TIMESTAMP
-            }
-            thread_ref.update(update_data)
+            batch = self.db.batch()
+            touch = self._thread_touches.take([thread_id])
+            if updates or touch:
+                batch.update(self.db.collection('threads').document(thread_id),
+                             {**updates, 'updatedAt': firestore.SERVER_TIMESTAMP})
+            else:
+                shard_ref = activity_shard_ref(self.db, thread_id, random.randrange(ACTIVITY_SHARDS))
+                batch.set(shard_ref, {'updatedAt': firestore.SERVER_TIMESTAMP}, merge=True)
+            batch.commit()
+            self._forget_reads([], [thread_id])
             
         except Exception as e:
+            self._thread_touches.release(touch)
             logger.error(f"Erro ao atualizar thread {thread_id}: {e}")
             raise Exception("Falha ao atualizar thread")
             
-    def delete_thread(self, thread_id: str) -> None:
+    def delete_thread(self, thread_id: str, cascade: bool = False,
+                      on_progress: Optional[Callable[[int], None]] = None,
+                      workers: int = DELETE_WORKERS) -> int:
         """
         Deletar thread - igual ao mobile
+        
+        Com cascade, as mensagens da thread são listadas em páginas (apenas IDs)
+        e deletadas em lotes de escrita distribuídos entre vários workers (o
+        áudio fica no próprio documento da mensagem). O documento da thread e
+        seus shards de atividade são removidos por último, para que uma falha
+        no meio possa ser repetida.
+        
+        Args:
+            thread_id (str): ID da thread
+            cascade (bool): Deletar também as mensagens da thread
+            on_progress (Callable): Recebe o total de mensagens deletadas até o momento
+            workers (int): Quantidade de lotes enviados em paralelo
+            
+        Returns:
+            int: Quantidade de mensagens deletadas
         """
         if not self.db:
             raise Exception("Firebase não inicializado")
             
         try:
-            thread_ref = self.db.collection('threads').document(thread_id)
-            thread_ref.delete()
+            deleted = 0
+            
+            if cascade:
+                deleted = self._delete_thread_messages(thread_id, on_progress, workers)
+                
+            # Documento da thread e shards de atividade em um único commit
+            batch = self.db.batch()
+            for ref in thread_activity_refs(self.db, thread_id):
+                batch.delete(ref)
+            batch.commit()
+            self.threads_cache.discard(thread_id)
+            self._forget_reads([], [thread_id])
+            
+            logger.info(f"Thread {thread_id} deletada com {deleted} mensagens")
+            return deleted
             
         except Exception as e:
             logger.error(f"Erro ao deletar thread {thread_id}: {e}")
             raise Exception("Falha ao deletar thread")
             
-    def subscribe_to_messages(self, thread_id: str, device_id: str, on_update: Callable[[List[Message]], None]) -> Callable[[], None]:
+    def _delete_thread_messages(self, thread_id: str, on_progress: Optional[Callable[[int], None]], workers: int) -> int:
+        """Deletar mensagens da thread em lotes paralelos"""
+        query = thread_message_refs_query(self.db.collection('messages'), thread_id)
+        lock = threading.Lock()
+        deleted = 0
+        
+        def delete_chunk(doc_refs):
+            nonlocal deleted
+            batch = self.db.batch()
+            for doc_ref in doc_refs:
+                batch.delete(doc_ref)
+            batch.commit()
+            with lock:
+                deleted += len(doc_refs)
+                total = deleted
+            if on_progress:
+                on_progress(total)
+                
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = []
+            last_doc = None
+            while True:
+                page_query = query.start_after(last_doc) if last_doc is not None else query
+                docs = list(page_query.stream())
+                if not docs:
+                    break
+                futures.append(executor.submit(delete_chunk, [doc.reference for doc in docs]))
+                if len(docs) < MAX_BATCH_WRITES:
+                    break
+                last_doc = docs[-1]
+                
+            # Propagar a primeira falha, se houver
+            for future in futures:
+                future.result()
+                
+        return deleted
+        
+    def subscribe_to_messages(self, thread_id: str, on_changes: Callable[[MessageChanges], None],
+                              cache: Optional['MessageListCache'] = None) -> Callable[[], None]:
         """
-        Inscrever-se para atualizações em tempo real - igual ao mobile
+        Inscrever-se para atualizações em tempo real das mensagens de uma thread
+        
+        Apenas as alterações (ADDED, MODIFIED, REMOVED) de cada snapshot são
+        aplicadas ao cache ordenado e repassadas ao callback.
+        
+        Args:
+            thread_id (str): ID da thread
+            on_changes (Callable): Recebe um MessageChanges a cada snapshot
+            cache (MessageListCache): Cache ordenado a manter atualizado
+            
+        Returns:
+            Callable: Função para cancelar a inscrição
         """
         if not self.db:
             return lambda: None
             
+        cache = cache if cache is not None else MessageListCache(thread_id)
+        
         try:
-            messages_ref = self.db.collection('messages')
-            query = messages_ref.where('threadId', '==', thread_id).where('deviceId', '==', device_id)
+            query = self.db.collection('messages').where(filter=FieldFilter('threadId', '==', thread_id))
             
             def on_snapshot(query_snapshot, changes, read_time):
-                messages = []
-                for doc in query_snapshot:
-                    data = doc.to_dict()
-                    data['id'] = doc.id
-                    # Converter timestamp do Firestore para timestamp Unix
-                    if 'createdAt' in data and hasattr(data['createdAt'], 'timestamp'):
-                        data['createdAt'] = int(data['createdAt'].timestamp() * 1000)
-                    messages.append(message_from_dict(data))
-                
-                # Ordenar por data de criação
-                messages.sort(key=lambda x: x.createdAt)
-                on_update(messages)
+                try:
+                    diff = MessageChanges(threadId=thread_id)
+                    for change in changes:
+                        change_type = change.type.name
+                        if change_type == 'REMOVED':
+                            diff.removed.append(change.document.id)
+                        elif change_type == 'ADDED':
+                            diff.added.append(message_from_snapshot(change.document))
+                        else:
+                            diff.modified.append(message_from_snapshot(change.document))
+                            
+                    cache.apply(diff)
+                    if diff.added or diff.modified or diff.removed:
+                        on_changes(diff)
+                        
+                except Exception as e:
+                    logger.error(f"Erro ao aplicar alterações da thread {thread_id}: {e}")
+                    
+            watch = query.on_snapshot(on_snapshot)
+            return watch.unsubscribe
+            
+        except Exception as e:
+            logger.error(f"Erro ao se inscrever em mensagens da thread {thread_id}: {e}")
+            return lambda: None
+            
+    def subscribe_to_threads(self, on_changes: Callable[[ThreadChanges], None],
+                             cache: Optional[ThreadListCache] = None) -> Callable[[], None]:
+        """
+        Inscrever-se para atualizações em tempo real da lista de threads
+        
+        Um listener na coleção threads e outro no grupo de coleções activity
+        (contagens, última mensagem e updatedAt ficam nos shards); cada
+        snapshot entrega apenas as threads alteradas, já com a atividade
+        mesclada. A primeira entrega (initial=True) contém todas as threads.
+        
+        Args:
+            on_changes (Callable): Recebe um ThreadChanges a cada alteração
+            cache (ThreadListCache): Cache (ordenado por updatedAt) a manter atualizado
+            
+        Returns:
+            Callable: Função para cancelar a inscrição
+        """
+        if not self.db:
+            return lambda: None
             
-            unsubscribe = query.on_snapshot(on_snapshot)
+        cache = cache if cache is not None else ThreadListCache()
+        state = ThreadActivityState()
+        # Os dois listeners entregam em threads diferentes: aplicar um snapshot por vez
+        lock = threading.Lock()
+        watches = []
+        
+        def on_snapshot(query_snapshot, changes, read_time, threads_snapshot=False):
+            try:
+                with lock:
+                    # O primeiro snapshot da coleção threads traz a lista completa
+                    initial = threads_snapshot and not state.initialized
+                    if initial:
+                        state.initialized = True
+                    diff = state.apply(changes, initial=initial)
+                    
+                    cache.apply(diff)
+                    if diff.initial or diff.added or diff.modified or diff.removed:
+                        on_changes(diff)
+                        
+            except Exception as e:
+                logger.error(f"Erro ao aplicar alterações da lista de threads: {e}")
+                
+        def unsubscribe():
+            for watch in watches:
+                watch.unsubscribe()
+                
+        try:
+            watches.append(self.db.collection_group('activity').on_snapshot(on_snapshot))
+            watches.append(self.db.collection('threads').on_snapshot(
+                lambda query_snapshot, changes, read_time: on_snapshot(query_snapshot, changes, read_time, threads_snapshot=True)
+            ))
             return unsubscribe
             
         except Exception as e:
-            logger.error(f"Erro ao se inscrever em mensagens da thread {thread_id}: {e}")
-            return lambda: None
\ No newline at end of file
+            logger.error(f"Erro ao se inscrever na lista de threads: {e}")
+            unsubscribe()
+            return lambda: None
+
+class MessageListCache:
+    """Lista de mensagens de uma thread mantida em ordem (createdAt, id)"""
+    
+    def __init__(self, thread_id: str):
+        self.thread_id = thread_id
+        self._lock = threading.Lock()
+        self._keys: List[tuple] = []
+        self._messages: List[Message] = []
+        self._by_id: Dict[str, Message] = {}
+        
+    def apply(self, changes: MessageChanges) -> None:
+        """Aplicar alterações mantendo a ordenação"""
+        with self._lock:
+            for message_id in changes.removed:
+                self._remove(message_id)
+            for message in changes.added + changes.modified:
+                self._remove(message.id)
+                key = (message.createdAt, message.id)
+                index = bisect.bisect_left(self._keys, key)
+                self._keys.insert(index, key)
+                self._messages.insert(index, message)
+                self._by_id[message.id] = message
+                
+    def _remove(self, message_id: str) -> None:
+        message = self._by_id.pop(message_id, None)
+        if message is None:
+            return
+        index = bisect.bisect_left(self._keys, (message.createdAt, message.id))
+        del self._keys[index]
+        del self._messages[index]
+        
+    @property
+    def messages(self) -> List[Message]:
+        """Cópia da lista ordenada"""
+        with self._lock:
+            return list(self._messages)
+            
+    def __len__(self) -> int:
+        return len(self._messages)
+
+class MessageListenerManager:
+    """Mantém um único listener ativo, para a thread atual"""
+    
+    def __init__(self, firestore_manager: FirestoreManager):
+        self.firestore_manager = firestore_manager
+        self.cache: Optional[MessageListCache] = None
+        self._unsubscribe: Optional[Callable[[], None]] = None
+        
+    def listen(self, thread_id: str, on_changes: Callable[[MessageChanges], None]) -> MessageListCache:
+        """Trocar o listener para a thread informada"""
+        if self.cache is not None and self.cache.thread_id == thread_id and self._unsubscribe:
+            return self.cache
+            
+        self.stop()
+        self.cache = MessageListCache(thread_id)
+        self._unsubscribe = self.firestore_manager.subscribe_to_messages(thread_id, on_changes, cache=self.cache)
+        logger.info(f"Listener de mensagens ativo na thread {thread_id}")
+        return self.cache
+        
+    def stop(self) -> None:
+        """Cancelar o listener atual"""
+        if self._unsubscribe:
+            try:
+                self._unsubscribe()
+            except Exception as e:
+                logger.error(f"Erro ao cancelar listener de mensagens: {e}")
+        self._unsubscribe = None
+        self.cache = None
@@ -0,0 +1,317 @@
+"""
+Espelho local (SQLite) de threads e mensagens para Totari Desktop
+Permite leituras instantâneas e uso offline, reconciliando com o Firestore
+"""
+
+import os
+import json
+import sqlite3
+import threading
+import logging
+from typing import List, Dict, Any, Optional, Callable, Tuple
+
+from .types import Message, Thread, ThreadChanges, ThreadCounts, message_to_dict, thread_to_dict, decode_message, decode_thread
+from .firebase_config import DESKTOP_CONFIG
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS threads (
+    id TEXT PRIMARY KEY,
+    updatedAt INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_threads_updated ON threads (updatedAt);
+
+CREATE TABLE IF NOT EXISTS thread_counts (
+    threadId TEXT PRIMARY KEY,
+    total INTEGER NOT NULL,
+    pending INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT PRIMARY KEY,
+    threadId TEXT NOT NULL,
+    createdAt INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    summary INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_messages_thread_created ON messages (threadId, createdAt);
+CREATE INDEX IF NOT EXISTS idx_messages_created ON messages (createdAt);
+"""
+
+def _merge_summary_message(full: Dict[str, Any], summary: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+    """
+    Aplicar uma leitura resumida sobre a linha completa da mesma mensagem
+
+    Os campos leves (status, textos...) vêm do resumo; payload.audio.base64 e
+    payload.transcript.words são mantidos da linha completa enquanto o áudio
+    e a transcrição forem os mesmos.
+
+    Returns:
+        Tuple: Dados mesclados e se a linha passa a ser um resumo (dados pesados desatualizados)
+    """
+    payload = dict(summary.get('payload') or {})
+    full_payload = full.get('payload') or {}
+    is_summary = False
+    for key, heavy_field, identity_field in (('audio', 'base64', 'sizeBytes'), ('transcript', 'words', 'text')):
+        section = payload.get(key)
+        if not section:
+            continue
+        previous = full_payload.get(key)
+        if previous and previous.get(identity_field) == section.get(identity_field):
+            payload[key] = {**section, heavy_field: previous.get(heavy_field)}
+        else:
+            is_summary = True
+    return {**summary, 'payload': payload}, is_summary
+
+class LocalStore:
+    """Armazenamento local persistente em ~/.totari/"""
+
+    def __init__(self, db_path: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.db_path = db_path or os.path.expanduser("~/.totari/local_store.db")
+        self.max_bytes = max_bytes if max_bytes is not None else DESKTOP_CONFIG['local_store_max_bytes']
+        self._lock = threading.RLock()
+        self._ensure_directory()
+
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self) -> None:
+        """Adicionar colunas ausentes em bancos criados por versões anteriores"""
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(messages)")}
+        if 'summary' not in columns:
+            # Linhas antigas podem ter vindo de leituras resumidas
+            with self.conn:
+                self.conn.execute("ALTER TABLE messages ADD COLUMN summary INTEGER NOT NULL DEFAULT 1")
+
+    def _ensure_directory(self):
+        """Garantir que o diretório existe"""
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+
+    # Threads
+    def upsert_threads(self, threads: List[Thread]) -> None:
+        """Inserir ou atualizar threads"""
+        rows = [(t.id, t.updatedAt, json.dumps(thread_to_dict(t))) for t in threads]
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO threads (id, updatedAt, data) VALUES (?, ?, ?)",
+                rows
+            )
+
+    def get_threads(self) -> List[Thread]:
+        """Obter threads ordenadas por data de atualização (mais recente primeiro)"""
+        with self._lock:
+            rows = self.conn.execute("SELECT data FROM threads ORDER BY updatedAt DESC").fetchall()
+        return [decode_thread(json.loads(row[0])) for row in rows]
+
+    def get_thread_versions(self) -> Dict[str, int]:
+        """Obter updatedAt local de cada thread"""
+        with self._lock:
+            rows = self.conn.execute("SELECT id, updatedAt FROM threads").fetchall()
+        return dict(rows)
+
+    def delete_threads(self, thread_ids: List[str]) -> None:
+        """Remover threads e suas mensagens"""
+        rows = [(thread_id,) for thread_id in thread_ids]
+        with self._lock, self.conn:
+            self.conn.executemany("DELETE FROM messages WHERE threadId = ?", rows)
+            self.conn.executemany("DELETE FROM thread_counts WHERE threadId = ?", rows)
+            self.conn.executemany("DELETE FROM threads WHERE id = ?", rows)
+
+    def upsert_thread_counts(self, counts: Dict[str, ThreadCounts]) -> None:
+        """Gravar contagens de mensagens por thread"""
+        rows = [(thread_id, c.total, c.pending) for thread_id, c in counts.items()]
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO thread_counts (threadId, total, pending) VALUES (?, ?, ?)",
+                rows
+            )
+
+    def get_thread_counts(self) -> Dict[str, ThreadCounts]:
+        """Obter contagens de mensagens por thread"""
+        with self._lock:
+            rows = self.conn.execute("SELECT threadId, total, pending FROM thread_counts").fetchall()
+        return {thread_id: ThreadCounts(total=total, pending=pending) for thread_id, total, pending in rows}
+
+    # Mensagens
+    def upsert_messages(self, messages: List[Message], summary: bool = False) -> None:
+        """
+        Inserir ou atualizar mensagens respeitando o limite de tamanho
+
+        Args:
+            messages (List[Message]): Mensagens a gravar
+            summary (bool): Mensagens de leitura resumida (sem bytes de áudio nem
+                timings de palavras); não substituem os dados pesados de uma
+                linha completa já espelhada
+        """
+        with self._lock, self.conn:
+            full_rows = self._full_messages([message.id for message in messages]) if summary else {}
+            rows = []
+            for message in messages:
+                data = message_to_dict(message)
+                is_summary = summary
+                if message.id in full_rows:
+                    data, is_summary = _merge_summary_message(full_rows[message.id], data)
+                text = json.dumps(data)
+                rows.append((message.id, message.threadId, message.createdAt, len(text), text, int(is_summary)))
+
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO messages (id, threadId, createdAt, size, data, summary) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self._enforce_size_cap()
+
+    def _full_messages(self, message_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Dados das linhas completas (não resumidas) entre as mensagens informadas"""
+        if not message_ids:
+            return {}
+        placeholders = ', '.join('?' * len(message_ids))
+        rows = self.conn.execute(
+            f"SELECT id, data FROM messages WHERE summary = 0 AND id IN ({placeholders})",
+            message_ids
+        ).fetchall()
+        return {message_id: json.loads(data) for message_id, data in rows}
+
+    def get_messages(self, thread_id: str, limit: Optional[int] = None) -> List[Message]:
+        """
+        Obter mensagens de uma thread em ordem cronológica
+
+        Args:
+            thread_id (str): ID da thread
+            limit (int): Retornar apenas as N mensagens mais recentes
+        """
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT data FROM messages WHERE threadId = ? ORDER BY createdAt DESC LIMIT ?",
+                (thread_id, limit if limit is not None else -1)
+            ).fetchall()
+        messages = [decode_message(json.loads(row[0])) for row in rows]
+        messages.reverse()
+        return messages
+
+    def has_messages(self, thread_id: str) -> bool:
+        """Verificar se a thread possui mensagens espelhadas"""
+        with self._lock:
+            row = self.conn.execute("SELECT 1 FROM messages WHERE threadId = ? LIMIT 1", (thread_id,)).fetchone()
+        return row is not None
+
+    def delete_message(self, message_id: str) -> None:
+        """Remover mensagem"""
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM messages WHERE id = ?", (message_id,))
+
+    def _enforce_size_cap(self) -> None:
+        """Remover as mensagens mais antigas enquanto o total exceder max_bytes"""
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM messages").fetchone()[0]
+        excess = total - self.max_bytes
+        if excess <= 0:
+            return
+
+        to_delete = []
+        for message_id, size in self.conn.execute("SELECT id, size FROM messages ORDER BY createdAt ASC"):
+            to_delete.append((message_id,))
+            excess -= size
+            if excess <= 0:
+                break
+
+        self.conn.executemany("DELETE FROM messages WHERE id = ?", to_delete)
+        logger.info(f"Limite do armazenamento local atingido: {len(to_delete)} mensagens antigas removidas")
+
+    def close(self) -> None:
+        """Fechar conexão"""
+        with self._lock:
+            self.conn.close()
+
+class LocalStoreSync:
+    """Reconciliação do armazenamento local com o Firestore"""
+
+    def __init__(self, local_store: LocalStore, firestore_manager):
+        self.local_store = local_store
+        self.firestore_manager = firestore_manager
+
+    def sync_threads(self, incremental: bool = True) -> List[str]:
+        """
+        Sincronizar threads com o Firestore
+
+        Threads cujo updatedAt remoto difere do local têm também a página
+        mais recente de mensagens atualizada, caso já estejam espelhadas.
+
+        Returns:
+            List[str]: IDs das threads alteradas
+        """
+        remote_threads = self.firestore_manager.get_threads(incremental=incremental)
+        if not self.firestore_manager.threads_cache.loaded:
+            # Nenhuma sincronização completa ainda (offline ou erro): manter o espelho local intacto
+            return []
+
+        local_versions = self.local_store.get_thread_versions()
+        changed = [t for t in remote_threads if local_versions.get(t.id) != t.updatedAt]
+        self.local_store.upsert_threads(changed)
+
+        remote_ids = {t.id for t in remote_threads}
+        removed = [thread_id for thread_id in local_versions if thread_id not in remote_ids]
+        if removed:
+            self.local_store.delete_threads(removed)
+
+        for thread in changed:
+            if self.local_store.has_messages(thread.id):
+                self.sync_messages(thread.id)
+
+        logger.info(f"Espelho local: {len(changed)} threads alteradas, {len(removed)} removidas")
+        return [t.id for t in changed]
+
+    def apply_thread_changes(self, changes: ThreadChanges) -> List[str]:
+        """
+        Aplicar ao espelho as alterações entregues pelo listener de threads
+
+        No primeiro snapshot, threads espelhadas que não existem mais no
+        Firestore são removidas.
+
+        Returns:
+            List[str]: IDs das threads adicionadas ou alteradas
+        """
+        changed = changes.added + changes.modified
+        if changed:
+            self.local_store.upsert_threads(changed)
+
+        removed = list(changes.removed)
+        if changes.initial:
+            remote_ids = {t.id for t in changes.added}
+            removed += [thread_id for thread_id in self.local_store.get_thread_versions() if thread_id not in remote_ids]
+        if removed:
+            self.local_store.delete_threads(removed)
+
+        logger.info(f"Espelho local: {len(changed)} threads alteradas, {len(removed)} removidas (listener)")
+        return [t.id for t in changed]
+
+    def sync_counts(self, force: bool = False) -> Dict[str, ThreadCounts]:
+        """Atualizar as contagens de mensagens (agregações count()) das threads espelhadas"""
+        counts = self.firestore_manager.get_threads_counts(self.local_store.get_threads(), force=force)
+        if counts:
+            self.local_store.upsert_thread_counts(counts)
+        return counts
+
+    def sync_messages(self, thread_id: str) -> List[Message]:
+        """Sincronizar a página mais recente de mensagens de uma thread"""
+        page = self.firestore_manager.get_messages_page(thread_id, summary=True)
+        if page.messages:
+            self.local_store.upsert_messages(page.messages, summary=True)
+        return page.messages
+
+    def sync_in_background(self, target: Callable, *args, on_done: Optional[Callable] = None) -> threading.Thread:
+        """Executar uma sincronização em thread separada"""
+        def run():
+            try:
+                result = target(*args)
+                if on_done:
+                    on_done(result)
+            except Exception as e:
+                logger.error(f"Erro na sincronização em segundo plano: {e}")
+
+        worker = threading.Thread(target=run, daemon=True)
+        worker.start()
+        return worker
@@ -0,0 +1,852 @@
+"""
+Backend Firestore em memória para Totari Desktop
+Implementa a parte do firestore.Client usada pelos gerenciadores (consultas,
+ordenação, cursores, projeções, agregações count(), lotes, transações e
+listeners), com latência injetável, para medir o app sem um projeto Firebase
+"""
+
+import copy
+import time
+import queue
+import base64
+import random
+import secrets
+import string
+import threading
+import functools
+import logging
+from collections import namedtuple
+from datetime import datetime, timezone
+from enum import Enum
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from google.api_core import exceptions as api_exceptions
+from google.cloud.firestore_v1 import transforms
+
+from .clients import client_registry
+from .firestore import last_message_fields, activity_shard
+
+logger = logging.getLogger(__name__)
+
+# Marcador de campo ausente (diferente de um campo com valor None)
+_MISSING = object()
+
+_AUTO_ID_ALPHABET = string.ascii_letters + string.digits
+
+# Equivalentes locais de watch.ChangeType/DocumentChange e AggregationResult
+class ChangeType(Enum):
+    """Tipo de alteração entregue aos listeners"""
+    ADDED = 0
+    REMOVED = 1
+    MODIFIED = 2
+
+DocumentChange = namedtuple('DocumentChange', ['type', 'document', 'old_index', 'new_index'])
+AggregationResult = namedtuple('AggregationResult', ['alias', 'value', 'read_time'])
+
+# Caminhos de campo
+def _get_field(data: Dict[str, Any], path: str) -> Any:
+    current: Any = data
+    for part in path.split('.'):
+        if not isinstance(current, dict) or part not in current:
+            return _MISSING
+        current = current[part]
+    return current
+
+def _apply_value(target: Dict[str, Any], key: str, value: Any, now: datetime) -> None:
+    """Gravar um valor resolvendo as sentinelas do Firestore (timestamp, Increment...)"""
+    if value is transforms.DELETE_FIELD:
+        target.pop(key, None)
+    elif value is transforms.SERVER_TIMESTAMP:
+        target[key] = now
+    elif isinstance(value, transforms.Increment):
+        current = target.get(key)
+        is_number = isinstance(current, (int, float)) and not isinstance(current, bool)
+        target[key] = current + value.value if is_number else value.value
+    elif isinstance(value, transforms.ArrayUnion):
+        current = list(target.get(key) or [])
+        target[key] = current + [item for item in value.values if item not in current]
+    elif isinstance(value, transforms.ArrayRemove):
+        target[key] = [item for item in (target.get(key) or []) if item not in value.values]
+    elif isinstance(value, dict):
+        nested: Dict[str, Any] = {}
+        for nested_key, nested_value in value.items():
+            _apply_value(nested, nested_key, nested_value, now)
+        target[key] = nested
+    else:
+        target[key] = copy.deepcopy(value)
+
+def _set_field(data: Dict[str, Any], path: str, value: Any, now: datetime) -> None:
+    parts = path.split('.')
+    current = data
+    for part in parts[:-1]:
+        child = current.get(part)
+        if not isinstance(child, dict):
+            child = {}
+            current[part] = child
+        current = child
+    _apply_value(current, parts[-1], value, now)
+
+def _merge_fields(target: Dict[str, Any], updates: Dict[str, Any], now: datetime) -> None:
+    """set(..., merge=True): mapas são mesclados recursivamente"""
+    for key, value in updates.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge_fields(target[key], value, now)
+        else:
+            _apply_value(target, key, value, now)
+
+def _project(data: Dict[str, Any], field_paths: Optional[List[str]]) -> Dict[str, Any]:
+    """Aplicar máscara de campos (select / field_paths)"""
+    if field_paths is None:
+        return copy.deepcopy(data)
+    projected: Dict[str, Any] = {}
+    for path in field_paths:
+        if path == '__name__':
+            continue
+        value = _get_field(data, path)
+        if value is not _MISSING:
+            _set_field(projected, path, value, datetime.now(timezone.utc))
+    return projected
+
+def _estimate_size(value: Any) -> int:
+    """Tamanho aproximado em bytes de um valor (para simular banda)"""
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(len(key) + _estimate_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(_estimate_size(item) for item in value)
+    return 8
+
+# Ordenação e comparação com as regras de tipo do Firestore
+def _type_rank(value: Any) -> int:
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, datetime):
+        return 3
+    if isinstance(value, str):
+        return 4
+    if isinstance(value, bytes):
+        return 5
+    if isinstance(value, (list, tuple)):
+        return 8
+    if isinstance(value, dict):
+        return 9
+    return 6
+
+def _sort_key(value: Any) -> Tuple[int, Any]:
+    rank = _type_rank(value)
+    if rank == 3 and value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    elif rank == 8:
+        value = tuple(_sort_key(item) for item in value)
+    elif rank == 9:
+        value = tuple(sorted((key, _sort_key(item)) for key, item in value.items()))
+    elif rank in (0, 6):
+        value = str(value)
+    return rank, value
+
+def _compare(left: Any, right: Any) -> int:
+    left_key, right_key = _sort_key(left), _sort_key(right)
+    return (left_key > right_key) - (left_key < right_key)
+
+def _matches(value: Any, op: str, target: Any) -> bool:
+    """Avaliar um filtro; valores de tipos diferentes nunca se comparam"""
+    if value is _MISSING:
+        return False
+    if op == '==':
+        return _compare(value, target) == 0
+    if op == '!=':
+        return value is not None and _compare(value, target) != 0
+    if op == 'in':
+        return any(_compare(value, item) == 0 for item in target)
+    if op == 'not-in':
+        return value is not None and all(_compare(value, item) != 0 for item in target)
+    if op in ('array_contains', 'array-contains'):
+        return isinstance(value, list) and any(_compare(item, target) == 0 for item in value)
+    if op in ('array_contains_any', 'array-contains-any'):
+        return isinstance(value, list) and any(_compare(item, t) == 0 for item in value for t in target)
+    if _type_rank(value) != _type_rank(target):
+        return False
+    result = _compare(value, target)
+    return {'<': result < 0, '<=': result <= 0, '>': result > 0, '>=': result >= 0}[op]
+
+class _StoredDocument:
+    """Documento armazenado com seus metadados"""
+    __slots__ = ('data', 'create_time', 'update_time', 'version')
+    
+    def __init__(self, data: Dict[str, Any], create_time: datetime, update_time: datetime, version: int):
+        self.data = data
+        self.create_time = create_time
+        self.update_time = update_time
+        self.version = version
+
+class MemoryDocumentSnapshot:
+    """Equivalente a DocumentSnapshot"""
+    
+    def __init__(self, reference: 'MemoryDocumentReference', data: Optional[Dict[str, Any]],
+                 stored: Optional[_StoredDocument], read_time: datetime):
+        self.reference = reference
+        self._data = data
+        self._version = stored.version if stored else 0
+        self.exists = stored is not None
+        self.create_time = stored.create_time if stored else None
+        self.update_time = stored.update_time if stored else None
+        self.read_time = read_time
+    
+    @property
+    def id(self) -> str:
+        return self.reference.id
+    
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        return copy.deepcopy(self._data) if self.exists else None
+    
+    def get(self, field_path: str) -> Any:
+        value = _get_field(self._data or {}, field_path)
+        if value is _MISSING:
+            raise KeyError(field_path)
+        return copy.deepcopy(value)
+
+class MemoryQuery:
+    """Equivalente a Query: filtros, ordenação, cursores, limite e projeção"""
+    
+    ASCENDING = 'ASCENDING'
+    DESCENDING = 'DESCENDING'
+    
+    def __init__(self, client: 'MemoryFirestoreClient', parent_path: str, filters: Tuple = (), orders: Tuple = (),
+                 limit: Optional[int] = None, start: Optional[Tuple[Any, bool]] = None,
+                 end: Optional[Tuple[Any, bool]] = None, projection: Optional[List[str]] = None,
+                 all_descendants: bool = False):
+        self._client = client
+        # Em consultas de grupo (collection_group), o ID das coleções consultadas
+        self._parent_path = parent_path
+        self._all_descendants = all_descendants
+        self._filters = filters
+        self._orders = orders
+        self._limit = limit
+        self._start = start
+        self._end = end
+        self._projection = projection
+    
+    def _copy(self, **changes) -> 'MemoryQuery':
+        fields = dict(filters=self._filters, orders=self._orders, limit=self._limit, start=self._start,
+                      end=self._end, projection=self._projection, all_descendants=self._all_descendants)
+        fields.update(changes)
+        return MemoryQuery(self._client, self._parent_path, **fields)
+    
+    def where(self, field_path: Optional[str] = None, op_string: Optional[str] = None, value: Any = None,
+              *, filter=None) -> 'MemoryQuery':
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+    
+    def order_by(self, field_path: str, direction: str = ASCENDING) -> 'MemoryQuery':
+        return self._copy(orders=self._orders + ((field_path, direction == self.DESCENDING),))
+    
+    def limit(self, count: int) -> 'MemoryQuery':
+        return self._copy(limit=count)
+    
+    def select(self, field_paths: List[str]) -> 'MemoryQuery':
+        return self._copy(projection=list(field_paths))
+    
+    def start_at(self, document_fields_or_snapshot: Any) -> 'MemoryQuery':
+        return self._copy(start=(document_fields_or_snapshot, True))
+    
+    def start_after(self, document_fields_or_snapshot: Any) -> 'MemoryQuery':
+        return self._copy(start=(document_fields_or_snapshot, False))
+    
+    def end_at(self, document_fields_or_snapshot: Any) -> 'MemoryQuery':
+        return self._copy(end=(document_fields_or_snapshot, True))
+    
+    def end_before(self, document_fields_or_snapshot: Any) -> 'MemoryQuery':
+        return self._copy(end=(document_fields_or_snapshot, False))
+    
+    def count(self, alias: Optional[str] = None) -> 'MemoryAggregationQuery':
+        return MemoryAggregationQuery(self, alias or 'count')
+    
+    def _effective_orders(self) -> List[Tuple[str, bool]]:
+        """Ordenação explícita seguida do desempate implícito por __name__"""
+        orders = list(self._orders)
+        if not any(path == '__name__' for path, _ in orders):
+            orders.append(('__name__', orders[-1][1] if orders else False))
+        return orders
+    
+    def _covers(self, collection_path: str) -> bool:
+        """Verificar se a consulta inclui documentos da coleção informada"""
+        if self._all_descendants:
+            return collection_path.rsplit('/', 1)[-1] == self._parent_path
+        return collection_path == self._parent_path
+    
+    @staticmethod
+    def _order_value(name: str, data: Dict[str, Any], path: str) -> Any:
+        return name if path == '__name__' else _get_field(data, path)
+    
+    def _name(self, reference: 'MemoryDocumentReference') -> str:
+        # Em consultas de grupo os documentos vêm de coleções diferentes: ordenar pelo caminho
+        return reference.path if self._all_descendants else reference.id
+    
+    def _cursor_values(self, cursor: Any, orders: List[Tuple[str, bool]]) -> List[Any]:
+        if isinstance(cursor, MemoryDocumentSnapshot):
+            data = cursor._data or {}
+            return [self._order_value(self._name(cursor.reference), data, path) for path, _ in orders]
+        return list(cursor)
+    
+    def _compare_to_cursor(self, values: List[Any], cursor_values: List[Any], orders: List[Tuple[str, bool]]) -> int:
+        for value, cursor_value, (_, descending) in zip(values, cursor_values, orders):
+            result = _compare(value, cursor_value)
+            if result:
+                return -result if descending else result
+        return 0
+    
+    def _run(self) -> List[Tuple['MemoryDocumentReference', Dict[str, Any], _StoredDocument]]:
+        """Executar a consulta sobre o estado atual (sem latência)"""
+        orders = self._effective_orders()
+        rows = []
+        for reference, stored in self._client._documents_in(self):
+            data = stored.data
+            name = self._name(reference)
+            if not all(_matches(self._order_value(name, data, path), op, value) for path, op, value in self._filters):
+                continue
+            values = [self._order_value(name, data, path) for path, _ in orders]
+            # Documentos sem algum campo de ordenação ficam fora do resultado
+            if any(value is _MISSING for value in values):
+                continue
+            rows.append((values, reference, data, stored))
+        
+        def compare_rows(left, right):
+            return self._compare_to_cursor(left[0], right[0], orders)
+        rows.sort(key=functools.cmp_to_key(compare_rows))
+        
+        def within(values, bound, sign):
+            cursor, inclusive = bound
+            result = self._compare_to_cursor(values, self._cursor_values(cursor, orders), orders) * sign
+            return result > 0 or (inclusive and result == 0)
+        
+        if self._start is not None:
+            rows = [row for row in rows if within(row[0], self._start, 1)]
+        if self._end is not None:
+            rows = [row for row in rows if within(row[0], self._end, -1)]
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        
+        return [(reference, data, stored) for _, reference, data, stored in rows]
+    
+    def _snapshots(self, transaction: Optional['MemoryTransaction'] = None) -> List[MemoryDocumentSnapshot]:
+        with self._client._lock:
+            read_time = datetime.now(timezone.utc)
+            snapshots = [
+                MemoryDocumentSnapshot(reference, _project(data, self._projection), stored, read_time)
+                for reference, data, stored in self._run()
+            ]
+        if transaction is not None:
+            transaction._record_reads(snapshots)
+        return snapshots
+    
+    def stream(self, transaction: Optional['MemoryTransaction'] = None, **kwargs) -> Iterator[MemoryDocumentSnapshot]:
+        snapshots = self._snapshots(transaction)
+        self._client._delay('query', snapshots)
+        return iter(snapshots)
+    
+    def get(self, transaction: Optional['MemoryTransaction'] = None, **kwargs) -> List[MemoryDocumentSnapshot]:
+        return list(self.stream(transaction=transaction))
+    
+    def on_snapshot(self, callback: Callable) -> 'MemoryWatch':
+        return self._client._listen(self, callback)
+
+class MemoryAggregationQuery:
+    """Equivalente a AggregationQuery (apenas count)"""
+    
+    def __init__(self, query: MemoryQuery, alias: str):
+        self._query = query
+        self._alias = alias
+    
+    def get(self, transaction: Optional['MemoryTransaction'] = None, **kwargs) -> List[List[AggregationResult]]:
+        with self._query._client._lock:
+            count = len(self._query._run())
+        self._query._client._delay('aggregate')
+        return [[AggregationResult(self._alias, count, datetime.now(timezone.utc))]]
+
+class MemoryCollectionReference(MemoryQuery):
+    """Equivalente a CollectionReference"""
+    
+    def __init__(self, client: 'MemoryFirestoreClient', path: str):
+        super().__init__(client, path)
+        self.path = path
+    
+    @property
+    def id(self) -> str:
+        return self.path.rsplit('/', 1)[-1]
+    
+    @property
+    def parent(self) -> Optional['MemoryDocumentReference']:
+        """Documento que contém a subcoleção (None na raiz)"""
+        if '/' not in self.path:
+            return None
+        return MemoryDocumentReference(self._client, self.path.rsplit('/', 1)[0])
+    
+    def document(self, document_id: Optional[str] = None) -> 'MemoryDocumentReference':
+        document_id = document_id or ''.join(secrets.choice(_AUTO_ID_ALPHABET) for _ in range(20))
+        return MemoryDocumentReference(self._client, f"{self.path}/{document_id}")
+    
+    def add(self, document_data: Dict[str, Any], document_id: Optional[str] = None) -> Tuple[datetime, 'MemoryDocumentReference']:
+        doc_ref = self.document(document_id)
+        doc_ref.create(document_data)
+        return datetime.now(timezone.utc), doc_ref
+
+class MemoryDocumentReference:
+    """Equivalente a DocumentReference"""
+    
+    def __init__(self, client: 'MemoryFirestoreClient', path: str):
+        self._client = client
+        self.path = path
+    
+    @property
+    def id(self) -> str:
+        return self.path.rsplit('/', 1)[-1]
+    
+    @property
+    def parent(self) -> MemoryCollectionReference:
+        return MemoryCollectionReference(self._client, self.path.rsplit('/', 1)[0])
+    
+    def collection(self, collection_id: str) -> MemoryCollectionReference:
+        return MemoryCollectionReference(self._client, f"{self.path}/{collection_id}")
+    
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, MemoryDocumentReference) and other.path == self.path
+    
+    def __hash__(self) -> int:
+        return hash(self.path)
+    
+    def get(self, field_paths: Optional[List[str]] = None, transaction: Optional['MemoryTransaction'] = None,
+            **kwargs) -> MemoryDocumentSnapshot:
+        snapshot = self._client._snapshot(self, field_paths)
+        if transaction is not None:
+            transaction._record_reads([snapshot])
+        self._client._delay('get', [snapshot])
+        return snapshot
+    
+    def create(self, document_data: Dict[str, Any]) -> None:
+        self._client._commit([('create', self, document_data, None)])
+    
+    def set(self, document_data: Dict[str, Any], merge: bool = False) -> None:
+        self._client._commit([('set', self, document_data, merge)])
+    
+    def update(self, field_updates: Dict[str, Any]) -> None:
+        self._client._commit([('update', self, field_updates, None)])
+    
+    def delete(self) -> None:
+        self._client._commit([('delete', self, None, None)])
+
+class MemoryWriteBatch:
+    """Equivalente a WriteBatch: escritas aplicadas atomicamente no commit"""
+    
+    def __init__(self, client: 'MemoryFirestoreClient'):
+        self._client = client
+        self._writes: List[Tuple[str, MemoryDocumentReference, Any, Any]] = []
+    
+    def create(self, reference: MemoryDocumentReference, document_data: Dict[str, Any]) -> None:
+        self._writes.append(('create', reference, document_data, None))
+    
+    def set(self, reference: MemoryDocumentReference, document_data: Dict[str, Any], merge: bool = False) -> None:
+        self._writes.append(('set', reference, document_data, merge))
+    
+    def update(self, reference: MemoryDocumentReference, field_updates: Dict[str, Any]) -> None:
+        self._writes.append(('update', reference, field_updates, None))
+    
+    def delete(self, reference: MemoryDocumentReference) -> None:
+        self._writes.append(('delete', reference, None, None))
+    
+    def __len__(self) -> int:
+        return len(self._writes)
+    
+    def commit(self, **kwargs) -> List[datetime]:
+        writes, self._writes = self._writes, []
+        if len(writes) > 500:
+            raise api_exceptions.InvalidArgument("maximum 500 writes allowed per request")
+        return self._client._commit(writes)
+
+class MemoryTransaction(MemoryWriteBatch):
+    """
+    Equivalente a Transaction, compatível com @firestore.transactional
+    
+    Controle otimista: as versões dos documentos lidos são conferidas no
+    commit, que falha com Aborted (e é repetido pelo decorator) se algum
+    deles mudou.
+    """
+    
+    def __init__(self, client: 'MemoryFirestoreClient', max_attempts: int = 5, read_only: bool = False):
+        super().__init__(client)
+        self._max_attempts = max_attempts
+        self._read_only = read_only
+        self._id: Optional[bytes] = None
+        self._reads: Dict[str, int] = {}
+    
+    @property
+    def in_progress(self) -> bool:
+        return self._id is not None
+    
+    @property
+    def id(self) -> Optional[bytes]:
+        return self._id
+    
+    def _begin(self, retry_id: Optional[bytes] = None) -> None:
+        self._id = secrets.token_bytes(8)
+        self._reads = {}
+        self._writes = []
+    
+    def _clean_up(self) -> None:
+        self._writes = []
+        self._reads = {}
+        self._id = None
+    
+    def _rollback(self) -> None:
+        self._clean_up()
+    
+    def _record_reads(self, snapshots: List[MemoryDocumentSnapshot]) -> None:
+        for snapshot in snapshots:
+            self._reads.setdefault(snapshot.reference.path, snapshot._version)
+    
+    def get(self, ref_or_query: Union[MemoryDocumentReference, MemoryQuery], **kwargs) -> Iterator[MemoryDocumentSnapshot]:
+        if isinstance(ref_or_query, MemoryDocumentReference):
+            return iter([ref_or_query.get(transaction=self)])
+        return ref_or_query.stream(transaction=self)
+    
+    def get_all(self, references: List[MemoryDocumentReference], **kwargs) -> Iterator[MemoryDocumentSnapshot]:
+        return self._client.get_all(references, transaction=self)
+    
+    def _commit(self) -> List[datetime]:
+        writes, reads = self._writes, self._reads
+        self._clean_up()
+        return self._client._commit(writes, expected_versions=reads)
+
+class MemoryWatch:
+    """Listener de uma consulta; alterações entregues em thread própria, como no Watch real"""
+    
+    def __init__(self, client: 'MemoryFirestoreClient', query: MemoryQuery, callback: Callable):
+        self._client = client
+        self._query = query
+        self._callback = callback
+        self._previous: Dict[str, MemoryDocumentSnapshot] = {}
+        self._order: List[str] = []
+        self._initial = True
+        self.is_active = True
+    
+    def unsubscribe(self) -> None:
+        self.is_active = False
+        self._client._unlisten(self)
+    
+    def _refresh(self) -> None:
+        if not self.is_active:
+            return
+        snapshots = self._query._snapshots()
+        # Chave pelo caminho: em grupos de coleções, IDs se repetem entre coleções
+        current = {snapshot.reference.path: snapshot for snapshot in snapshots}
+        
+        changes = []
+        for old_index, path in enumerate(self._order):
+            if path not in current:
+                changes.append(DocumentChange(ChangeType.REMOVED, self._previous[path], old_index, -1))
+        for new_index, snapshot in enumerate(snapshots):
+            previous = self._previous.get(snapshot.reference.path)
+            if previous is None:
+                changes.append(DocumentChange(ChangeType.ADDED, snapshot, -1, new_index))
+            elif previous._version != snapshot._version:
+                changes.append(DocumentChange(ChangeType.MODIFIED, snapshot, self._order.index(snapshot.reference.path), new_index))
+        
+        self._previous = current
+        self._order = [snapshot.reference.path for snapshot in snapshots]
+        if changes or self._initial:
+            self._initial = False
+            self._callback(snapshots, changes, datetime.now(timezone.utc))
+
+class MemoryFirestoreClient:
+    """
+    Cliente Firestore em memória
+    
+    Args:
+        latency (float | Callable): Segundos de atraso por chamada de rede, ou
+            função que recebe a operação ('get', 'query', 'aggregate',
+            'commit', 'listen') e devolve o atraso
+        bytes_per_second (float): Banda simulada; leituras maiores demoram mais
+    """
+    
+    def __init__(self, latency: Union[float, Callable[[str], float]] = 0.0, bytes_per_second: Optional[float] = None):
+        self.latency = latency
+        self.bytes_per_second = bytes_per_second
+        self._lock = threading.RLock()
+        self._collections: Dict[str, Dict[str, _StoredDocument]] = {}
+        self._version = 0
+        self._watches: List[MemoryWatch] = []
+        self._events: 'queue.Queue[Optional[MemoryWatch]]' = queue.Queue()
+        self._dispatcher: Optional[threading.Thread] = None
+    
+    # Interface do firestore.Client
+    def collection(self, *path: str) -> MemoryCollectionReference:
+        return MemoryCollectionReference(self, '/'.join(path))
+    
+    def document(self, *path: str) -> MemoryDocumentReference:
+        return MemoryDocumentReference(self, '/'.join(path))
+    
+    def collection_group(self, collection_id: str) -> MemoryQuery:
+        return MemoryQuery(self, collection_id, all_descendants=True)
+    
+    def batch(self) -> MemoryWriteBatch:
+        return MemoryWriteBatch(self)
+    
+    def transaction(self, max_attempts: int = 5, read_only: bool = False) -> MemoryTransaction:
+        return MemoryTransaction(self, max_attempts=max_attempts, read_only=read_only)
+    
+    def get_all(self, references: List[MemoryDocumentReference], field_paths: Optional[List[str]] = None,
+                transaction: Optional[MemoryTransaction] = None, **kwargs) -> Iterator[MemoryDocumentSnapshot]:
+        snapshots = [self._snapshot(reference, field_paths) for reference in references]
+        if transaction is not None:
+            transaction._record_reads(snapshots)
+        self._delay('get', snapshots)
+        return iter(snapshots)
+    
+    def close(self) -> None:
+        if self._dispatcher is not None:
+            self._events.put(None)
+            self._dispatcher = None
+    
+    # Carga direta
+    def load(self, collection_path: str, documents: Dict[str, Dict[str, Any]]) -> None:
+        """Gravar documentos diretamente, sem latência nem notificação de listeners"""
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            collection = self._collections.setdefault(collection_path, {})
+            for doc_id, data in documents.items():
+                self._version += 1
+                collection[doc_id] = _StoredDocument(data, now, now, self._version)
+    
+    def document_count(self, collection_path: str) -> int:
+        """Quantidade de documentos em uma coleção"""
+        with self._lock:
+            return len(self._collections.get(collection_path, {}))
+    
+    # Internos
+    def _delay(self, operation: str, snapshots: Optional[List[MemoryDocumentSnapshot]] = None) -> None:
+        seconds = self.latency(operation) if callable(self.latency) else self.latency
+        if self.bytes_per_second and snapshots:
+            seconds += sum(_estimate_size(snapshot._data) for snapshot in snapshots if snapshot.exists) / self.bytes_per_second
+        if seconds > 0:
+            time.sleep(seconds)
+    
+    def _documents_in(self, query: MemoryQuery) -> List[Tuple[MemoryDocumentReference, _StoredDocument]]:
+        return [
+            (MemoryDocumentReference(self, f"{collection_path}/{doc_id}"), stored)
+            for collection_path, documents in self._collections.items() if query._covers(collection_path)
+            for doc_id, stored in documents.items()
+        ]
+    
+    def _lookup(self, reference: MemoryDocumentReference) -> Optional[_StoredDocument]:
+        collection_path, doc_id = reference.path.rsplit('/', 1)
+        return self._collections.get(collection_path, {}).get(doc_id)
+    
+    def _snapshot(self, reference: MemoryDocumentReference, field_paths: Optional[List[str]] = None) -> MemoryDocumentSnapshot:
+        with self._lock:
+            stored = self._lookup(reference)
+            data = _project(stored.data, field_paths) if stored else None
+            return MemoryDocumentSnapshot(reference, data, stored, datetime.now(timezone.utc))
+    
+    def _commit(self, writes: List[Tuple[str, MemoryDocumentReference, Any, Any]],
+                expected_versions: Optional[Dict[str, int]] = None) -> List[datetime]:
+        """Aplicar escritas atomicamente (todas ou nenhuma)"""
+        self._delay('commit')
+        now = datetime.now(timezone.utc)
+        changed_collections = set()
+        
+        with self._lock:
+            for path, version in (expected_versions or {}).items():
+                stored = self._lookup(MemoryDocumentReference(self, path))
+                if (stored.version if stored else 0) != version:
+                    raise api_exceptions.Aborted(f"Documento alterado durante a transação: {path}")
+            
+            # Aplicar sobre cópias para descartar tudo em caso de erro
+            staged: Dict[str, Optional[_StoredDocument]] = {}
+            for operation, reference, data, merge in writes:
+                current = staged[reference.path] if reference.path in staged else self._lookup(reference)
+                if operation == 'delete':
+                    staged[reference.path] = None
+                    continue
+                if operation == 'create' and current is not None:
+                    raise api_exceptions.AlreadyExists(f"Documento já existe: {reference.path}")
+                if operation == 'update' and current is None:
+                    raise api_exceptions.NotFound(f"Documento não encontrado: {reference.path}")
+                
+                new_data = copy.deepcopy(current.data) if current is not None and (operation == 'update' or merge) else {}
+                if operation == 'update':
+                    for field_path, value in data.items():
+                        _set_field(new_data, field_path, value, now)
+                elif merge:
+                    _merge_fields(new_data, data, now)
+                else:
+                    for key, value in data.items():
+                        _apply_value(new_data, key, value, now)
+                staged[reference.path] = _StoredDocument(new_data, current.create_time if current else now, now, 0)
+            
+            for path, stored in staged.items():
+                collection_path, doc_id = path.rsplit('/', 1)
+                collection = self._collections.setdefault(collection_path, {})
+                if stored is None:
+                    collection.pop(doc_id, None)
+                else:
+                    self._version += 1
+                    stored.version = self._version
+                    collection[doc_id] = stored
+                changed_collections.add(collection_path)
+            
+            for watch in self._watches:
+                if any(watch._query._covers(path) for path in changed_collections):
+                    self._events.put(watch)
+        
+        return [now] * len(writes)
+    
+    def _listen(self, query: MemoryQuery, callback: Callable) -> MemoryWatch:
+        watch = MemoryWatch(self, query, callback)
+        with self._lock:
+            self._watches.append(watch)
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch, name='memory-firestore-watch', daemon=True)
+                self._dispatcher.start()
+        self._events.put(watch)
+        return watch
+    
+    def _unlisten(self, watch: MemoryWatch) -> None:
+        with self._lock:
+            if watch in self._watches:
+                self._watches.remove(watch)
+    
+    def _dispatch(self) -> None:
+        while True:
+            watch = self._events.get()
+            if watch is None:
+                break
+            try:
+                self._delay('listen')
+                watch._refresh()
+            except Exception as e:
+                logger.error(f"Erro ao entregar snapshot em memória: {e}")
+
+def install_memory_firestore(client: Optional[MemoryFirestoreClient] = None, **kwargs) -> MemoryFirestoreClient:
+    """
+    Registrar o backend em memória como cliente Firestore compartilhado
+    
+    FirestoreManager e os demais gerenciadores criados depois disso passam a
+    usá-lo sem nenhuma alteração.
+    """
+    client = client or MemoryFirestoreClient(**kwargs)
+    client_registry.install('firestore', client)
+    return client
+
+# Gerador de carga sintética
+_WORDS = ('reunião', 'projeto', 'cliente', 'entrega', 'prazo', 'equipe', 'ideia', 'revisão', 'orçamento',
+          'próximo', 'passo', 'definir', 'semana', 'resultado', 'dados', 'teste', 'versão', 'ajuste')
+
+# Áudio WAV mono 16 kHz/16 bits, como gravado pelo app (~32 KB por segundo)
+_AUDIO_BYTES_PER_SECOND = 32000
+# Limite para o documento caber em 1 MiB após base64
+_MAX_AUDIO_SECONDS = 20
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return ' '.join(rng.choice(_WORDS) for _ in range(words)).capitalize() + '.'
+
+@functools.lru_cache(maxsize=None)
+def _audio_base64(seconds: int) -> str:
+    # Um blob por duração: os documentos compartilham a mesma string
+    return base64.b64encode(secrets.token_bytes(seconds * _AUDIO_BYTES_PER_SECOND + 44)).decode('ascii')
+
+def _synthetic_message(rng: random.Random, thread_id: str, owner_id: str, created_at: int) -> Dict[str, Any]:
+    payload: Dict[str, Any] = {'audio': None, 'transcript': None, 'improvement': None, 'note': None}
+    kind = rng.choices(['audio', 'note', 'transcript', 'improvement'], weights=[50, 20, 15, 15])[0]
+    status = None
+    
+    if kind == 'audio':
+        seconds = rng.randint(2, _MAX_AUDIO_SECONDS)
+        audio = _audio_base64(seconds)
+        payload['audio'] = {'base64': audio, 'contentType': 'audio/wav', 'durationSec': seconds,
+                            'sizeBytes': len(audio) * 3 // 4}
+        status = rng.choices(['transcribed', 'transcribing', 'error'], weights=[90, 5, 5])[0]
+        if status == 'transcribed':
+            words = int(seconds * 2.5)
+            payload['transcript'] = {
+                'text': _sentence(rng, words),
+                'words': [{'start': w * 0.4, 'end': w * 0.4 + 0.35, 'word': rng.choice(_WORDS)} for w in range(words)],
+                'languageCode': 'pt',
+                'confidence': round(rng.uniform(0.7, 0.99), 2)
+            }
+    elif kind == 'note':
+        payload['note'] = {'text': _sentence(rng, rng.randint(5, 60))}
+    elif kind == 'transcript':
+        payload['transcript'] = {'text': _sentence(rng, rng.randint(20, 120)), 'words': None,
+                                 'languageCode': 'pt', 'confidence': 0.9}
+    else:
+        payload['improvement'] = {
+            'texto_melhorado': _sentence(rng, rng.randint(40, 150)),
+            'topicos': [_sentence(rng, 4) for _ in range(rng.randint(2, 5))],
+            'insights': [_sentence(rng, 8) for _ in range(rng.randint(1, 4))],
+            'resumo': _sentence(rng, 25)
+        }
+        status = 'improved'
+    
+    return {
+        'threadId': thread_id,
+        'ownerId': owner_id,
+        'kind': kind,
+        'source': rng.choice(['mobile', 'desktop']),
+        'createdAt': created_at,
+        'payload': payload,
+        'status': status,
+        'error': 'Falha na transcrição' if status == 'error' else None
+    }
+
+def generate_load(client: MemoryFirestoreClient, thread_count: int, messages_per_thread: int,
+                  seed: int = 42, devices: int = 3) -> List[str]:
+    """
+    Popular o backend com threads e mensagens sintéticas de tamanhos realistas
+    
+    Metade das threads grava updatedAt como timestamp do servidor e metade
+    como número (ms), como acontece com os dados do mobile e do desktop; os
+    shards de atividade de cada thread são consistentes com suas mensagens.
+    
+    Returns:
+        List[str]: IDs das threads, da mais recente para a mais antiga
+    """
+    rng = random.Random(seed)
+    owners = [f"device-{i}" for i in range(devices)]
+    base_ms = int(time.time() * 1000) - thread_count * messages_per_thread * 60_000
+    threads: Dict[str, Dict[str, Any]] = {}
+    messages: Dict[str, Dict[str, Any]] = {}
+    
+    for t in range(thread_count):
+        thread_id = f"thread-{t:05d}"
+        created_at = base_ms + t * messages_per_thread * 60_000
+        shards: Dict[int, Dict[str, Any]] = {}
+        
+        for m in range(messages_per_thread):
+            message_id = f"{thread_id}-msg-{m:05d}"
+            message_at = created_at + m * 60_000
+            data = _synthetic_message(rng, thread_id, rng.choice(owners), message_at)
+            messages[message_id] = data
+            
+            shard = shards.setdefault(activity_shard(message_id), {'messageCount': 0, 'audioSeconds': 0})
+            shard['messageCount'] += 1
+            shard['audioSeconds'] += (data['payload']['audio'] or {}).get('durationSec', 0)
+            shard.update(last_message_fields(message_id, data))
+            shard['updatedAt'] = datetime.fromtimestamp(message_at / 1000, tz=timezone.utc)
+        
+        threads[thread_id] = {
+            'ownerId': rng.choice(owners),
+            'title': _sentence(rng, rng.randint(2, 6)),
+            'createdAt': created_at,
+            'updatedAt': datetime.fromtimestamp(created_at / 1000, tz=timezone.utc) if t % 2 else created_at
+        }
+        client.load(f"threads/{thread_id}/activity", {str(shard): data for shard, data in shards.items()})
+    
+    client.load('threads', threads)
+    client.load('messages', messages)
+    logger.info(f"Carga sintética: {len(threads)} threads, {len(messages)} mensagens")
+    return list(reversed(threads))
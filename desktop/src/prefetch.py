@@ -0,0 +1,94 @@
+"""
+Pré-carregamento de mensagens das threads mais recentes
+Mantém em cache a primeira página (resumida) para abertura instantânea
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Tuple
+
+from .types import Thread, MessagePage
+from .firestore import DEFAULT_PAGE_SIZE
+from .firebase_config import DESKTOP_CONFIG
+
+logger = logging.getLogger(__name__)
+
+class MessagePrefetcher:
+    """Pré-carrega a primeira página das N threads atualizadas mais recentemente"""
+    
+    def __init__(self, firestore_manager, thread_count: Optional[int] = None,
+                 page_size: int = DEFAULT_PAGE_SIZE, workers: int = 3):
+        self.firestore_manager = firestore_manager
+        self.thread_count = thread_count if thread_count is not None else DESKTOP_CONFIG['prefetch_threads']
+        self.page_size = page_size
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='prefetch')
+        self._lock = threading.Lock()
+        # thread_id -> (updatedAt da thread no momento da busca, página)
+        self._pages: Dict[str, Tuple[int, MessagePage]] = {}
+        self._in_flight: Dict[str, int] = {}
+        # thread_id -> updatedAt em que a thread foi aberta (a tela já carregou essa versão)
+        self._served: Dict[str, int] = {}
+        
+    def prefetch(self, threads: List[Thread]) -> None:
+        """Agendar o pré-carregamento das threads mais recentes"""
+        recent = sorted(threads, key=lambda x: x.updatedAt, reverse=True)[:self.thread_count]
+        
+        for thread in recent:
+            with self._lock:
+                cached = self._pages.get(thread.id)
+                if cached and cached[0] == thread.updatedAt:
+                    continue
+                if self._served.get(thread.id) == thread.updatedAt:
+                    continue
+                if self._in_flight.get(thread.id) == thread.updatedAt:
+                    continue
+                self._in_flight[thread.id] = thread.updatedAt
+            self._executor.submit(self._fetch, thread.id, thread.updatedAt)
+            
+    def _fetch(self, thread_id: str, updated_at: int) -> None:
+        """Buscar a primeira página resumida de uma thread"""
+        try:
+            page = self.firestore_manager.get_messages_page(thread_id, page_size=self.page_size, summary=True)
+            with self._lock:
+                if page.messages or page.has_more:
+                    self._pages[thread_id] = (updated_at, page)
+            logger.info(f"Pré-carregadas {len(page.messages)} mensagens da thread {thread_id}")
+        except Exception as e:
+            logger.error(f"Erro ao pré-carregar thread {thread_id}: {e}")
+        finally:
+            with self._lock:
+                if self._in_flight.get(thread_id) == updated_at:
+                    del self._in_flight[thread_id]
+                    
+    def take(self, thread_id: str, updated_at: Optional[int] = None) -> Optional[MessagePage]:
+        """
+        Retirar a página pré-carregada de uma thread
+        
+        A thread fica marcada como aberta nesse updatedAt, para que prefetch()
+        só volte a buscá-la quando a thread for atualizada.
+        
+        Args:
+            thread_id (str): ID da thread
+            updated_at (int): updatedAt atual da thread; páginas obtidas
+                antes de uma atualização são descartadas
+        """
+        with self._lock:
+            cached = self._pages.pop(thread_id, None)
+            if updated_at is not None:
+                self._served[thread_id] = updated_at
+        if cached is None:
+            return None
+        if updated_at is not None and cached[0] != updated_at:
+            return None
+        return cached[1]
+        
+    def invalidate(self, thread_id: str) -> None:
+        """Descartar a página pré-carregada de uma thread"""
+        with self._lock:
+            self._pages.pop(thread_id, None)
+            self._served.pop(thread_id, None)
+            
+    def shutdown(self) -> None:
+        """Encerrar o pool de workers"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,190 @@
+"""
+Arquivos de gravação para Totari Desktop
+Frames de áudio são gravados em WAV em ~/.totari/recordings/ durante a captura
+"""
+
+import os
+import glob
+import struct
+import time
+import logging
+from datetime import datetime
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Diretório das gravações em andamento (ou deixadas para trás por uma falha)
+RECORDINGS_DIR = os.path.expanduser("~/.totari/recordings")
+
+# Cabeçalho PCM canônico: RIFF + fmt (16 bytes) + data
+WAV_HEADER_SIZE = 44
+
+# Intervalo entre atualizações do cabeçalho durante a captura (segundos)
+HEADER_PATCH_INTERVAL = 1.0
+
+def wav_header(channels: int, sample_width: int, rate: int, data_size: int) -> bytes:
+    """Cabeçalho WAV PCM para data_size bytes de frames"""
+    block_align = channels * sample_width
+    return struct.pack(
+        '<4sI4s4sIHHIIHH4sI',
+        b'RIFF', 36 + data_size, b'WAVE',
+        b'fmt ', 16, 1, channels, rate, rate * block_align, block_align, sample_width * 8,
+        b'data', data_size
+    )
+
+def new_recording_path() -> str:
+    """Caminho para uma nova gravação"""
+    os.makedirs(RECORDINGS_DIR, exist_ok=True)
+    return os.path.join(RECORDINGS_DIR, datetime.now().strftime("%Y%m%d-%H%M%S-%f") + ".wav")
+
+class WavFileWriter:
+    """
+    Escrita incremental de um arquivo WAV
+    
+    Os frames vão direto para o disco e o cabeçalho é atualizado
+    periodicamente, então a memória não cresce com a duração e o arquivo
+    continua legível se o processo cair no meio da gravação.
+    """
+    
+    def __init__(self, path: str, channels: int, sample_width: int, rate: int,
+                 patch_interval: float = HEADER_PATCH_INTERVAL):
+        self.path = path
+        self.channels = channels
+        self.sample_width = sample_width
+        self.rate = rate
+        self.patch_interval = patch_interval
+        self.data_size = 0
+        self._last_patch = time.monotonic()
+        self._file = open(path, 'wb')
+        self._file.write(wav_header(channels, sample_width, rate, 0))
+        
+    def write(self, frames: bytes) -> None:
+        """Acrescentar frames ao arquivo"""
+        self._file.write(frames)
+        self.data_size += len(frames)
+        
+        if time.monotonic() - self._last_patch >= self.patch_interval:
+            self._patch_header()
+            
+    def _patch_header(self) -> None:
+        """Reescrever o cabeçalho com o tamanho atual e enviar os dados ao sistema operacional"""
+        self._file.seek(0)
+        self._file.write(wav_header(self.channels, self.sample_width, self.rate, self.data_size))
+        self._file.seek(0, os.SEEK_END)
+        self._file.flush()
+        self._last_patch = time.monotonic()
+        
+    @property
+    def duration(self) -> float:
+        """Duração gravada em segundos"""
+        return self.data_size / (self.rate * self.channels * self.sample_width)
+        
+    def close(self) -> None:
+        """Finalizar o cabeçalho e fechar o arquivo"""
+        if self._file.closed:
+            return
+        self._patch_header()
+        self._file.close()
+        
+    def read_wav(self) -> bytearray:
+        """
+        Conteúdo WAV completo em um único buffer pré-alocado
+        
+        O cabeçalho vem do tamanho conhecido pelo writer e os frames são
+        lidos do disco direto para o buffer (readinto sobre um memoryview),
+        sem arquivo temporário nem cópias intermediárias.
+        """
+        wav_data = bytearray(WAV_HEADER_SIZE + self.data_size)
+        wav_data[:WAV_HEADER_SIZE] = wav_header(self.channels, self.sample_width, self.rate, self.data_size)
+        
+        view = memoryview(wav_data)
+        offset = WAV_HEADER_SIZE
+        with open(self.path, 'rb', buffering=0) as f:
+            f.seek(WAV_HEADER_SIZE)
+            while offset < len(wav_data):
+                read = f.readinto(view[offset:])
+                if not read:
+                    raise EOFError(f"Gravação truncada: {self.path}")
+                offset += read
+                
+        return wav_data
+
+def recover_recording(path: str) -> bool:
+    """
+    Corrigir o cabeçalho de uma gravação interrompida a partir do tamanho do arquivo
+    
+    Returns:
+        bool: True se o arquivo contém áudio recuperável
+    """
+    try:
+        size = os.path.getsize(path)
+        if size <= WAV_HEADER_SIZE:
+            return False
+            
+        with open(path, 'r+b') as f:
+            header = f.read(WAV_HEADER_SIZE)
+            if header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+                return False
+            channels, rate = struct.unpack_from('<HI', header, 22)
+            sample_width = struct.unpack_from('<H', header, 34)[0] // 8
+            
+            # Descartar um frame incompleto no final
+            block_align = channels * sample_width
+            data_size = (size - WAV_HEADER_SIZE) // block_align * block_align
+            f.truncate(WAV_HEADER_SIZE + data_size)
+            f.seek(0)
+            f.write(wav_header(channels, sample_width, rate, data_size))
+            
+        return data_size > 0
+        
+    except Exception as e:
+        logger.error(f"Erro ao recuperar gravação {path}: {e}")
+        return False
+
+def recover_recordings(retention_days: float = 0) -> List[str]:
+    """
+    Recuperar gravações deixadas em RECORDINGS_DIR por uma falha
+    
+    Args:
+        retention_days (float): Idade máxima das gravações mantidas (0 = sem limite)
+        
+    Returns:
+        List[str]: Caminhos dos arquivos recuperados (os vazios e os expirados são removidos)
+    """
+    recovered = []
+    expired = 0
+    cutoff = time.time() - retention_days * 86400 if retention_days > 0 else None
+    for path in sorted(glob.glob(os.path.join(RECORDINGS_DIR, "*.wav"))):
+        if cutoff is not None and os.path.getmtime(path) < cutoff:
+            remove_recording(path)
+            expired += 1
+        elif recover_recording(path):
+            recovered.append(path)
+        elif os.path.getsize(path) <= WAV_HEADER_SIZE:
+            remove_recording(path)
+            
+    if expired:
+        logger.info(f"Gravações com mais de {retention_days:g} dias removidas: {expired}")
+    if recovered:
+        logger.info(f"Gravações recuperadas em {RECORDINGS_DIR}: {len(recovered)}")
+    return recovered
+
+def recording_duration(path: str) -> float:
+    """Duração em segundos de uma gravação com cabeçalho válido"""
+    with open(path, 'rb') as f:
+        header = f.read(WAV_HEADER_SIZE)
+    channels, rate = struct.unpack_from('<HI', header, 22)
+    sample_width = struct.unpack_from('<H', header, 34)[0] // 8
+    data_size = struct.unpack_from('<I', header, 40)[0]
+    return data_size / (rate * channels * sample_width)
+
+def remove_recording(path: Optional[str]) -> None:
+    """Remover um arquivo de gravação"""
+    if not path:
+        return
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.error(f"Erro ao remover gravação {path}: {e}")
@@ -6,21 +6,42 @@ Implementação similar ao Zustand do mobile
 import logging
 import threading
 import base64
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import List, Optional, Dict, Any, Callable
 from datetime import datetime
 
-from .types import Message, Thread, MessageKind, MessageStatus, MessageSource, MessagePayload, AudioPayload, TranscriptPayload
+from .types import Message, Thread, MessageKind, MessageStatus, MessageSource, MessagePayload, AudioPayload, TranscriptPayload, MessageChanges
+from .firestore import MessageListenerManager, new_document_id
+from .audio_encoders import get_encoder, encode_audio
 from .device_id import get_or_create_device_id
+from .firebase_config import DESKTOP_CONFIG
 
 logger = logging.getLogger(__name__)
 
 class StateManager:
     """Gerenciador de estado centralizado - similar ao Zustand"""
     
-    def __init__(self, firestore_manager, transcription_manager):
+    def __init__(self, firestore_manager, transcription_manager, local_store=None, realtime: bool = False,
+                 write_queue=None):
         self.firestore_manager = firestore_manager
         self.transcription_manager = transcription_manager
         
+        # Escritas passam pela fila durável, quando configurada, para não bloquear na rede
+        self.writer = write_queue or firestore_manager
+        
+        # Listener em tempo real da thread atual (aplica apenas as alterações)
+        self.message_listener = MessageListenerManager(firestore_manager) if realtime else None
+        
+        # Espelho local opcional: leituras servidas do cache e reconciliadas em segundo plano
+        self.local_store = local_store
+        
+        # Criações otimistas: gravadas em ordem, em segundo plano, por um único worker
+        self._write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='state-writes')
+        self._pending_writes: Dict[str, Future] = {}
+        # Thread de cada mensagem com escrita pendente (canceladas se a thread não for criada)
+        self._pending_threads: Dict[str, str] = {}
+        self._pending_lock = threading.Lock()
+        
         # Estado de autenticação
         self.user = None
         self.is_authenticated = False
@@ -77,18 +98,74 @@ class StateManager:
         """Verificar se usuário está autenticado"""
         return self.is_authenticated
         
+    # Escritas em segundo plano
+    def _write_in_background(self, doc_id: str, write: Callable[[], Any], on_failure: Callable[[Exception], None],
+                             thread_id: Optional[str] = None) -> Future:
+        """
+        Gravar um documento criado localmente sem bloquear o chamador
+        
+        As escritas rodam em ordem (uma thread criada antes das suas
+        mensagens chega antes ao Firestore); em caso de falha ou
+        cancelamento, on_failure desfaz ou marca a inserção otimista.
+        
+        Args:
+            thread_id (str): Thread da mensagem gravada (ver _rollback_thread)
+        """
+        future = self._write_executor.submit(write)
+        with self._pending_lock:
+            self._pending_writes[doc_id] = future
+            if thread_id is not None:
+                self._pending_threads[doc_id] = thread_id
+                
+        def done(completed: Future):
+            with self._pending_lock:
+                self._pending_writes.pop(doc_id, None)
+                self._pending_threads.pop(doc_id, None)
+            if completed.cancelled():
+                error = Exception("escrita cancelada")
+            else:
+                error = completed.exception()
+            if error is not None:
+                logger.error(f"Erro ao gravar {doc_id} em segundo plano: {error}")
+                on_failure(error)
+                
+        future.add_done_callback(done)
+        return future
+        
+    def _wait_for_write(self, doc_id: str) -> None:
+        """Aguardar a gravação pendente de um documento (propaga a falha)"""
+        with self._pending_lock:
+            future = self._pending_writes.get(doc_id)
+        if future is not None:
+            future.result()
+            
     # Métodos de threads
-    def fetch_threads(self) -> None:
-        """Buscar threads do usuário"""
+    def fetch_threads(self, incremental: bool = False) -> None:
+        """Buscar threads do usuário (incremental busca apenas as alteradas)"""
         # Não precisa de autenticação com Firebase Admin SDK
             
         self.threads_loading = True
         self.threads_error = None
+        
+        if self.local_store is not None:
+            # Exibir imediatamente o que está em cache e reconciliar em segundo plano
+            self.threads = self.local_store.get_threads()
+            self._notify('threads_changed')
+            threading.Thread(target=self._fetch_remote_threads, args=(incremental,), daemon=True).start()
+            return
+            
         self._notify('threads_changed')
+        self._fetch_remote_threads(incremental)
         
+    def _fetch_remote_threads(self, incremental: bool) -> None:
+        """Buscar threads no Firestore e atualizar o estado"""
         try:
             # Buscar todas as threads (conversas globais)
-            threads = self.firestore_manager.get_threads()
+            threads = self.firestore_manager.get_threads(incremental=incremental)
+            if self.local_store is not None:
+                if threads:
+                    self.local_store.upsert_threads(threads)
+                threads = self.local_store.get_threads()
             self.threads = threads
             self.threads_loading = False
             self._notify('threads_changed')
@@ -101,7 +178,13 @@ class StateManager:
             logger.error(f"Erro ao buscar threads: {e}")
             
     def create_thread(self, title: str) -> Optional[Thread]:
-        """Criar nova thread"""
+        """
+        Criar nova thread
+        
+        O ID é gerado localmente e a thread aparece na lista na hora; a
+        gravação no Firestore acontece em segundo plano e, se falhar, a
+        thread é retirada da lista.
+        """
         if not self.is_authenticated:
             logger.warning("Usuário não autenticado")
             return None
@@ -111,43 +194,76 @@ class StateManager:
             now = int(datetime.now().timestamp() * 1000)
             
             thread = Thread(
-                id="",  # Será definido pelo Firestore
+                id=new_document_id(),
                 ownerId=device_id,
                 title=title,
                 createdAt=now,
                 updatedAt=now
             )
             
-            thread_id = self.firestore_manager.save_thread(thread)
-            thread.id = thread_id
-            
             # Adicionar à lista local
             self.threads.insert(0, thread)  # Adicionar no início
             self._notify('threads_changed')
             
-            logger.info(f"Thread criada: {thread_id}")
+            self._write_in_background(thread.id, lambda: self.firestore_manager.save_thread(thread),
+                                      lambda error: self._rollback_thread(thread.id, error))
+            
+            logger.info(f"Thread criada: {thread.id}")
             return thread
             
         except Exception as e:
             logger.error(f"Erro ao criar thread: {e}")
             return None
             
+    def _rollback_thread(self, thread_id: str, error: Exception) -> None:
+        """Retirar da lista uma thread cuja gravação falhou, cancelando as escritas das suas mensagens"""
+        with self._pending_lock:
+            queued = [self._pending_writes[doc_id] for doc_id, owner in self._pending_threads.items() if owner == thread_id]
+        # As mensagens canceladas são marcadas como erro pelo on_failure de cada escrita
+        for future in queued:
+            future.cancel()
+            
+        self.threads = [t for t in self.threads if t.id != thread_id]
+        self.threads_error = f"Falha ao criar thread: {error}"
+        self._notify('threads_changed')
+        
     def set_current_thread(self, thread: Optional[Thread]):
         """Definir thread atual"""
         self.current_thread = thread
         self._notify('current_thread_changed', thread)
         
         # Carregar mensagens da thread
-        if thread:
+        if thread and self.message_listener is not None:
+            self.messages = []
+            self.message_listener.listen(thread.id, self._on_message_changes)
+            self._notify('messages_changed')
+        elif thread:
             self.fetch_messages(thread.id)
         else:
+            if self.message_listener is not None:
+                self.message_listener.stop()
             self.messages = []
             self._notify('messages_changed')
             
+    def _on_message_changes(self, changes: MessageChanges):
+        """Aplicar alterações recebidas pelo listener da thread atual"""
+        listener_cache = self.message_listener.cache if self.message_listener else None
+        if listener_cache is None or listener_cache.thread_id != changes.threadId:
+            return
+            
+        self.messages = listener_cache.messages
+        if self.local_store is not None:
+            self.local_store.upsert_messages(changes.added + changes.modified)
+            for message_id in changes.removed:
+                self.local_store.delete_message(message_id)
+        self._notify('messages_changed', changes)
+            
     def delete_thread(self, thread_id: str) -> bool:
         """Deletar thread"""
         try:
-            self.firestore_manager.delete_thread(thread_id)
+            self.firestore_manager.delete_thread(thread_id, cascade=True)
+            if self.local_store is not None:
+                self.local_store.delete_threads([thread_id])
             
             # Remover da lista local
             self.threads = [t for t in self.threads if t.id != thread_id]
@@ -169,11 +285,30 @@ class StateManager:
         """Buscar mensagens da thread - versão simplificada"""
         self.messages_loading = True
         self.messages_error = None
+        
+        if self.local_store is not None:
+            # Exibir imediatamente o que está em cache e reconciliar em segundo plano
+            self.messages = self.local_store.get_messages(thread_id)
+            self._notify('messages_changed')
+            threading.Thread(target=self._fetch_remote_messages, args=(thread_id,), daemon=True).start()
+            return
+            
         self._notify('messages_changed')
+        self._fetch_remote_messages(thread_id)
         
+    def _fetch_remote_messages(self, thread_id: str) -> None:
+        """Buscar mensagens no Firestore e atualizar o estado"""
         try:
             # Buscar mensagens da thread (conversas globais)
             messages = self.firestore_manager.get_messages(thread_id)
+            if self.local_store is not None:
+                if messages:
+                    self.local_store.upsert_messages(messages)
+                messages = self.local_store.get_messages(thread_id)
+            if self.current_thread and self.current_thread.id != thread_id:
+                # Thread atual mudou durante a busca
+                self.messages_loading = False
+                return
             self.messages = messages
             self.messages_loading = False
             self._notify('messages_changed')
@@ -201,6 +336,13 @@ class StateManager:
                 self._notify('messages_changed')
                 break
                 
+    def _message_thread_id(self, message_id: str) -> Optional[str]:
+        """Thread de uma mensagem da lista local (para manter o resumo da thread)"""
+        for msg in self.messages:
+            if msg.id == message_id:
+                return msg.threadId
+        return self.current_thread.id if self.current_thread else None
+        
     def start_audio_recording(self, thread_id: str) -> bool:
         """Iniciar gravação de áudio"""
         if not self.is_authenticated:
@@ -211,9 +353,9 @@ class StateManager:
             device_id = get_or_create_device_id()
             now = int(datetime.now().timestamp() * 1000)
             
-            # Criar mensagem de áudio
+            # Criar mensagem de áudio com ID gerado localmente
             message = Message(
-                id="",  # Será definido pelo Firestore
+                id=new_document_id(),
                 threadId=thread_id,
                 ownerId=device_id,
                 kind=MessageKind.AUDIO,
@@ -223,46 +365,70 @@ class StateManager:
                 status=MessageStatus.RECORDING
             )
             
-            # Salvar no Firestore
-            message_id = self.firestore_manager.save_message(message)
-            message.id = message_id
-            
-            # Adicionar à lista local
+            # Adicionar à lista local antes de salvar, sem esperar a rede
             self.add_message(message)
+            self._write_in_background(message.id, lambda: self.writer.save_message(message),
+                                      lambda error: self._mark_message_failed(message.id, error),
+                                      thread_id=thread_id)
             
-            logger.info(f"Gravação iniciada: {message_id}")
+            logger.info(f"Gravação iniciada: {message.id}")
             return True
             
         except Exception as e:
             logger.error(f"Erro ao iniciar gravação: {e}")
             return False
             
+    def _mark_message_failed(self, message_id: str, error: Exception) -> None:
+        """Marcar como erro uma mensagem cuja gravação falhou"""
+        for i, msg in enumerate(self.messages):
+            if msg.id == message_id:
+                self.messages[i] = Message(
+                    id=msg.id,
+                    threadId=msg.threadId,
+                    ownerId=msg.ownerId,
+                    kind=msg.kind,
+                    source=msg.source,
+                    createdAt=msg.createdAt,
+                    payload=msg.payload,
+                    status=MessageStatus.ERROR,
+                    error=f"Falha ao salvar mensagem: {error}"
+                )
+                self._notify('messages_changed')
+                break
+                
     def process_audio_recording(self, message_id: str, audio_data: bytes) -> bool:
         """Processar gravação de áudio"""
         try:
-            # Converter para base64
-            audio_base64 = base64.b64encode(audio_data).decode('utf-8')
+            # A mensagem precisa existir no Firestore antes das atualizações
+            self._wait_for_write(message_id)
+            
+            # Comprimir (formato em DESKTOP_CONFIG['audio_format']) e converter para base64
+            encoded = encode_audio(get_encoder(), audio_data)
+            if len(encoded.data) > DESKTOP_CONFIG['max_file_size']:
+                logger.warning(f"Arquivo muito grande: {len(encoded.data)} bytes")
+                return False
+            audio_base64 = base64.b64encode(encoded.data).decode('utf-8')
             
             # Criar payload de áudio
             audio_payload = AudioPayload(
                 base64=audio_base64,
-                contentType='audio/wav',
+                contentType=encoded.contentType,
                 durationSec=0,  # Será calculado
-                sizeBytes=len(audio_data)
+                sizeBytes=len(encoded.data)
             )
             
-            # Atualizar status para transcribing
-            self.firestore_manager.update_message_status(message_id, MessageStatus.TRANSCRIBING)
-            
-            # Atualizar payload
-            self.firestore_manager.update_message_payload(message_id, {
-                'audio': {
-                    'base64': audio_payload.base64,
-                    'contentType': audio_payload.contentType,
-                    'durationSec': audio_payload.durationSec,
-                    'sizeBytes': audio_payload.sizeBytes
-                }
-            })
+            # Atualizar status para transcribing e payload em um único commit
+            thread_id = self._message_thread_id(message_id)
+            with self.writer.batch() as batch:
+                batch.update_status(message_id, MessageStatus.TRANSCRIBING, thread_id=thread_id)
+                batch.update_payload(message_id, {
+                    'audio': {
+                        'base64': audio_payload.base64,
+                        'contentType': audio_payload.contentType,
+                        'durationSec': audio_payload.durationSec,
+                        'sizeBytes': audio_payload.sizeBytes
+                    }
+                }, thread_id=thread_id)
             
             # Atualizar mensagem local
             for i, msg in enumerate(self.messages):
@@ -285,7 +451,7 @@ class StateManager:
             # Iniciar transcrição em thread separada
             threading.Thread(
                 target=self._transcribe_audio,
-                args=(message_id, audio_base64),
+                args=(message_id, audio_base64, encoded.contentType),
                 daemon=True
             ).start()
             
@@ -296,11 +462,11 @@ class StateManager:
             logger.error(f"Erro ao processar gravação: {e}")
             return False
             
-    def _transcribe_audio(self, message_id: str, audio_base64: str):
+    def _transcribe_audio(self, message_id: str, audio_base64: str, content_type: str = 'audio/wav'):
         """Transcrever áudio em thread separada"""
         try:
             # Fazer transcrição
-            result = self.transcription_manager.transcribe_audio(audio_base64)
+            result = self.transcription_manager.transcribe_audio(audio_base64, content_type)
             
             # Criar payload de transcrição
             transcript_payload = TranscriptPayload(
@@ -310,24 +476,24 @@ class StateManager:
                 confidence=result.get('confidence', 0.8)
             )
             
-            # Atualizar payload no Firestore
-            self.firestore_manager.update_message_payload(message_id, {
-                'transcript': {
-                    'text': transcript_payload.text,
-                    'words': [
-                        {
-                            'start': word['start'],
-                            'end': word['end'],
-                            'word': word['word']
-                        } for word in transcript_payload.words
-                    ] if transcript_payload.words else None,
-                    'languageCode': transcript_payload.languageCode,
-                    'confidence': transcript_payload.confidence
-                }
-            })
-            
-            # Atualizar status para transcribed
-            self.firestore_manager.update_message_status(message_id, MessageStatus.TRANSCRIBED)
+            # Atualizar payload e status para transcribed em um único commit
+            thread_id = self._message_thread_id(message_id)
+            with self.writer.batch() as batch:
+                batch.update_payload(message_id, {
+                    'transcript': {
+                        'text': transcript_payload.text,
+                        'words': [
+                            {
+                                'start': word['start'],
+                                'end': word['end'],
+                                'word': word['word']
+                            } for word in transcript_payload.words
+                        ] if transcript_payload.words else None,
+                        'languageCode': transcript_payload.languageCode,
+                        'confidence': transcript_payload.confidence
+                    }
+                }, thread_id=thread_id)
+                batch.update_status(message_id, MessageStatus.TRANSCRIBED, thread_id=thread_id)
             
             # Atualizar mensagem local
             for i, msg in enumerate(self.messages):
@@ -355,7 +521,8 @@ class StateManager:
         except Exception as e:
             logger.error(f"Erro na transcrição: {e}")
             # Marcar como erro
-            self.firestore_manager.update_message_status(message_id, MessageStatus.ERROR, str(e))
+            self.writer.update_message_status(message_id, MessageStatus.ERROR, str(e),
+                                              thread_id=self._message_thread_id(message_id))
             
             # Atualizar mensagem local
             for i, msg in enumerate(self.messages):
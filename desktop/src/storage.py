@@ -7,9 +7,10 @@ import os
 import base64
 import logging
 from typing import Optional, List, Dict, Any
-from google.cloud import storage
 from google.cloud.exceptions import NotFound
 
+from .clients import get_storage_client
+
 logger = logging.getLogger(__name__)
 
 class StorageManager:
@@ -18,7 +19,8 @@ class StorageManager:
     def __init__(self, project_id: str, bucket_name: str):
         self.project_id = project_id
         self.bucket_name = bucket_name
-        self.client = storage.Client(project=project_id)
+        # Cliente compartilhado, criado no primeiro uso
+        self.client = get_storage_client(project_id)
         self.bucket = self.client.bucket(bucket_name)
         
     def upload_file(self, path: str, file_data: bytes, content_type: str = 'application/octet-stream') -> bool:
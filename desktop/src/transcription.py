@@ -10,6 +10,8 @@ import logging
 from typing import Dict, Any, Optional
 from dotenv import load_dotenv
 
+from .audio_encoders import audio_extension
+
 load_dotenv()
 
 logger = logging.getLogger(__name__)
@@ -56,7 +58,7 @@ class TranscriptionManager:
             
             # Preparar dados para upload
             files = {
-                'file': ('audio.wav', audio_bytes, 'audio/wav')
+                'file': (f"audio.{audio_extension(content_type)}", audio_bytes, content_type)
             }
             
             data = {
@@ -3,7 +3,7 @@ Tipos e estruturas de dados para o Totari Desktop
 Equivalente aos tipos TypeScript do mobile
 """
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import List, Optional, Dict, Any, Union
 from datetime import datetime
 from enum import Enum
@@ -96,6 +96,17 @@ class User:
     displayName: str
     createdAt: int
 
+@dataclass
+class ThreadSummary:
+    """Resumo desnormalizado da thread, mantido a cada escrita de mensagem"""
+    messageCount: int = 0
+    audioSeconds: float = 0
+    lastMessageId: Optional[str] = None
+    lastKind: Optional[MessageKind] = None
+    lastStatus: Optional[MessageStatus] = None
+    lastPreview: str = ''
+    lastMessageAt: Optional[int] = None
+
 @dataclass
 class Thread:
     """Estrutura de thread"""
@@ -104,6 +115,52 @@ class Thread:
     title: str
     createdAt: int
     updatedAt: int
+    summary: Optional[ThreadSummary] = None
+
+@dataclass
+class MessageCursor:
+    """
+    Cursor de paginação de mensagens (posição na ordenação createdAt, id)
+    
+    createdAt vem normalizado para ms; value guarda o createdAt como está no
+    documento (número ou timestamp do mobile). Cada tipo é paginado por uma
+    consulta própria, e o valor original permite retomar exatamente do
+    ponto certo na consulta do mesmo tipo.
+    """
+    createdAt: int
+    id: str
+    value: Any = None
+
+@dataclass
+class MessagePage:
+    """Página de mensagens em ordem cronológica"""
+    messages: List[Message]
+    older_cursor: Optional[MessageCursor] = None
+    newer_cursor: Optional[MessageCursor] = None
+    has_more: bool = False
+
+@dataclass
+class ThreadCounts:
+    """Contagens de mensagens de uma thread (badges da lista de threads)"""
+    total: int
+    pending: int
+
+@dataclass
+class MessageChanges:
+    """Diferenças aplicadas à lista de mensagens de uma thread por um listener"""
+    threadId: str
+    added: List[Message] = field(default_factory=list)
+    modified: List[Message] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+
+@dataclass
+class ThreadChanges:
+    """Diferenças aplicadas à lista de threads por um listener"""
+    added: List[Thread] = field(default_factory=list)
+    modified: List[Thread] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    # Primeiro snapshot do listener: added contém todas as threads existentes
+    initial: bool = False
 
 @dataclass
 class AuthResponse:
@@ -163,7 +220,8 @@ def message_from_dict(data: Dict[str, Any]) -> Message:
     if payload_data.get('audio'):
         audio_data = payload_data['audio']
         payload.audio = AudioPayload(
-            base64=audio_data['base64'],
+            # Ausente em leituras resumidas (projeção sem os bytes do áudio)
+            base64=audio_data.get('base64', ''),
             contentType=audio_data['contentType'],
             durationSec=audio_data['durationSec'],
             sizeBytes=audio_data['sizeBytes']
@@ -213,22 +271,141 @@ def message_from_dict(data: Dict[str, Any]) -> Message:
         error=data.get('error')
     )
 
+def thread_summary_to_dict(summary: ThreadSummary) -> Dict[str, Any]:
+    """Converter ThreadSummary para dicionário para Firestore"""
+    return {
+        'messageCount': summary.messageCount,
+        'audioSeconds': summary.audioSeconds,
+        'lastMessageId': summary.lastMessageId,
+        'lastKind': summary.lastKind.value if summary.lastKind else None,
+        'lastStatus': summary.lastStatus.value if summary.lastStatus else None,
+        'lastPreview': summary.lastPreview,
+        'lastMessageAt': summary.lastMessageAt
+    }
+
 def thread_to_dict(thread: Thread) -> Dict[str, Any]:
     """Converter Thread para dicionário para Firestore"""
-    return {
+    thread_dict = {
         'id': thread.id,
         'ownerId': thread.ownerId,
         'title': thread.title,
         'createdAt': thread.createdAt,
         'updatedAt': thread.updatedAt
     }
+    
+    # Resumo é opcional (threads criadas antes dele não o possuem)
+    if thread.summary:
+        thread_dict['summary'] = thread_summary_to_dict(thread.summary)
+    
+    return thread_dict
 
 def thread_from_dict(data: Dict[str, Any]) -> Thread:
     """Converter dicionário do Firestore para Thread"""
+    summary_data = data.get('summary')
     return Thread(
         id=data['id'],
         ownerId=data['ownerId'],
         title=data['title'],
         createdAt=data['createdAt'],
-        updatedAt=data['updatedAt']
+        updatedAt=data['updatedAt'],
+        summary=decode_thread_summary(summary_data) if summary_data else None
+    )
+
+# Decodificação rápida de documentos do Firestore
+# Enums resolvidos por dicionário (Enum(value) é lento) e payloads por tabela
+_MESSAGE_KINDS = {kind.value: kind for kind in MessageKind}
+_MESSAGE_SOURCES = {source.value: source for source in MessageSource}
+_MESSAGE_STATUSES = {status.value: status for status in MessageStatus}
+
+def timestamp_to_ms(value: Any) -> Any:
+    """Normalizar timestamp do Firestore (datetime) para ms; números passam direto"""
+    if value.__class__ is int:
+        return value
+    to_timestamp = getattr(value, 'timestamp', None)
+    if to_timestamp is not None:
+        return int(to_timestamp() * 1000)
+    return value
+
+def _decode_audio(data: Dict[str, Any]) -> AudioPayload:
+    # base64 ausente em leituras resumidas (projeção sem os bytes do áudio)
+    return AudioPayload(data.get('base64', ''), data['contentType'], data['durationSec'], data['sizeBytes'])
+
+def _decode_transcript(data: Dict[str, Any]) -> TranscriptPayload:
+    words = data.get('words')
+    return TranscriptPayload(
+        data['text'],
+        [WordTiming(word['start'], word['end'], word['word']) for word in words] if words else None,
+        data.get('languageCode'),
+        data.get('confidence')
+    )
+
+def _decode_improvement(data: Dict[str, Any]) -> ImprovementPayload:
+    return ImprovementPayload(data['texto_melhorado'], data['topicos'], data['insights'], data['resumo'])
+
+def _decode_note(data: Dict[str, Any]) -> NotePayload:
+    return NotePayload(data['text'])
+
+_EMPTY_PAYLOAD: Dict[str, Any] = {}
+
+def decode_message(data: Dict[str, Any], doc_id: Optional[str] = None) -> Message:
+    """
+    Converter documento do Firestore para Message em uma única passada
+    
+    Equivalente a message_from_dict, mas normaliza createdAt e resolve os
+    enums por tabela. doc_id, quando informado, substitui data['id'].
+    """
+    payload_data = data.get('payload') or _EMPTY_PAYLOAD
+    if payload_data:
+        audio = payload_data.get('audio')
+        transcript = payload_data.get('transcript')
+        improvement = payload_data.get('improvement')
+        note = payload_data.get('note')
+        payload = MessagePayload(
+            _decode_audio(audio) if audio else None,
+            _decode_transcript(transcript) if transcript else None,
+            _decode_improvement(improvement) if improvement else None,
+            _decode_note(note) if note else None
+        )
+    else:
+        payload = MessagePayload()
+        
+    status = data.get('status')
+    return Message(
+        doc_id if doc_id is not None else data['id'],
+        data['threadId'],
+        data['ownerId'],
+        _MESSAGE_KINDS[data['kind']],
+        _MESSAGE_SOURCES[data['source']],
+        timestamp_to_ms(data['createdAt']),
+        payload,
+        _MESSAGE_STATUSES[status] if status else None,
+        data.get('error')
+    )
+
+def decode_thread_summary(data: Dict[str, Any]) -> ThreadSummary:
+    """Converter resumo (ou shard de atividade) do Firestore para ThreadSummary"""
+    # Campos ausentes quando o resumo foi criado só por incrementos
+    kind = data.get('lastKind')
+    status = data.get('lastStatus')
+    last_message_at = data.get('lastMessageAt')
+    return ThreadSummary(
+        data.get('messageCount', 0),
+        data.get('audioSeconds', 0),
+        data.get('lastMessageId'),
+        _MESSAGE_KINDS[kind] if kind else None,
+        _MESSAGE_STATUSES[status] if status else None,
+        data.get('lastPreview') or '',
+        timestamp_to_ms(last_message_at) if last_message_at is not None else None
+    )
+
+def decode_thread(data: Dict[str, Any], doc_id: Optional[str] = None) -> Thread:
+    """Converter documento do Firestore para Thread normalizando os timestamps"""
+    summary = data.get('summary')
+    return Thread(
+        doc_id if doc_id is not None else data['id'],
+        data['ownerId'],
+        data['title'],
+        timestamp_to_ms(data['createdAt']),
+        timestamp_to_ms(data['updatedAt']),
+        decode_thread_summary(summary) if summary else None
     )
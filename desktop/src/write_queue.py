@@ -0,0 +1,268 @@
+"""
+Fila de escrita durável (write-behind) para Totari Desktop
+As escritas são registradas em ~/.totari/ e enviadas ao Firestore em
+segundo plano, em lotes, com backoff exponencial em caso de falha
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+
+from google.api_core import exceptions as api_exceptions
+
+from .types import Message, MessageStatus, message_to_dict
+from .firestore import MAX_BATCH_MESSAGES, new_document_id
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    op TEXT NOT NULL,
+    message_id TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+"""
+
+# Erros que não se resolvem com nova tentativa
+PERMANENT_ERRORS = (
+    api_exceptions.NotFound,
+    api_exceptions.InvalidArgument,
+    api_exceptions.PermissionDenied,
+    api_exceptions.FailedPrecondition,
+)
+
+# Registros do journal que não podem ser enviados (dados corrompidos ou de outra versão)
+INVALID_OP_ERRORS = (KeyError, ValueError)
+
+class QueuedWriteBatch:
+    """Lote de atualizações registrado na fila em uma única transação local"""
+    
+    def __init__(self, queue: 'WriteQueue'):
+        self.queue = queue
+        self._ops: List[Tuple[str, str, Dict[str, Any]]] = []
+    
+    def update_status(self, message_id: str, status: MessageStatus, error: Optional[str] = None,
+                      thread_id: Optional[str] = None) -> 'QueuedWriteBatch':
+        """Agendar atualização de status"""
+        self._ops.append(('status', message_id, {'status': status.value, 'error': error, 'threadId': thread_id}))
+        return self
+    
+    def update_payload(self, message_id: str, payload_updates: Dict[str, Any],
+                       thread_id: Optional[str] = None) -> 'QueuedWriteBatch':
+        """Agendar atualização de campos do payload"""
+        self._ops.append(('payload', message_id, {'payload': payload_updates, 'threadId': thread_id}))
+        return self
+    
+    def __len__(self) -> int:
+        return len(self._ops)
+    
+    def flush(self) -> None:
+        """Registrar as operações na fila"""
+        ops, self._ops = self._ops, []
+        self.queue._enqueue(ops)
+    
+    def __enter__(self) -> 'QueuedWriteBatch':
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        # Só registrar se o bloco terminou sem erro
+        if exc_type is None:
+            self.flush()
+
+class WriteQueue:
+    """
+    Fila de escrita persistente com a mesma interface de escrita do FirestoreManager
+    
+    save_message, update_message_status, update_message_payload e batch()
+    retornam imediatamente após registrar a operação no journal local; um
+    worker envia as operações pendentes em ordem, em lotes de até
+    MAX_BATCH_MESSAGES (um commit cada, incluindo o resumo das threads), repetindo com backoff exponencial enquanto houver
+    falhas de rede. Operações pendentes são retomadas ao reiniciar o app.
+    """
+    
+    def __init__(self, firestore_manager, db_path: Optional[str] = None,
+                 base_delay: float = 1.0, max_delay: float = 300.0):
+        self.firestore_manager = firestore_manager
+        self.db_path = db_path or os.path.expanduser("~/.totari/outbox.db")
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._idle = threading.Condition(self._lock)
+        self._stopped = False
+        self._worker: Optional[threading.Thread] = None
+        
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+    
+    # Interface de escrita (igual ao FirestoreManager)
+    def save_message(self, message: Message) -> str:
+        """Registrar criação de mensagem e retornar seu ID (gerado localmente)"""
+        message_dict = message_to_dict(message)
+        message_id = message_dict.pop('id') or new_document_id()
+        self._enqueue([('set', message_id, message_dict)])
+        return message_id
+    
+    def update_message_status(self, message_id: str, status: MessageStatus, error: Optional[str] = None,
+                              thread_id: Optional[str] = None) -> None:
+        """Registrar atualização de status"""
+        self.batch().update_status(message_id, status, error, thread_id=thread_id).flush()
+    
+    def update_message_payload(self, message_id: str, payload_updates: Dict[str, Any],
+                               thread_id: Optional[str] = None) -> None:
+        """Registrar atualização de campos do payload"""
+        self.batch().update_payload(message_id, payload_updates, thread_id=thread_id).flush()
+    
+    def batch(self) -> QueuedWriteBatch:
+        """Criar lote de atualizações registrado atomicamente na fila"""
+        return QueuedWriteBatch(self)
+    
+    def _enqueue(self, ops: List[Tuple[str, str, Dict[str, Any]]]) -> None:
+        if not ops:
+            return
+        rows = [(op, message_id, json.dumps(data)) for op, message_id, data in ops]
+        with self._lock, self.conn:
+            self.conn.executemany("INSERT INTO outbox (op, message_id, data) VALUES (?, ?, ?)", rows)
+        self._wake.set()
+    
+    def pending_count(self) -> int:
+        """Quantidade de operações ainda não enviadas"""
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+    
+    # Worker
+    def start(self) -> None:
+        """Iniciar envio em segundo plano (inclui operações de execuções anteriores)"""
+        if self._worker is not None:
+            return
+        self._stopped = False
+        self._worker = threading.Thread(target=self._run, name='write-queue', daemon=True)
+        self._worker.start()
+        self._wake.set()
+    
+    def stop(self, timeout: float = 5.0) -> None:
+        """Parar o worker; operações pendentes permanecem no journal"""
+        self._stopped = True
+        self._wake.set()
+        if self._worker is not None:
+            self._worker.join(timeout=timeout)
+            self._worker = None
+    
+    def wait_until_empty(self, timeout: Optional[float] = None) -> bool:
+        """Aguardar até que todas as operações tenham sido enviadas"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._idle:
+            while self.conn.execute("SELECT 1 FROM outbox LIMIT 1").fetchone() is not None:
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+    
+    def _run(self) -> None:
+        delay = 0.0
+        while not self._stopped:
+            if delay:
+                self._backoff(delay)
+            else:
+                self._wake.wait()
+            self._wake.clear()
+            if self._stopped:
+                break
+            
+            try:
+                while self._send_next_batch():
+                    pass
+                delay = 0.0
+            except Exception as e:
+                delay = min(self.max_delay, delay * 2 if delay else self.base_delay)
+                logger.warning(f"Falha ao enviar fila de escrita, nova tentativa em {delay:.1f}s: {e}")
+    
+    def _backoff(self, delay: float) -> None:
+        """Aguardar delay segundos; escritas novas não encurtam a espera, só stop()"""
+        deadline = time.monotonic() + delay
+        while not self._stopped:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._wake.wait(remaining)
+            self._wake.clear()
+    
+    def _load_batch(self) -> List[Tuple[int, str, str, Dict[str, Any]]]:
+        while True:
+            with self._lock:
+                rows = self.conn.execute(
+                    "SELECT seq, op, message_id, data FROM outbox ORDER BY seq LIMIT ?",
+                    (MAX_BATCH_MESSAGES,)
+                ).fetchall()
+            
+            ops, invalid = [], []
+            for seq, op, message_id, data in rows:
+                try:
+                    ops.append((seq, op, message_id, json.loads(data)))
+                except INVALID_OP_ERRORS as e:
+                    logger.error(f"Operação descartada (registro {seq} ilegível): {e}")
+                    invalid.append((seq, op, message_id, {}))
+            
+            # Registros ilegíveis não bloqueiam a fila
+            if invalid:
+                self._remove(invalid)
+            if ops or not rows:
+                return ops
+    
+    def _send_next_batch(self) -> bool:
+        """Enviar o próximo lote; retorna False quando a fila está vazia"""
+        ops = self._load_batch()
+        if not ops:
+            return False
+        
+        try:
+            self._commit(ops)
+        except PERMANENT_ERRORS + INVALID_OP_ERRORS as e:
+            # Isolar a operação inválida para não bloquear a fila
+            logger.error(f"Lote rejeitado, enviando operações individualmente: {e}")
+            for op in ops:
+                try:
+                    self._commit([op])
+                except PERMANENT_ERRORS + INVALID_OP_ERRORS as op_error:
+                    logger.error(f"Operação descartada ({op[1]} {op[2]}): {op_error}")
+                # Remover já: uma falha transitória numa operação seguinte não reenvia as aplicadas
+                self._remove([op])
+        else:
+            self._remove(ops)
+        
+        logger.info(f"Fila de escrita: {len(ops)} operações enviadas")
+        return True
+    
+    def _remove(self, ops: List[Tuple[int, str, str, Dict[str, Any]]]) -> None:
+        """Retirar do journal operações já enviadas (ou descartadas)"""
+        with self._idle, self.conn:
+            self.conn.executemany("DELETE FROM outbox WHERE seq = ?", [(op[0],) for op in ops])
+            self._idle.notify_all()
+    
+    def _commit(self, ops: List[Tuple[int, str, str, Dict[str, Any]]]) -> None:
+        # Reenviar pelo lote do FirestoreManager, que grava também o resumo das threads
+        batch = self.firestore_manager.batch()
+        
+        for _, op, message_id, data in ops:
+            if op == 'set':
+                batch.create(message_id, data)
+            elif op == 'status':
+                batch.update_status(message_id, MessageStatus(data['status']), data.get('error'),
+                                    thread_id=data.get('threadId'))
+            elif op == 'payload':
+                # Registros antigos (sem threadId) guardam o payload direto em data
+                if 'threadId' in data:
+                    batch.update_payload(message_id, data['payload'], thread_id=data['threadId'])
+                else:
+                    batch.update_payload(message_id, data)
+        
+        batch.commit()